@@ -1,11 +1,22 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
-import joblib
 import pandas as pd
 import requests
 import os
+import time
 from dotenv import load_dotenv
-from price_prediction_service import PricePredictionService
+from price_prediction_service import PricePredictionService, parse_horizons
+from crop_ranking import FEATURES
+from prediction_cache import make_prediction_cache, quantize_features, cached_top_k, cached_probabilities, CACHE_STEPS
+from batch_prediction import is_ndjson, iter_ndjson_rows, iter_json_array_rows, iter_batch_results
+from upstream_clients import lookup_soil, soil_cache
+from chat_proxy import ChatProxy, ChatBusy
+from translation_service import TranslationService, TranslationError, MAX_BATCH_TEXTS, resolve_pair
+from model_registry import ModelRegistry
+from crop_recommendation import recommend, parse_features, parse_ranking_options, RECOMMEND_SCORES, RECOMMEND_SCORE, RECOMMEND_MIN_PROBABILITY
+from process_memory import memory_usage, install_flask_memory_routes
+from metrics import metrics
+from sampling_profiler import Profiler, install_flask_profiling
 
 # Load environment variables
 load_dotenv()
@@ -22,24 +33,69 @@ CORS(
     resources={
         r"/predict": {"origins": cors_origins + ["*"]},
         r"/predict-top3": {"origins": cors_origins + ["*"]},
+        r"/predict-batch": {"origins": cors_origins + ["*"]},
         r"/predict-prices": {"origins": cors_origins + ["*"]},
+        r"/recommend": {"origins": cors_origins + ["*"]},
         r"/chat": {"origins": cors_origins + ["*"]},
         r"/translate": {"origins": cors_origins + ["*"]},
+        r"/soil": {"origins": cors_origins + ["*"]},
     },
     supports_credentials=False,
 )
 
 # 2. Load the trained model and the label encoder
 print("Loading model and encoder...")
-model = joblib.load('crop_model.pkl')
-label_encoder = joblib.load('label_encoder.pkl')
-print("Model and encoder loaded successfully.")
+# The newest version under MODEL_DIR (or the bundled pickles), warmed up before
+# serving. Routes call model_registry.current() so newly published versions
+# are swapped in without a restart. Each version's crop ranker shares
+# predict_proba calls between concurrent /predict and /predict-top3 requests.
+model_registry = ModelRegistry()
+print(f"Model and encoder loaded successfully (version {model_registry.load_initial().version}).")
+
+# Response cache for /predict and /predict-top3, keyed on quantized features.
+# Cleared whenever the model or encoder is reloaded.
+prediction_cache = make_prediction_cache()
+
+# Streaming chat relay, capped at CHAT_MAX_STREAMS open conversations per worker
+chat_proxy = ChatProxy()
+
+# Phrase-cached translation, shared by /translate and its batch form
+translation_service = TranslationService()
 
 # 2b. Load the price prediction service
 print("Loading price prediction service...")
-price_service = PricePredictionService()
+price_service = PricePredictionService(model_registry.active.price_model, model_registry.active.version)
+# New versions get their price state before they are published, so one swap changes both
+price_service.follow(model_registry)
 print("Price prediction service loaded successfully.")
 
+
+def use_model_version(bundle, previous):
+    prediction_cache.clear()
+
+
+model_registry.on_swap(use_model_version)
+
+
+def read_json():
+    """request.get_json(), timed as the json_parse stage"""
+    with metrics.time('json_parse'):
+        return request.get_json()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed responses are timed to their first byte
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe('request', route, time.perf_counter() - g.request_start)
+    metrics.count('response', (route, str(response.status_code)))
+    return response
+
 # 3. Define the prediction endpoint
 @app.route('/predict', methods=['POST', 'OPTIONS'])
 def predict():
@@ -53,23 +109,29 @@ def predict():
         return response, 200
 
     # Get the JSON data sent from the React frontend
-    data = request.get_json()
+    data = read_json()
     if not isinstance(data, dict):
         return jsonify({'error': 'Invalid JSON body'}), 400
     
-    # Create a pandas DataFrame from the received data
-    # The order of columns MUST match the order used during training
-    features = ['N',  'temperature', 'humidity', 'ph','rainfall']
-    input_df = pd.DataFrame([data], columns=features)
-    
-    # Make a prediction
-    prediction_encoded = model.predict(input_df)
+    # Nearby feature vectors share a cached answer, per model version
+    bundle = model_registry.current()
+    quantized = quantize_features(data, CACHE_STEPS)
+    cache_key = ('predict', bundle.version, quantized) if quantized is not None else None
+    predicted_crop = prediction_cache.get(cache_key) if cache_key else None
     
-    # Inverse transform the prediction to get the crop name
-    predicted_crop = label_encoder.inverse_transform(prediction_encoded)
+    if predicted_crop is None:
+        # Create a pandas DataFrame from the received data
+        # The order of columns MUST match the order used during training
+        with metrics.time('feature_frame'):
+            input_df = pd.DataFrame([data], columns=FEATURES)
+        
+        # Make a prediction and decode it to the crop name
+        predicted_crop = bundle.crop_ranker.predict(input_df)[0]
+        if cache_key:
+            prediction_cache.set(cache_key, predicted_crop)
     
     # Return the result as JSON
-    response = jsonify({'predicted_crop': predicted_crop[0]})
+    response = jsonify({'predicted_crop': predicted_crop})
     response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
     response.headers.add('Vary', 'Origin')
     return response
@@ -85,39 +147,24 @@ def predict_top3():
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response, 200
 
-    data = request.get_json()
-    if not isinstance(data, dict):
+    data = read_json()
+    # A single feature dict, or a list of them to rank in one model call
+    if isinstance(data, dict):
+        rows = [data]
+    elif isinstance(data, list) and data and all(isinstance(row, dict) for row in data):
+        rows = data
+    else:
         return jsonify({'error': 'Invalid JSON body'}), 400
 
-    features = ['N', 'temperature', 'humidity', 'ph', 'rainfall']
-    input_df = pd.DataFrame([data], columns=features)
+    # Number of crops to return, from ?k= or the body (defaults to 3)
+    k = request.args.get('k', data.get('k', 3) if isinstance(data, dict) else 3)
+    try:
+        k = int(k)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'k must be an integer'}), 400
 
-    if not hasattr(model, 'predict_proba'):
-        # Fallback to single prediction if probabilities are unavailable
-        prediction_encoded = model.predict(input_df)
-        crop = label_encoder.inverse_transform(prediction_encoded)[0]
-        payload = [{"name": crop, "score": 1.0}]
-    else:
-        proba = model.predict_proba(input_df)[0]
-        # Get top 3 indices
-        top_indices = sorted(range(len(proba)), key=lambda i: proba[i], reverse=True)[:3]
-        classes = getattr(model, 'classes_', None)
-        if classes is None:
-            # Try to infer from label_encoder
-            class_labels = list(range(len(proba)))
-        else:
-            class_labels = classes
-        # Map indices to crop names through label_encoder if needed
-        names = []
-        for idx in top_indices:
-            label = class_labels[idx]
-            # If labels are encoded, decode; else assume already crop names
-            try:
-                name = label_encoder.inverse_transform([label])[0]
-            except Exception:
-                name = str(label)
-            names.append({"name": name, "score": float(proba[idx])})
-        payload = names
+    rankings = cached_top_k(prediction_cache, model_registry.current().crop_ranker, rows, k)
+    payload = rankings[0] if isinstance(data, dict) else rankings
 
     response = jsonify({"top3": payload})
     response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
@@ -135,7 +182,7 @@ def predict_prices():
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response, 200
 
-    data = request.get_json()
+    data = read_json()
     if not isinstance(data, dict):
         return jsonify({'error': 'Invalid JSON body'}), 400
 
@@ -146,14 +193,21 @@ def predict_prices():
     if not crops or not lat or not lon:
         return jsonify({'error': 'Missing required fields: crops, latitude, longitude'}), 400
 
+    # With "horizons" (days ahead, e.g. [30, 60, 90, 120, 180], or null for those
+    # defaults), a forecast series per crop instead of the 90-day forecast
+    if 'horizons' in data:
+        try:
+            horizons = parse_horizons(data['horizons'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
     try:
-        price_predictions = []
-        for crop in crops:
-            prediction = price_service.predict_price(crop, lat, lon)
-            if prediction:
-                price_predictions.append(prediction)
+        if 'horizons' in data:
+            result = {"price_forecasts": price_service.predict_price_series(crops, lat, lon, horizons)}
+        else:
+            result = {"price_predictions": price_service.predict_prices(crops, lat, lon)}
 
-        response = jsonify({"price_predictions": price_predictions})
+        response = jsonify(result)
         response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
         response.headers.add('Vary', 'Origin')
         return response
@@ -172,7 +226,7 @@ def chat():
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response, 200
 
-    data = request.get_json()
+    data = read_json()
     if not isinstance(data, dict):
         return jsonify({'error': 'Invalid JSON body'}), 400
 
@@ -181,34 +235,23 @@ def chat():
         return jsonify({'error': 'Missing prompt'}), 400
 
     try:
-        # Forward the request to your Cloudflare tunnel
-        cloudflare_url = "https://mon-yarn-avoiding-then.trycloudflare.com/chat"
-        api_key = "supersecret"
-        
-        headers = {
-            "Content-Type": "application/json",
-            "x-api-key": api_key
-        }
-        
-        payload = {
-            "prompt": prompt
-        }
-        
-        # Make the request to Cloudflare tunnel
-        response = requests.post(cloudflare_url, headers=headers, json=payload, stream=True)
-        response.raise_for_status()
-        
-        # Create a streaming response
-        def generate():
-            for line in response.iter_lines():
-                if line:
-                    yield line + b'\n'
-        
-        from flask import Response
-        return Response(generate(), mimetype='text/plain')
-        
+        # Forward the request to the chat model server; raw chunks are relayed as they arrive.
+        # The client's socket lets the relay stop as soon as the client goes away
+        client_socket = request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+        stream, content_type = chat_proxy.open(prompt, client_socket)
+    except ChatBusy as e:
+        response = jsonify({'error': f'Chat is busy, please retry shortly ({str(e)})'})
+        response.headers.add('Retry-After', '5')
+        return response, 503
     except Exception as e:
-        return jsonify({'error': f'Chat request failed: {str(e)}'}), 500
+        return jsonify({'error': f'Chat request failed: {str(e)}'}), 502
+
+    response = Response(stream, mimetype=content_type)
+    response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
+    response.headers.add('Vary', 'Origin')
+    # Stop proxies in front of the app from buffering the stream
+    response.headers.add('X-Accel-Buffering', 'no')
+    return response
 
 # 3e. Translation proxy endpoint
 @app.route('/translate', methods=['POST', 'OPTIONS'])
@@ -221,46 +264,213 @@ def translate():
         response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response, 200
 
-    data = request.get_json()
+    data = read_json()
     if not isinstance(data, dict):
         return jsonify({'error': 'Invalid JSON body'}), 400
 
+    texts = data.get('texts')
     text = data.get('text', '')
     source = data.get('source', 'auto')
     target = data.get('target', 'hi')
 
-    if not text:
+    if texts is not None:
+        if not isinstance(texts, list) or not all(isinstance(item, str) for item in texts):
+            return jsonify({'error': 'texts must be a list of strings'}), 400
+        if len(texts) > MAX_BATCH_TEXTS:
+            return jsonify({'error': f'Too many texts (max {MAX_BATCH_TEXTS})'}), 400
+    elif not text:
         return jsonify({'error': 'Missing text to translate'}), 400
 
     try:
-        # Only support English to Hindi and Hindi to English
-        if not ((source == 'en' and target == 'hi') or (source == 'hi' and target == 'en') or (source == 'auto' and target == 'hi')):
-            return jsonify({'error': f'Translation not supported: {source} to {target}. Only en↔hi supported.'}), 400
-
-        # Call MyMemory API
-        mymemory_url = "https://api.mymemory.translated.net/get"
-        params = {
-            'q': text,
-            'langpair': f'{source if source != "auto" else "en"}|{target}'
-        }
-        
-        response = requests.get(mymemory_url, params=params)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if data.get('responseStatus') == 200:
-            translated_text = data.get('responseData', {}).get('translatedText', text)
-            result = jsonify({'translatedText': translated_text})
-            result.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
-            result.headers.add('Vary', 'Origin')
-            return result
+        if texts is not None:
+            # Only cache misses go upstream; entries that failed come back untranslated
+            translated = translation_service.translate_many(texts, source, target)
+            failed = [i for i, value in enumerate(translated) if value is None]
+            result = jsonify({
+                'translations': [original if value is None else value for original, value in zip(texts, translated)],
+                'failed': failed,
+            })
         else:
-            return jsonify({'error': 'Translation failed'}), 500
-            
+            result = jsonify({'translatedText': translation_service.translate(text, source, target)})
+        result.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
+        result.headers.add('Vary', 'Origin')
+        return result
+
+    except TranslationError as e:
+        if resolve_pair(source, target) is None:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'error': 'Translation failed'}), 500
     except Exception as e:
         return jsonify({'error': f'Translation request failed: {str(e)}'}), 500
 
+# 3f. Bulk scoring endpoint: JSON array or NDJSON rows in, NDJSON results out
+@app.route('/predict-batch', methods=['POST', 'OPTIONS'])
+def predict_batch():
+    if request.method == 'OPTIONS':
+        response = jsonify({"ok": True})
+        response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
+        response.headers.add('Vary', 'Origin')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        return response, 200
+
+    # Rows are parsed lazily from the request stream and scored in chunks,
+    # so memory stays bounded however many rows are posted
+    if is_ndjson(request.content_type):
+        rows = iter_ndjson_rows(request.stream)
+    else:
+        rows = iter_json_array_rows(request.stream)
+
+    response = Response(
+        stream_with_context(iter_batch_results(model_registry.current().crop_ranker, rows)),
+        mimetype='application/x-ndjson'
+    )
+    response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
+    response.headers.add('Vary', 'Origin')
+    return response
+
+# 3g. Topsoil nitrogen and pH, served from the shared SoilGrids cache
+@app.route('/soil', methods=['POST', 'OPTIONS'])
+def soil():
+    if request.method == 'OPTIONS':
+        response = jsonify({"ok": True})
+        response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
+        response.headers.add('Vary', 'Origin')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        return response, 200
+
+    data = read_json()
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid JSON body'}), 400
+
+    try:
+        lat = float(data['latitude'])
+        lon = float(data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Missing required fields: latitude, longitude'}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({'error': 'Coordinates out of range'}), 400
+
+    try:
+        # Raw SoilGrids means: nitrogen in cg/kg, phh2o is pH x 10
+        nitrogen, phh2o, source = lookup_soil(lat, lon)
+    except Exception as e:
+        return jsonify({'error': f'Soil lookup failed: {str(e)}'}), 502
+
+    response = jsonify({'nitrogen': nitrogen, 'phh2o': phh2o, 'source': source})
+    response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
+    response.headers.add('Vary', 'Origin')
+    return response
+
+# 3h. Health and runtime statistics
+@app.route('/health', methods=['GET'])
+def health():
+    bundle = model_registry.current()
+    return jsonify({
+        'status': 'healthy',
+        'model_version': bundle.version,
+        'model_registry': model_registry.stats(),
+        'prediction_cache': prediction_cache.stats(),
+        'prediction_batcher': bundle.batcher.stats() if bundle.batcher else None,
+        'chat': chat_proxy.stats(),
+        'translation': translation_service.stats(),
+        # This worker's unique memory (uss_kb) is its real cost when forked from a preloading master
+        'memory': memory_usage(),
+    })
+
+# 3i. Prometheus metrics: per-stage latency histograms, error and fallback counters
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# 3j. On-demand sampling profiler (needs PROFILE_TOKEN): the X-Profile request
+# header and the /profile routes, returning collapsed stacks for flamegraphs
+profiler = Profiler()
+install_flask_profiling(app, profiler)
+
+# 3k. Memory report (needs PROFILE_TOKEN, sent as X-Profile-Token): retained
+# size of each component below, per-column sizes of the price history, and
+# tracemalloc snapshots and diffs for tracking growth over a worker's life
+def memory_components():
+    bundle = model_registry.active
+    return {
+        'crop_model': bundle.model,
+        'label_encoder': bundle.label_encoder,
+        'price_model': price_service.price_model,
+        'price_history': price_service.price_columns,
+        'price_index': price_service.price_index,
+        'district_grid': price_service.district_grid,
+        'forecast_table': price_service.forecast_table,
+        'prediction_cache': prediction_cache,
+        'translation_cache': translation_service.cache,
+        'soil_cache': soil_cache,
+        'metrics': metrics,
+        'flask_app': app,
+    }
+
+
+def memory_tables():
+    return {'price_history': price_service.price_columns}
+
+
+install_flask_memory_routes(
+    app, memory_components, memory_tables,
+    authorized=lambda: profiler.authorized(request.headers.get('X-Profile-Token')),
+)
+
+# 3l. Recommendation plus market outlook in one call: every crop's probability
+# from one predict_proba pass, joined with batched 90-day price forecasts and
+# ranked by a configurable score (probability x forecast price by default)
+@app.route('/recommend', methods=['POST', 'OPTIONS'])
+def recommend_crops():
+    if request.method == 'OPTIONS':
+        response = jsonify({"ok": True})
+        response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
+        response.headers.add('Vary', 'Origin')
+        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
+        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        return response, 200
+
+    data = read_json()
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid JSON body'}), 400
+
+    try:
+        features = parse_features(data)
+        lat = float(data['latitude'])
+        lon = float(data['longitude'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except (KeyError, TypeError):
+        return jsonify({'error': 'Missing required fields: latitude, longitude'}), 400
+
+    # Ranking options, from the query string or the body
+    score = request.args.get('score', data.get('score', RECOMMEND_SCORE))
+    if score not in RECOMMEND_SCORES:
+        return jsonify({'error': f"score must be one of: {', '.join(RECOMMEND_SCORES)}"}), 400
+    try:
+        k, min_probability = parse_ranking_options(
+            request.args.get('k', data.get('k', 0)),
+            request.args.get('min_probability', data.get('min_probability', RECOMMEND_MIN_PROBABILITY)),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        ranker = model_registry.current().crop_ranker
+        recommendations = recommend(
+            ranker, price_service, features, lat, lon, score=score, k=k, min_probability=min_probability,
+            proba=cached_probabilities(prediction_cache, ranker, features),
+        )
+    except Exception as e:
+        return jsonify({'error': f'Recommendation failed: {str(e)}'}), 500
+
+    response = jsonify({'recommendations': recommendations, 'score': score})
+    response.headers.add('Access-Control-Allow-Origin', request.headers.get('Origin', '*'))
+    response.headers.add('Vary', 'Origin')
+    return response
+
 # 4. Run the app
 if __name__ == '__main__':
     # Get configuration from environment variables
@@ -1,11 +1,18 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
-import joblib
 import pandas as pd
 import requests
 import os
+import time
 from dotenv import load_dotenv
-from price_prediction_service import PricePredictionService
+from price_prediction_service import PricePredictionService, parse_horizons
+from crop_ranking import FEATURES
+from prediction_cache import make_prediction_cache, quantize_features, cached_top_k, cached_probabilities, CACHE_STEPS
+from model_registry import ModelRegistry
+from crop_recommendation import recommend, parse_features, parse_ranking_options, RECOMMEND_SCORES, RECOMMEND_SCORE, RECOMMEND_MIN_PROBABILITY
+from process_memory import memory_usage, install_flask_memory_routes
+from metrics import metrics
+from sampling_profiler import Profiler, install_flask_profiling
 
 # Load environment variables
 load_dotenv()
@@ -23,6 +30,7 @@ CORS(
         r"/predict": {"origins": cors_origins + ["*"]},
         r"/predict-top3": {"origins": cors_origins + ["*"]},
         r"/predict-prices": {"origins": cors_origins + ["*"]},
+        r"/recommend": {"origins": cors_origins + ["*"]},
         r"/chat": {"origins": cors_origins + ["*"]},
         r"/translate": {"origins": cors_origins + ["*"]},
     },
@@ -31,29 +39,67 @@ CORS(
 
 # 2. Load the trained model and the label encoder
 print("Loading model and encoder...")
+# The newest version under MODEL_DIR (or the bundled pickles), warmed up before
+# serving; newly published versions are swapped in without a restart
+model_registry = ModelRegistry()
 try:
-    model = joblib.load('crop_model.pkl')
-    label_encoder = joblib.load('label_encoder.pkl')
-    print("Model and encoder loaded successfully.")
+    model_registry.load_initial()
+    print(f"Model and encoder loaded successfully (version {model_registry.active.version}).")
 except Exception as e:
     print(f"Error loading model: {e}")
-    model = None
-    label_encoder = None
+
+# Response cache for /predict and /predict-top3, keyed on quantized features.
+# Cleared whenever the model or encoder is reloaded.
+prediction_cache = make_prediction_cache()
 
 # 2b. Load the price prediction service
 print("Loading price prediction service...")
 try:
-    price_service = PricePredictionService()
+    if model_registry.active is not None:
+        price_service = PricePredictionService(model_registry.active.price_model, model_registry.active.version)
+        price_service.follow(model_registry)
+    else:
+        price_service = PricePredictionService()
     print("Price prediction service loaded successfully.")
 except Exception as e:
     print(f"Error loading price service: {e}")
     price_service = None
 
+
+def use_model_version(bundle, previous):
+    prediction_cache.clear()
+    if price_service is not None and price_service.registry is None:
+        # No version loaded at startup: follow the registry from its first one
+        price_service.follow(model_registry)
+
+
+model_registry.on_swap(use_model_version)
+
+
+def read_json():
+    """request.get_json(), timed as the json_parse stage"""
+    with metrics.time('json_parse'):
+        return request.get_json()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed responses are timed to their first byte
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe('request', route, time.perf_counter() - g.request_start)
+    metrics.count('response', (route, str(response.status_code)))
+    return response
+
 # 3. Define the prediction endpoint
 @app.route('/predict', methods=['POST'])
 def predict():
     try:
-        data = request.get_json()
+        data = read_json()
         
         if not data:
             return jsonify({'error': 'No data provided'}), 400
@@ -65,13 +111,22 @@ def predict():
         humidity = float(data.get('humidity', 0))
         rainfall = float(data.get('rainfall', 0))
         
-        if model is None or label_encoder is None:
+        bundle = model_registry.current()
+        if bundle is None:
             return jsonify({'error': 'Model not loaded'}), 500
         
-        # Make prediction
-        features = [[N, ph, temperature, humidity, rainfall]]
-        prediction = model.predict(features)
-        predicted_crop = label_encoder.inverse_transform(prediction)[0]
+        # Nearby feature vectors share a cached answer, per model version
+        quantized = quantize_features([N, temperature, humidity, ph, rainfall], CACHE_STEPS)
+        cache_key = ('predict', bundle.version, quantized) if quantized is not None else None
+        predicted_crop = prediction_cache.get(cache_key) if cache_key else None
+        
+        if predicted_crop is None:
+            # Make prediction (column order must match training)
+            with metrics.time('feature_frame'):
+                features = pd.DataFrame([[N, temperature, humidity, ph, rainfall]], columns=FEATURES)
+            predicted_crop = bundle.crop_ranker.predict(features)[0]
+            if cache_key:
+                prediction_cache.set(cache_key, predicted_crop)
         
         return jsonify({'predicted_crop': predicted_crop})
         
@@ -81,7 +136,7 @@ def predict():
 @app.route('/predict-top3', methods=['POST'])
 def predict_top3():
     try:
-        data = request.get_json()
+        data = read_json()
         
         if not data:
             return jsonify({'error': 'No data provided'}), 400
@@ -93,21 +148,14 @@ def predict_top3():
         humidity = float(data.get('humidity', 0))
         rainfall = float(data.get('rainfall', 0))
         
-        if model is None or label_encoder is None:
+        bundle = model_registry.current()
+        if bundle is None:
             return jsonify({'error': 'Model not loaded'}), 500
         
-        # Make prediction
-        features = [[N, ph, temperature, humidity, rainfall]]
-        prediction = model.predict(features)
-        predicted_crop = label_encoder.inverse_transform(prediction)[0]
-        
-        # For top 3, we'll return the same crop 3 times with different scores
-        # In a real implementation, you'd use predict_proba to get probabilities
-        top3 = [
-            {'name': predicted_crop, 'score': 0.95},
-            {'name': 'Rice', 'score': 0.85},
-            {'name': 'Maize', 'score': 0.75}
-        ]
+        # Rank crops by predicted probability
+        k = int(data.get('k', 3))
+        features = {'N': N, 'temperature': temperature, 'humidity': humidity, 'ph': ph, 'rainfall': rainfall}
+        top3 = cached_top_k(prediction_cache, bundle.crop_ranker, [features], k)[0]
         
         return jsonify({'top3': top3})
         
@@ -117,7 +165,7 @@ def predict_top3():
 @app.route('/predict-prices', methods=['POST'])
 def predict_prices():
     try:
-        data = request.get_json()
+        data = read_json()
         
         if not data:
             return jsonify({'error': 'No data provided'}), 400
@@ -129,6 +177,14 @@ def predict_prices():
         if price_service is None:
             return jsonify({'error': 'Price service not loaded'}), 500
         
+        # A forecast series per crop when "horizons" (days ahead) is given
+        if 'horizons' in data:
+            try:
+                horizons = parse_horizons(data['horizons'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return jsonify({'price_forecasts': price_service.predict_price_series(crop_names, latitude, longitude, horizons)})
+        
         # Get price predictions
         price_predictions = price_service.predict_prices(crop_names, latitude, longitude)
         
@@ -137,10 +193,53 @@ def predict_prices():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/recommend', methods=['POST'])
+def recommend_crops():
+    # Crop probabilities and price forecasts in one call, ranked by score
+    try:
+        data = read_json()
+        
+        if not isinstance(data, dict):
+            return jsonify({'error': 'No data provided'}), 400
+        
+        try:
+            features = parse_features(data)
+            latitude = float(data['latitude'])
+            longitude = float(data['longitude'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except (KeyError, TypeError):
+            return jsonify({'error': 'Missing required fields: latitude, longitude'}), 400
+        
+        score = data.get('score', RECOMMEND_SCORE)
+        if score not in RECOMMEND_SCORES:
+            return jsonify({'error': f"score must be one of: {', '.join(RECOMMEND_SCORES)}"}), 400
+        try:
+            k, min_probability = parse_ranking_options(
+                data.get('k', 0), data.get('min_probability', RECOMMEND_MIN_PROBABILITY),
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        bundle = model_registry.current()
+        if bundle is None:
+            return jsonify({'error': 'Model not loaded'}), 500
+        
+        recommendations = recommend(
+            bundle.crop_ranker, price_service, features, latitude, longitude, score=score,
+            k=k, min_probability=min_probability,
+            proba=cached_probabilities(prediction_cache, bundle.crop_ranker, features),
+        )
+        
+        return jsonify({'recommendations': recommendations, 'score': score})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/chat', methods=['POST'])
 def chat():
     try:
-        data = request.get_json()
+        data = read_json()
         message = data.get('message', '')
         
         if not message:
@@ -157,7 +256,7 @@ def chat():
 @app.route('/translate', methods=['POST'])
 def translate():
     try:
-        data = request.get_json()
+        data = read_json()
         text = data.get('text', '')
         target_lang = data.get('target_lang', 'hi')
         
@@ -177,12 +276,55 @@ def translate():
 
 @app.route('/health', methods=['GET'])
 def health():
+    bundle = model_registry.current()
     return jsonify({
         'status': 'healthy',
-        'model_loaded': model is not None,
-        'price_service_loaded': price_service is not None
+        'model_loaded': bundle is not None,
+        'model_version': bundle.version if bundle else None,
+        'model_registry': model_registry.stats(),
+        'price_service_loaded': price_service is not None,
+        'prediction_cache': prediction_cache.stats(),
+        'prediction_batcher': bundle.batcher.stats() if bundle and bundle.batcher else None,
+        'memory': memory_usage()
     })
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Per-stage latency histograms, error and fallback counters of this worker
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# On-demand sampling profiler (needs PROFILE_TOKEN): the X-Profile request
+# header and the /profile routes, returning collapsed stacks for flamegraphs
+profiler = Profiler()
+install_flask_profiling(app, profiler)
+
+# Memory report (needs PROFILE_TOKEN, sent as X-Profile-Token): retained size
+# of each component and tracemalloc snapshots and diffs
+def memory_components():
+    bundle = model_registry.active
+    return {
+        'crop_model': bundle.model if bundle else None,
+        'label_encoder': bundle.label_encoder if bundle else None,
+        'price_model': price_service.price_model if price_service else None,
+        'price_history': price_service.price_columns if price_service else None,
+        'price_index': price_service.price_index if price_service else None,
+        'district_grid': price_service.district_grid if price_service else None,
+        'forecast_table': price_service.forecast_table if price_service else None,
+        'prediction_cache': prediction_cache,
+        'metrics': metrics,
+        'flask_app': app,
+    }
+
+
+def memory_tables():
+    return {'price_history': price_service.price_columns if price_service else None}
+
+
+install_flask_memory_routes(
+    app, memory_components, memory_tables,
+    authorized=lambda: profiler.authorized(request.headers.get('X-Profile-Token')),
+)
+
 # 4. Run the app
 if __name__ == '__main__':
     # Get configuration from environment variables
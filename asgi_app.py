@@ -0,0 +1,480 @@
+import asyncio
+import contextlib
+import json
+import os
+import httpx
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import ClientDisconnect
+from starlette.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from starlette.routing import Route
+from crop_ranking import FEATURES
+from prediction_cache import make_prediction_cache, quantize_features, CACHE_STEPS
+from batch_prediction import is_ndjson, JsonArrayParser, BATCH_CHUNK_SIZE
+from inference_pool import (
+    InferencePool, predict_crops, top_k, score_rows, recommend_crops, predict_price_series,
+    predict_prices as pool_predict_prices,
+)
+from price_prediction_service import parse_horizons
+from crop_recommendation import parse_features, parse_ranking_options, RECOMMEND_SCORES, RECOMMEND_SCORE, RECOMMEND_MIN_PROBABILITY
+from upstream_clients import lookup_soil_async, UPSTREAM_TIMEOUT
+from chat_proxy import AsyncChatProxy, ChatBusy, CHAT_TIMEOUT
+from metrics import metrics
+from translation_service import AsyncTranslationService, TranslationError, MAX_BATCH_TEXTS, resolve_pair
+
+# Async entry point with the same routes as app.py:
+#   uvicorn asgi_app:app --host 0.0.0.0 --port $PORT
+# Proxy routes (/chat, /translate, /soil) wait on the event loop, so a slow
+# upstream holds a coroutine rather than a thread; model inference runs in
+# the InferencePool processes.
+
+# Load environment variables
+load_dotenv()
+
+# Get CORS origins from environment variables
+cors_origins = os.getenv('CORS_ORIGINS', 'http://localhost:8080,http://127.0.0.1:8080').split(',')
+
+# Upstream connections kept open per process, shared by every proxy route
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv('UPSTREAM_MAX_CONNECTIONS', '512'))
+
+# Response cache for /predict and /predict-top3, kept in this process so hits skip the pool
+prediction_cache = make_prediction_cache()
+pool = InferencePool()
+# Cached answers from the previous model version must not be served
+pool.on_version_change(lambda version: prediction_cache.clear())
+# /predict-batch chunks scored at once per request: enough to keep every pool
+# process busy while the next chunk is read, without holding the whole body
+BATCH_MAX_IN_FLIGHT = int(os.getenv('BATCH_MAX_IN_FLIGHT') or pool.workers + 1)
+services = {}
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    print("Starting inference processes...")
+    pool.start()
+    print(f"Inference processes ready: {pool.pids} (model version {pool.model_version})")
+    client = httpx.AsyncClient(
+        timeout=httpx.Timeout(UPSTREAM_TIMEOUT[1], connect=UPSTREAM_TIMEOUT[0]),
+        limits=httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS, max_keepalive_connections=32),
+    )
+    # Chat streams wait longer between chunks than other upstream calls
+    chat_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(CHAT_TIMEOUT[1], connect=CHAT_TIMEOUT[0]),
+        limits=httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS, max_keepalive_connections=32),
+    )
+    services['client'] = client
+    services['chat'] = AsyncChatProxy(chat_client)
+    services['translation'] = AsyncTranslationService(client)
+    try:
+        yield
+    finally:
+        await client.aclose()
+        await chat_client.aclose()
+        pool.shutdown()
+
+
+async def read_json(request):
+    body = await request.body()
+    try:
+        with metrics.time('json_parse'):
+            return json.loads(body)
+    except ValueError:
+        return None
+
+
+class RelayResponse(StreamingResponse):
+    """StreamingResponse that always closes its chat stream, even on an early disconnect"""
+
+    def __init__(self, stream, **kwargs):
+        super().__init__(stream, **kwargs)
+        self.stream = stream
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.stream.aclose()
+
+
+class BodyStreamingResponse(RelayResponse):
+    """RelayResponse that leaves receive() to the endpoint, which is still reading the body
+
+    Before ASGI 2.4 (uvicorn reports 2.3), StreamingResponse reads receive()
+    to notice disconnects, which would take the body messages. A disconnect
+    shows up as ClientDisconnect from request.stream() instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        finally:
+            await self.stream.aclose()
+
+
+# 3. Define the prediction endpoint
+async def predict(request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return JSONResponse({'error': 'Invalid JSON body'}, status_code=400)
+
+    # Nearby feature vectors share a cached answer, per model version
+    quantized = quantize_features(data, CACHE_STEPS)
+    predicted_crop = prediction_cache.get(('predict', pool.model_version, quantized)) if quantized else None
+
+    if predicted_crop is None:
+        row = [data.get(feature) for feature in FEATURES]
+        try:
+            predicted_crop = (await pool.run(predict_crops, [row]))[0]
+        except (TypeError, ValueError) as e:
+            return JSONResponse({'error': f'Invalid features: {str(e)}'}, status_code=400)
+        if quantized:
+            # pool.model_version is now the version that produced this answer
+            prediction_cache.set(('predict', pool.model_version, quantized), predicted_crop)
+
+    return JSONResponse({'predicted_crop': predicted_crop})
+
+
+# 3b. Top-k predictions endpoint
+async def predict_top3(request):
+    data = await read_json(request)
+    # A single feature dict, or a list of them to rank in one model call
+    if isinstance(data, dict):
+        rows = [data]
+    elif isinstance(data, list) and data and all(isinstance(row, dict) for row in data):
+        rows = data
+    else:
+        return JSONResponse({'error': 'Invalid JSON body'}, status_code=400)
+
+    k = request.query_params.get('k', data.get('k', 3) if isinstance(data, dict) else 3)
+    try:
+        k = int(k)
+    except (TypeError, ValueError):
+        return JSONResponse({'error': 'k must be an integer'}, status_code=400)
+
+    # Same keys as prediction_cache.cached_top_k; only misses go to the pool
+    rankings = [None] * len(rows)
+    keys, misses, inputs = [], [], []
+    for i, row in enumerate(rows):
+        quantized = quantize_features(row, CACHE_STEPS)
+        keys.append(quantized)
+        cached = prediction_cache.get(('top', pool.model_version, k, quantized)) if quantized else None
+        if cached is not None:
+            rankings[i] = cached
+        else:
+            misses.append(i)
+            inputs.append([row.get(feature) for feature in FEATURES])
+
+    if misses:
+        try:
+            scored = await pool.run(top_k, inputs, k)
+        except (TypeError, ValueError) as e:
+            return JSONResponse({'error': f'Invalid features: {str(e)}'}, status_code=400)
+        for i, ranking in zip(misses, scored):
+            rankings[i] = ranking
+            if keys[i] is not None:
+                prediction_cache.set(('top', pool.model_version, k, keys[i]), ranking)
+
+    return JSONResponse({'top3': rankings[0] if isinstance(data, dict) else rankings})
+
+
+# 3c. Price prediction endpoint
+async def predict_prices(request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return JSONResponse({'error': 'Invalid JSON body'}, status_code=400)
+
+    crops = data.get('crops', [])
+    lat = data.get('latitude', 0)
+    lon = data.get('longitude', 0)
+
+    if not crops or not lat or not lon:
+        return JSONResponse({'error': 'Missing required fields: crops, latitude, longitude'}, status_code=400)
+
+    # With "horizons", a forecast series per crop instead of the 90-day forecast
+    if 'horizons' in data:
+        try:
+            horizons = parse_horizons(data['horizons'])
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+
+    try:
+        if 'horizons' in data:
+            return JSONResponse({'price_forecasts': await pool.run(predict_price_series, crops, lat, lon, horizons)})
+        price_predictions = await pool.run(pool_predict_prices, crops, lat, lon)
+        return JSONResponse({'price_predictions': price_predictions})
+    except Exception as e:
+        return JSONResponse({'error': f'Price prediction failed: {str(e)}'}, status_code=500)
+
+
+# 3d. Chatbot proxy endpoint
+async def chat(request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return JSONResponse({'error': 'Invalid JSON body'}, status_code=400)
+
+    prompt = data.get('prompt', '')
+    if not prompt:
+        return JSONResponse({'error': 'Missing prompt'}, status_code=400)
+
+    try:
+        stream, content_type = await services['chat'].open(prompt)
+    except ChatBusy as e:
+        return JSONResponse(
+            {'error': f'Chat is busy, please retry shortly ({str(e)})'},
+            status_code=503, headers={'Retry-After': '5'},
+        )
+    except Exception as e:
+        return JSONResponse({'error': f'Chat request failed: {str(e)}'}, status_code=502)
+
+    # Stop proxies in front of the app from buffering the stream
+    return RelayResponse(stream, media_type=content_type, headers={'X-Accel-Buffering': 'no'})
+
+
+# 3e. Translation proxy endpoint
+async def translate(request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return JSONResponse({'error': 'Invalid JSON body'}, status_code=400)
+
+    texts = data.get('texts')
+    text = data.get('text', '')
+    source = data.get('source', 'auto')
+    target = data.get('target', 'hi')
+
+    if texts is not None:
+        if not isinstance(texts, list) or not all(isinstance(item, str) for item in texts):
+            return JSONResponse({'error': 'texts must be a list of strings'}, status_code=400)
+        if len(texts) > MAX_BATCH_TEXTS:
+            return JSONResponse({'error': f'Too many texts (max {MAX_BATCH_TEXTS})'}, status_code=400)
+    elif not text:
+        return JSONResponse({'error': 'Missing text to translate'}, status_code=400)
+
+    translation = services['translation']
+    try:
+        if texts is not None:
+            translated = await translation.translate_many(texts, source, target)
+            failed = [i for i, value in enumerate(translated) if value is None]
+            return JSONResponse({
+                'translations': [original if value is None else value for original, value in zip(texts, translated)],
+                'failed': failed,
+            })
+        return JSONResponse({'translatedText': await translation.translate(text, source, target)})
+    except TranslationError as e:
+        if resolve_pair(source, target) is None:
+            return JSONResponse({'error': str(e)}, status_code=400)
+        return JSONResponse({'error': 'Translation failed'}, status_code=500)
+    except Exception as e:
+        return JSONResponse({'error': f'Translation request failed: {str(e)}'}, status_code=500)
+
+
+async def aiter_request_rows(request, parse_errors):
+    """Feature rows from an NDJSON or JSON-array body, parsed as it arrives
+
+    A malformed array is reported in parse_errors; the rest of the body is
+    still read so the client sees the response rather than a reset.
+    """
+    if is_ndjson(request.headers.get('content-type')):
+        buffer = b''
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                if line.strip():
+                    yield parse_ndjson_line(line)
+        if buffer.strip():
+            yield parse_ndjson_line(buffer)
+        return
+
+    parser = JsonArrayParser()
+    stream = request.stream()
+    try:
+        async for chunk in stream:
+            for row in parser.feed(chunk):
+                yield row
+        for row in parser.feed(b'', final=True):
+            yield row
+    except ValueError as e:
+        parse_errors.append(str(e))
+        async for _ in stream:
+            pass
+
+
+def parse_ndjson_line(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+async def score_request_rows(request, output):
+    """Read a /predict-batch body, putting a scoring task per chunk of rows on output
+
+    Each task scores its chunk in the pool and returns the NDJSON text. At
+    most BATCH_MAX_IN_FLIGHT chunks are scored at once; reading waits for a
+    free slot. Parse errors follow as text, then None (or the exception raised).
+    """
+    parse_errors = []
+    slots = asyncio.Semaphore(BATCH_MAX_IN_FLIGHT)
+    offset = 0
+
+    async def score(chunk, offset):
+        try:
+            results = await pool.run(score_rows, chunk, offset)
+        finally:
+            slots.release()
+        return ''.join(json.dumps(result) + '\n' for result in results)
+
+    async def submit(chunk):
+        nonlocal offset
+        await slots.acquire()
+        output.put_nowait(asyncio.ensure_future(score(chunk, offset)))
+        offset += len(chunk)
+
+    try:
+        chunk = []
+        async for row in aiter_request_rows(request, parse_errors):
+            chunk.append(row)
+            if len(chunk) >= BATCH_CHUNK_SIZE:
+                await submit(chunk)
+                chunk = []
+        if chunk:
+            await submit(chunk)
+        for error in parse_errors:
+            output.put_nowait(json.dumps({'row': offset, 'error': error}) + '\n')
+        output.put_nowait(None)
+    except ClientDisconnect:
+        output.put_nowait(None)
+    except Exception as e:
+        output.put_nowait(e)
+
+
+# 3f. Bulk scoring endpoint: JSON array or NDJSON rows in, NDJSON results out
+async def predict_batch(request):
+    # Rows are scored while the body is still arriving and each chunk's results
+    # are sent, in order, as soon as it finishes. Reading runs in its own task,
+    # so a client that only reads the response after sending the whole body
+    # can't stall it: finished chunks wait in output as NDJSON text until then
+    output = asyncio.Queue()
+
+    async def results():
+        reading = asyncio.ensure_future(score_request_rows(request, output))
+        try:
+            while True:
+                item = await output.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                if isinstance(item, asyncio.Future):
+                    item = await item
+                yield item
+        finally:
+            reading.cancel()
+            while not output.empty():
+                item = output.get_nowait()
+                if isinstance(item, asyncio.Future):
+                    item.cancel()
+
+    return BodyStreamingResponse(results(), media_type='application/x-ndjson')
+
+
+# 3g. Topsoil nitrogen and pH, served from the shared SoilGrids cache
+async def soil(request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return JSONResponse({'error': 'Invalid JSON body'}, status_code=400)
+
+    try:
+        lat = float(data['latitude'])
+        lon = float(data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return JSONResponse({'error': 'Missing required fields: latitude, longitude'}, status_code=400)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return JSONResponse({'error': 'Coordinates out of range'}, status_code=400)
+
+    try:
+        # Raw SoilGrids means: nitrogen in cg/kg, phh2o is pH x 10
+        nitrogen, phh2o, source = await lookup_soil_async(services['client'], lat, lon)
+    except Exception as e:
+        return JSONResponse({'error': f'Soil lookup failed: {str(e)}'}, status_code=502)
+
+    return JSONResponse({'nitrogen': nitrogen, 'phh2o': phh2o, 'source': source})
+
+
+# 3h. Health and runtime statistics
+async def health(request):
+    return JSONResponse({
+        'status': 'healthy',
+        'model_version': pool.model_version,
+        'prediction_cache': prediction_cache.stats(),
+        'inference_pool': pool.stats(),
+        'chat': services['chat'].stats(),
+        'translation': services['translation'].stats(),
+    })
+
+
+# 3i. Prometheus metrics of the event-loop process (JSON parsing, upstream calls);
+# model stages run in the inference processes and are not included
+async def prometheus_metrics(request):
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+# 3l. Recommendation plus market outlook, computed in one inference-process task
+async def recommend(request):
+    data = await read_json(request)
+    if not isinstance(data, dict):
+        return JSONResponse({'error': 'Invalid JSON body'}, status_code=400)
+
+    try:
+        features = parse_features(data)
+        lat = float(data['latitude'])
+        lon = float(data['longitude'])
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except (KeyError, TypeError):
+        return JSONResponse({'error': 'Missing required fields: latitude, longitude'}, status_code=400)
+
+    score = request.query_params.get('score', data.get('score', RECOMMEND_SCORE))
+    if score not in RECOMMEND_SCORES:
+        return JSONResponse({'error': f"score must be one of: {', '.join(RECOMMEND_SCORES)}"}, status_code=400)
+    try:
+        k, min_probability = parse_ranking_options(
+            request.query_params.get('k', data.get('k', 0)),
+            request.query_params.get('min_probability', data.get('min_probability', RECOMMEND_MIN_PROBABILITY)),
+        )
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    try:
+        recommendations = await pool.run(recommend_crops, features, lat, lon, score, k, min_probability)
+    except Exception as e:
+        return JSONResponse({'error': f'Recommendation failed: {str(e)}'}, status_code=500)
+    return JSONResponse({'recommendations': recommendations, 'score': score})
+
+
+app = Starlette(
+    routes=[
+        Route('/predict', predict, methods=['POST']),
+        Route('/predict-top3', predict_top3, methods=['POST']),
+        Route('/predict-batch', predict_batch, methods=['POST']),
+        Route('/predict-prices', predict_prices, methods=['POST']),
+        Route('/recommend', recommend, methods=['POST']),
+        Route('/chat', chat, methods=['POST']),
+        Route('/translate', translate, methods=['POST']),
+        Route('/soil', soil, methods=['POST']),
+        Route('/health', health, methods=['GET']),
+        Route('/metrics', prometheus_metrics, methods=['GET']),
+    ],
+    middleware=[
+        # Same origins as app.py; preflight requests are answered here
+        Middleware(
+            CORSMiddleware,
+            allow_origins=cors_origins + ['*'],
+            allow_methods=['GET', 'POST', 'OPTIONS'],
+            allow_headers=['Content-Type'],
+        ),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,168 @@
+import codecs
+import json
+import os
+import numpy as np
+import pandas as pd
+from crop_ranking import FEATURES
+
+# Rows scored per model call, and bytes read from the request per refill
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', '4096'))
+READ_SIZE = 64 * 1024
+# A single JSON array element larger than this is treated as malformed input
+MAX_ROW_CHARS = 1024 * 1024
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/json-lines')
+
+
+def is_ndjson(content_type):
+    """True if the request body should be read as one JSON object per line"""
+    mimetype = (content_type or '').split(';')[0].strip().lower()
+    return mimetype in NDJSON_MIMETYPES
+
+
+def iter_ndjson_rows(stream):
+    """Yield one parsed row per non-empty line; undecodable lines yield None"""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+class JsonArrayParser:
+    """Incremental parser for a top-level JSON array
+
+    feed() takes the body in pieces as they arrive and yields every element
+    completed so far, so it works the same over a blocking read() or an async
+    request stream.
+    """
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ''
+        self.pos = 0
+        # Next token: '[', 'first' (a value or ']'), 'value', 'separator', or None once closed
+        self.expect = '['
+
+    def feed(self, data, final=False):
+        """Yield the elements data completes; final marks the end of the body"""
+        if self.expect is None:
+            return
+        self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(data or b'', final=final)
+        self.pos = 0
+        while self.expect is not None:
+            while self.pos < len(self.buffer) and self.buffer[self.pos].isspace():
+                self.pos += 1
+            if self.pos == len(self.buffer):
+                if final:
+                    raise ValueError('Unexpected end of JSON array')
+                return
+            char = self.buffer[self.pos]
+
+            if self.expect == '[':
+                if char != '[':
+                    raise ValueError('Expected a JSON array of feature rows')
+                self.pos += 1
+                self.expect = 'first'
+            elif self.expect == 'separator' or (self.expect == 'first' and char == ']'):
+                if char not in ',]':
+                    raise ValueError('Expected "," or "]" in JSON array')
+                self.pos += 1
+                self.expect = 'value' if char == ',' else None
+            else:
+                try:
+                    row, end = self.decoder.raw_decode(self.buffer, self.pos)
+                except ValueError:
+                    if final or len(self.buffer) - self.pos > MAX_ROW_CHARS:
+                        raise ValueError('Malformed JSON array element')
+                    return
+                # A value ending exactly at the buffer edge may be a truncated number
+                if end == len(self.buffer) and not final:
+                    return
+                self.pos = end
+                self.expect = 'separator'
+                yield row
+
+
+def iter_json_array_rows(stream):
+    """Incrementally parse a top-level JSON array, yielding elements without buffering the body"""
+    parser = JsonArrayParser()
+    while parser.expect is not None:
+        chunk = stream.read(READ_SIZE)
+        yield from parser.feed(chunk, final=not chunk)
+
+
+def iter_chunks(rows, size):
+    """Group an iterable into lists of at most size items"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def score_chunk(ranker, rows, offset=0):
+    """Score a list of feature rows with one CropRanker call, returning one result per row"""
+    matrix = np.zeros((len(rows), len(FEATURES)), dtype=np.float64)
+    errors = [None] * len(rows)
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors[i] = 'Invalid JSON row'
+            continue
+        try:
+            matrix[i] = [float(row[feature]) for feature in FEATURES]
+        except (KeyError, TypeError, ValueError):
+            errors[i] = f'Missing or non-numeric features, expected {FEATURES}'
+            continue
+        if not np.isfinite(matrix[i]).all():
+            errors[i] = 'Feature values must be finite numbers'
+
+    valid = [i for i, error in enumerate(errors) if error is None]
+    crops, scores = {}, {}
+    if valid:
+        input_df = pd.DataFrame(matrix[valid], columns=FEATURES)
+        names, best_scores = ranker.best(ranker.probabilities(input_df))
+        for i, name, score in zip(valid, names, best_scores):
+            crops[i] = name
+            scores[i] = float(score)
+
+    results = []
+    for i, row in enumerate(rows):
+        result = {'row': offset + i}
+        if isinstance(row, dict) and 'id' in row:
+            result['id'] = row['id']
+        if errors[i] is None:
+            result['predicted_crop'] = crops[i]
+            result['score'] = scores[i]
+        else:
+            result['error'] = errors[i]
+        results.append(result)
+    return results
+
+
+def iter_batch_results(ranker, rows, chunk_size=BATCH_CHUNK_SIZE):
+    """Yield NDJSON result lines for a stream of feature rows, scored chunk by chunk"""
+    parse_errors = []
+
+    def guarded(rows):
+        # Stop at a malformed body but still score the rows read before it
+        try:
+            yield from rows
+        except ValueError as e:
+            parse_errors.append(str(e))
+
+    offset = 0
+    for chunk in iter_chunks(guarded(rows), chunk_size):
+        for result in score_chunk(ranker, chunk, offset):
+            yield json.dumps(result) + '\n'
+        offset += len(chunk)
+
+    for error in parse_errors:
+        yield json.dumps({'row': offset, 'error': error}) + '\n'
@@ -0,0 +1,346 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+from benchmark_fixtures import generate_price_csv, StubServer
+
+# Each run is saved here as <UTC time>-<commit>.json unless --output is given
+RESULTS_DIR = 'benchmark-results'
+
+CROP_NAMES = [
+    'rice', 'wheat', 'maize', 'cotton', 'banana', 'grapes', 'mango', 'orange', 'papaya',
+    'pomegranate', 'coconut', 'jute', 'lentil', 'chickpea', 'blackgram', 'moath', 'soybeans',
+]
+
+
+def summarize(latencies, errors, wall_seconds):
+    """p50/p95/p99 and mean latency in ms, plus completed calls per second"""
+    values = np.asarray(latencies, dtype=np.float64) * 1000
+    summary = {'count': len(values), 'errors': errors, 'rps': round(len(values) / wall_seconds, 1) if wall_seconds else 0}
+    if len(values):
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        summary.update({
+            'mean_ms': round(float(values.mean()), 3),
+            'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3),
+            'max_ms': round(float(values.max()), 3),
+        })
+    return summary
+
+
+def measure(call, n, concurrency=1, warmup=0):
+    """Call call(i) n times from concurrency threads after warmup unmeasured calls
+
+    A call that raises counts as an error and isn't in the latencies.
+    """
+    for i in range(warmup):
+        try:
+            call(i)
+        except Exception:
+            pass
+
+    latencies = []
+    errors = [0]
+    counter = iter(range(n))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                call(i)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, concurrency))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - start)
+
+
+class Inputs:
+    """Reproducible request inputs: feature rows, coordinates across India, crop lists"""
+
+    def __init__(self, size, seed=0):
+        rng = np.random.default_rng(seed)
+        self.features = [
+            {'N': float(n), 'temperature': float(t), 'humidity': float(h), 'ph': float(p), 'rainfall': float(r)}
+            for n, t, h, p, r in zip(
+                rng.uniform(0, 140, size).round(0), rng.uniform(10, 40, size).round(1),
+                rng.uniform(20, 100, size).round(0), rng.uniform(4, 9, size).round(2),
+                rng.uniform(20, 300, size).round(1),
+            )
+        ]
+        self.coords = list(zip(rng.uniform(8, 35, size).round(4).tolist(), rng.uniform(68, 97, size).round(4).tolist()))
+        self.crops = [rng.choice(CROP_NAMES, 3, replace=False).tolist() for _ in range(size)]
+        self.size = size
+
+    def feature(self, i):
+        return self.features[i % self.size]
+
+    def coord(self, i):
+        return self.coords[i % self.size]
+
+    def crop_list(self, i):
+        return self.crops[i % self.size]
+
+
+def prepare_environment(workdir, args, stubs):
+    """Point every data file, cache and upstream URL at workdir and the stubs
+
+    Must run before the app modules are imported, since they read their
+    settings at import time.
+    """
+    prices_csv = args.prices_csv
+    if not prices_csv:
+        prices_csv = os.path.join(workdir, 'prices.csv')
+        print(f"Generating {args.rows} synthetic price rows...")
+        generate_price_csv(prices_csv, args.rows, seed=args.seed)
+    env = {
+        'PRICE_CSV': prices_csv,
+        'PRICE_CACHE_DIR': os.path.join(workdir, 'prices.cache'),
+        'SOIL_CACHE_PATH': os.path.join(workdir, 'soil_cache.sqlite3'),
+        'TRANSLATION_CACHE_PATH': os.path.join(workdir, 'translation_cache.sqlite3'),
+        'MODEL_DIR': os.path.join(workdir, 'models'),
+        'MODEL_POLL_SECONDS': '0',
+        'PREDICTION_CACHE_REDIS_URL': '',
+        # Measure live inference unless asked to include the caches
+        'PREDICTION_CACHE_SIZE': '10000' if args.with_caches else '0',
+        'PRICE_FORECAST_TABLE': os.getenv('PRICE_FORECAST_TABLE', 'price_forecasts.npz') if args.with_caches
+        else os.path.join(workdir, 'no_forecasts.npz'),
+        'DEBUG': 'false',
+        # Let every client thread hold a chat stream, so /chat measures the relay, not the busy reply
+        'CHAT_MAX_STREAMS': os.getenv('CHAT_MAX_STREAMS', str(max(4, args.concurrency))),
+    }
+    env.update(stubs.env())
+    os.environ.update(env)
+    return env
+
+
+def endpoint_benchmarks(inputs, batch_rows):
+    """(name, method, path, body for request i) for every route, in run order"""
+    return [
+        ('POST /predict', 'post', '/predict', lambda i: {'json': inputs.feature(i)}),
+        ('POST /predict-top3', 'post', '/predict-top3', lambda i: {'json': inputs.feature(i)}),
+        ('POST /predict-prices', 'post', '/predict-prices', lambda i: {'json': {
+            'crops': inputs.crop_list(i), 'latitude': inputs.coord(i)[0], 'longitude': inputs.coord(i)[1],
+        }}),
+        ('POST /recommend', 'post', '/recommend', lambda i: {'json': {
+            **inputs.feature(i), 'latitude': inputs.coord(i)[0], 'longitude': inputs.coord(i)[1],
+        }}),
+        ('POST /predict-batch', 'post', '/predict-batch', lambda i: {'json': [
+            inputs.feature(i * batch_rows + j) for j in range(batch_rows)
+        ]}),
+        ('POST /soil', 'post', '/soil', lambda i: {'json': {'latitude': inputs.coord(i)[0], 'longitude': inputs.coord(i)[1]}}),
+        ('POST /translate', 'post', '/translate', lambda i: {'json': {'text': f'Benchmark phrase {i}', 'target': 'hi'}}),
+        ('POST /chat', 'post', '/chat', lambda i: {'json': {'prompt': f'Which crop suits field {i}?'}}),
+    ]
+
+
+def run_endpoints(app, inputs, args, selected):
+    import requests
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='benchmark-app', daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    sessions = threading.local()
+
+    def session():
+        if not hasattr(sessions, 'value'):
+            sessions.value = requests.Session()
+        return sessions.value
+
+    results = {}
+    try:
+        for name, method, path, body in endpoint_benchmarks(inputs, args.batch_rows):
+            if not selected(name):
+                continue
+
+            def call(i, method=method, path=path, body=body):
+                response = getattr(session(), method)(base_url + path, timeout=60, **body(i))
+                # Read the whole body, so streamed routes are timed to their last chunk
+                response.content
+                response.raise_for_status()
+
+            print(f"  {name}...")
+            results[name] = measure(call, args.requests, args.concurrency, args.warmup)
+    finally:
+        server.shutdown()
+    return results
+
+
+def run_functions(app_module, inputs, args, selected):
+    import upstream_clients
+    from price_history import to_day_number
+
+    service = app_module.price_service
+    ranker = app_module.model_registry.current().crop_ranker
+    now = datetime.now()
+    crop_ids = sorted(set(service.crop_mapping.values()))
+    districts = sorted(set(service.district_grid.names.tolist()))
+    feature_rows = [[row[name] for name in ('N', 'temperature', 'humidity', 'ph', 'rainfall')] for row in inputs.features]
+
+    benchmarks = [
+        ('PricePredictionService.predict_price',
+         lambda i: service.predict_price(inputs.crop_list(i)[0], *inputs.coord(i))),
+        ('PricePredictionService.predict_prices',
+         lambda i: service.predict_prices(inputs.crop_list(i), *inputs.coord(i))),
+        ('PricePredictionService.predict_price_series',
+         lambda i: service.predict_price_series(inputs.crop_list(i), *inputs.coord(i))),
+        ('PricePredictionService.get_price_lags',
+         lambda i: service.get_price_lags(crop_ids[i % len(crop_ids)], districts[(i // len(crop_ids)) % len(districts)], now)),
+        ('PricePredictionService.get_district_from_coords',
+         lambda i: service.get_district_from_coords(*inputs.coord(i))),
+        ('PriceHistoryIndex.get_lags',
+         lambda i: service.price_index.get_lags(crop_ids[i % len(crop_ids)], districts[(i // len(crop_ids)) % len(districts)], to_day_number(now))),
+        ('CropRanker.predict', lambda i: ranker.predict([feature_rows[i % inputs.size]])),
+        ('CropRanker.top_k', lambda i: ranker.top_k([feature_rows[i % inputs.size]], 3)),
+        ('upstream_clients.lookup_soil', lambda i: upstream_clients.lookup_soil(*inputs.coord(i))),
+        ('upstream_clients.fetch_openweather', lambda i: upstream_clients.fetch_openweather(*inputs.coord(i))),
+        ('upstream_clients.fetch_conditions', lambda i: upstream_clients.fetch_conditions(*inputs.coord(i))),
+    ]
+    results = {}
+    for name, call in benchmarks:
+        if selected(name):
+            print(f"  {name}...")
+            results[name] = measure(call, args.function_calls, args.function_concurrency, args.warmup)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    only = [name.strip() for name in args.only.split(',')] if args.only else None
+
+    def selected(name):
+        return only is None or any(part in name for part in only)
+
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as workdir:
+        stubs = StubServer(latency=args.stub_latency_ms / 1000).start()
+        try:
+            env = prepare_environment(workdir, args, stubs)
+            print("Loading the app...")
+            start = time.perf_counter()
+            import app as app_module
+            startup_seconds = time.perf_counter() - start
+
+            inputs = Inputs(max(args.requests, args.function_calls) + args.warmup, args.seed)
+            print("Endpoints:")
+            endpoints = run_endpoints(app_module.app, inputs, args, selected)
+            print("Functions:")
+            functions = run_functions(app_module, inputs, args, selected)
+        finally:
+            stubs.stop()
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'settings': vars(args),
+            'prices_rows': args.rows if not args.prices_csv else None,
+            'app_startup_seconds': round(startup_seconds, 3),
+            'stub_requests': stubs.requests,
+            'environment': {name: value for name, value in env.items() if not name.endswith('_PATH')},
+        },
+        'endpoints': endpoints,
+        'functions': functions,
+    }
+
+
+def print_results(results):
+    print(f"{'benchmark':<50}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>10}{'errors':>8}")
+    for section in ('endpoints', 'functions'):
+        for name, stats in results[section].items():
+            print(f"{name:<50}{stats.get('p50_ms', 0):>10.3f}{stats.get('p95_ms', 0):>10.3f}"
+                  f"{stats.get('p99_ms', 0):>10.3f}{stats['rps']:>10.1f}{stats['errors']:>8}")
+
+
+def compare(baseline, candidate):
+    """Print how each benchmark in candidate moved against baseline (ratio < 1 is faster)"""
+    print(f"{'benchmark':<50}{'p50':>18}{'p99':>18}{'rps':>18}")
+    for section in ('endpoints', 'functions'):
+        for name, new in candidate[section].items():
+            old = baseline.get(section, {}).get(name)
+            if not old:
+                print(f"{name:<50}{'(new)':>18}")
+                continue
+            cells = []
+            for key in ('p50_ms', 'p99_ms', 'rps'):
+                before, after = old.get(key), new.get(key)
+                ratio = f'x{after / before:.2f}' if before and after is not None else ''
+                cells.append(f"{after if after is not None else '-'} {ratio}")
+            print(f"{name:<50}" + ''.join(f"{cell:>18}" for cell in cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline latency and throughput benchmarks for the API")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="benchmark every endpoint and hot function, save JSON results")
+    run_parser.add_argument('--rows', type=int, default=150000, help="synthetic price rows to generate")
+    run_parser.add_argument('--prices-csv', help="use this price CSV instead of generating one")
+    run_parser.add_argument('--requests', type=int, default=300, help="measured requests per endpoint")
+    run_parser.add_argument('--concurrency', type=int, default=8, help="client threads per endpoint")
+    run_parser.add_argument('--function-calls', type=int, default=1000, help="measured calls per function")
+    run_parser.add_argument('--function-concurrency', type=int, default=1)
+    run_parser.add_argument('--warmup', type=int, default=20, help="unmeasured calls before each benchmark")
+    run_parser.add_argument('--batch-rows', type=int, default=100, help="rows per /predict-batch request")
+    run_parser.add_argument('--stub-latency-ms', type=float, default=5, help="delay of every stubbed upstream response")
+    run_parser.add_argument('--with-caches', action='store_true', help="keep the prediction cache and forecast table on")
+    run_parser.add_argument('--only', help="comma-separated substrings of the benchmarks to run")
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--output', help=f"results file (default {RESULTS_DIR}/<time>-<commit>.json)")
+
+    compare_parser = commands.add_parser('compare', help="compare two saved results files")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.candidate) as f:
+            candidate = json.load(f)
+        compare(baseline, candidate)
+        return
+
+    results = run(args)
+    print_results(results)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now(timezone.utc):%Y%m%d-%H%M%S}-{results['meta']['commit'] or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import pandas as pd
+from district_lookup import DistrictGrid
+
+# Crops the price model knows (PricePredictionService.crop_mapping values)
+SYNTHETIC_CROPS = [
+    'Banana', 'Black Gram (Urd Beans)(Whole)', 'Coconut', 'Cotton', 'Grapes',
+    'Jute', 'Kabuli Chana(Chickpeas-White)', 'Lentil (Masur)(Whole)', 'Maize',
+    'Mango', 'Moath Dal', 'Orange', 'Papaya', 'Pomegranate', 'Rice', 'Soybeans', 'Wheat',
+]
+
+
+def generate_price_csv(path, rows=150000, crops=None, districts=None, days=400, end_date=None, seed=0):
+    """Write a latest_one_year_prices.csv-shaped file of rows random daily prices
+
+    Covers the days before end_date (today by default), so 90- and 365-day
+    price lags resolve. Districts default to every name the district grid can
+    return. Returns the number of rows written.
+    """
+    rng = np.random.default_rng(seed)
+    crops = list(crops or SYNTHETIC_CROPS)
+    districts = list(districts or sorted(set(DistrictGrid().names.tolist())))
+    end_date = end_date or datetime.now()
+    first_day = (end_date - timedelta(days=days)).date()
+
+    crop_codes = rng.integers(len(crops), size=rows)
+    district_codes = rng.integers(len(districts), size=rows)
+    # Each crop has its own price level with a mild seasonal swing
+    day_offsets = rng.integers(days, size=rows)
+    levels = rng.uniform(500, 9000, size=len(crops))
+    season = 1 + 0.15 * np.sin(2 * np.pi * day_offsets / 365)
+    prices = levels[crop_codes] * season * rng.lognormal(0, 0.1, size=rows)
+
+    frame = pd.DataFrame({
+        'date': pd.to_datetime(first_day) + pd.to_timedelta(day_offsets, unit='D'),
+        'crop_id': np.asarray(crops, dtype=object)[crop_codes],
+        'district_id': np.asarray(districts, dtype=object)[district_codes],
+        'price': prices.round(2),
+    })
+    frame.to_csv(path, index=False, date_format='%Y-%m-%d')
+    return rows
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per response
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        self.server.count(url.path)
+        time.sleep(self.server.latency)
+        if url.path == '/soilgrids':
+            self._send_json({'properties': {'layers': [
+                {'name': 'nitrogen', 'depths': [{'values': {'mean': 150}}]},
+                {'name': 'phh2o', 'depths': [{'values': {'mean': 65}}]},
+            ]}})
+        elif url.path == '/weather':
+            self._send_json({'main': {'temp': 27.5, 'humidity': 70}, 'rain': {'1h': 1.2}})
+        elif url.path == '/mymemory':
+            text = query.get('q', [''])[0]
+            self._send_json({'responseStatus': 200, 'responseData': {'translatedText': f'[hi] {text}'}})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.count(url.path)
+        if url.path != '/chat':
+            self.send_error(404)
+            return
+        time.sleep(self.server.latency)
+        # Chunked plain-text stream, like the chat model server
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for i in range(self.server.chat_chunks):
+                chunk = f'token{i} '.encode()
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                self.wfile.flush()
+                time.sleep(self.server.chat_chunk_interval)
+            self.wfile.write(b'0\r\n\r\n')
+        except OSError:
+            pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """Local stand-ins for SoilGrids, OpenWeather, MyMemory and the chat backend
+
+    Every response waits latency seconds first; chat streams chat_chunks chunks
+    chat_chunk_interval seconds apart. env() gives the variables that point
+    the app's upstream clients here.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port=0, latency=0.005, chat_chunks=8, chat_chunk_interval=0.01):
+        super().__init__(('127.0.0.1', port), _StubHandler)
+        self.latency = latency
+        self.chat_chunks = chat_chunks
+        self.chat_chunk_interval = chat_chunk_interval
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def count(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def env(self):
+        return {
+            'SOILGRIDS_BASE_URL': f'{self.base_url}/soilgrids',
+            'OPENWEATHER_BASE_URL': f'{self.base_url}/weather',
+            'MYMEMORY_URL': f'{self.base_url}/mymemory',
+            'CHAT_UPSTREAM_URL': f'{self.base_url}/chat',
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='benchmark-stubs', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Synthetic price data and upstream stubs for benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+    csv_parser = commands.add_parser('prices', help="write a synthetic price CSV")
+    csv_parser.add_argument('path')
+    csv_parser.add_argument('--rows', type=int, default=150000)
+    csv_parser.add_argument('--days', type=int, default=400)
+    csv_parser.add_argument('--seed', type=int, default=0)
+    stub_parser = commands.add_parser('stubs', help="serve the upstream stubs until interrupted")
+    stub_parser.add_argument('--port', type=int, default=18765)
+    stub_parser.add_argument('--latency-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    if args.command == 'prices':
+        rows = generate_price_csv(args.path, args.rows, days=args.days, seed=args.seed)
+        print(f"Wrote {rows} rows to {args.path}")
+    else:
+        server = StubServer(args.port, args.latency_ms / 1000)
+        for name, value in server.env().items():
+            print(f"{name}={value}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
@@ -0,0 +1,270 @@
+import asyncio
+import os
+import queue
+import select
+import socket
+import threading
+import time
+from upstream_clients import get_session, latencies
+from metrics import metrics
+
+CHAT_UPSTREAM_URL = os.getenv('CHAT_UPSTREAM_URL', 'https://mon-yarn-avoiding-then.trycloudflare.com/chat')
+CHAT_API_KEY = os.getenv('CHAT_API_KEY', 'supersecret')
+# (connect, read) timeouts; the read timeout bounds the silence between two chunks
+CHAT_TIMEOUT = (float(os.getenv('CHAT_CONNECT_TIMEOUT', '5')), float(os.getenv('CHAT_READ_TIMEOUT', '60')))
+# Hard limit on a whole conversation turn, however steadily the upstream trickles
+CHAT_MAX_STREAM_SECONDS = float(os.getenv('CHAT_MAX_STREAM_SECONDS', '300'))
+# Streams open at once per worker process. Each holds a gunicorn thread, so the
+# default is half of GUNICORN_THREADS, leaving /predict and the other routes the rest
+CHAT_MAX_STREAMS = int(os.getenv('CHAT_MAX_STREAMS') or max(1, int(os.getenv('GUNICORN_THREADS', '8')) // 2))
+# How often a stream waiting on a silent upstream checks whether its client left
+CHAT_DISCONNECT_POLL_SECONDS = 1.0
+# Under the ASGI app an open stream is a coroutine, not a thread, so many more fit
+ASGI_CHAT_MAX_STREAMS = int(os.getenv('ASGI_CHAT_MAX_STREAMS', '256'))
+
+
+class ChatBusy(Exception):
+    """Every stream slot in this worker is taken"""
+
+
+_END = object()
+
+
+def client_disconnected(sock):
+    """True if the peer of a server-side socket has closed its end"""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+    except BlockingIOError:
+        return False
+    except (OSError, ValueError):
+        return True
+
+
+class ChatStream:
+    """Iterable that relays an upstream response body chunk by chunk, as it arrives
+
+    A reader thread pulls chunks off the upstream connection (bounded by its
+    read timeout) and the response thread waits for them with a timeout of
+    its own. The stream therefore ends on time at max_seconds even while the
+    upstream is silent. When the server exposes the client's socket
+    (client_socket), a departed client is noticed within
+    CHAT_DISCONNECT_POLL_SECONDS instead of at the next chunk. The WSGI
+    server calls close() when the response finishes or the client
+    disconnects; that closes the upstream connection and frees the stream
+    slot, even if iteration never started.
+    """
+
+    def __init__(self, upstream, release, max_seconds=CHAT_MAX_STREAM_SECONDS, client_socket=None):
+        self.upstream = upstream
+        self._release = release
+        self.max_seconds = max_seconds
+        self.client_socket = client_socket
+        self._chunks = queue.Queue()
+        self._closed = False
+
+    def _read(self):
+        try:
+            # chunk_size=None yields whatever bytes have arrived, without waiting for newlines
+            for chunk in self.upstream.iter_content(chunk_size=None):
+                if self._closed:
+                    return
+                if chunk:
+                    self._chunks.put(chunk)
+        except Exception as e:
+            if not self._closed:
+                self._chunks.put(e)
+        finally:
+            self._chunks.put(_END)
+
+    def __iter__(self):
+        deadline = time.monotonic() + self.max_seconds
+        threading.Thread(target=self._read, name='chat-relay', daemon=True).start()
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    print("Chat stream hit CHAT_MAX_STREAM_SECONDS, closing")
+                    break
+                try:
+                    item = self._chunks.get(timeout=min(remaining, CHAT_DISCONNECT_POLL_SECONDS))
+                except queue.Empty:
+                    if self.client_socket is not None and client_disconnected(self.client_socket):
+                        print("Chat client disconnected, closing")
+                        break
+                    continue
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    # Headers are already sent, so the only signal left is ending the body early
+                    print(f"Chat upstream stream failed: {item}")
+                    break
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            # Wake the reader thread if it is blocked waiting for the upstream
+            sock = getattr(getattr(self.upstream.raw, 'connection', None), 'sock', None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self.upstream.close()
+        finally:
+            self._release()
+
+
+class ChatProxy:
+    """Streams chat completions from the upstream model server with a per-process stream cap"""
+
+    def __init__(self, url=CHAT_UPSTREAM_URL, api_key=CHAT_API_KEY, max_streams=CHAT_MAX_STREAMS,
+                 timeout=CHAT_TIMEOUT):
+        self.url = url
+        self.api_key = api_key
+        self.max_streams = max_streams
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_streams)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.rejected = 0
+
+    def _release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    def open(self, prompt, client_socket=None):
+        """Start an upstream stream and return (ChatStream, content_type)
+
+        Raises ChatBusy when the cap is reached, instead of queueing behind
+        other conversations, and requests exceptions if the upstream can't be
+        reached. client_socket is the requesting client's connection, if the
+        server exposes it, so the stream can stop when the client leaves.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ChatBusy(f'{self.max_streams} chat streams already open')
+        with self._lock:
+            self.active += 1
+
+        upstream = None
+        start = time.perf_counter()
+        try:
+            upstream = get_session().post(
+                self.url,
+                headers={"Content-Type": "application/json", "x-api-key": self.api_key},
+                json={"prompt": prompt},
+                stream=True,
+                timeout=self.timeout,
+            )
+            upstream.raise_for_status()
+        except Exception:
+            metrics.error('chat')
+            if upstream is not None:
+                upstream.close()
+            self._release()
+            raise
+        finally:
+            # Time to the response headers; the stream itself can run for minutes
+            latencies.record('chat', time.perf_counter() - start)
+        content_type = upstream.headers.get('Content-Type', 'text/plain')
+        return ChatStream(upstream, self._release, client_socket=client_socket), content_type
+
+    def stats(self):
+        with self._lock:
+            return {'active': self.active, 'max_streams': self.max_streams, 'rejected': self.rejected}
+
+
+class AsyncChatStream:
+    """ChatStream for the ASGI app: async iteration over an httpx streaming response
+
+    The caller must await aclose() once the response is over (asgi_app does it
+    in a finally), which frees the slot even if iteration never started.
+    """
+
+    def __init__(self, upstream, release, max_seconds=CHAT_MAX_STREAM_SECONDS):
+        self.upstream = upstream
+        self._release = release
+        self.max_seconds = max_seconds
+        self._closed = False
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        try:
+            async with asyncio.timeout(self.max_seconds):
+                async for chunk in self.upstream.aiter_raw():
+                    if chunk:
+                        yield chunk
+        except TimeoutError:
+            print("Chat stream hit CHAT_MAX_STREAM_SECONDS, closing")
+        except Exception as e:
+            # Headers are already sent, so the only signal left is ending the body early
+            print(f"Chat upstream stream failed: {e}")
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            await self.upstream.aclose()
+        finally:
+            self._release()
+
+
+class AsyncChatProxy:
+    """ChatProxy for the ASGI app, relaying through an httpx.AsyncClient on the event loop"""
+
+    def __init__(self, client, url=CHAT_UPSTREAM_URL, api_key=CHAT_API_KEY, max_streams=ASGI_CHAT_MAX_STREAMS):
+        self.client = client
+        self.url = url
+        self.api_key = api_key
+        self.max_streams = max_streams
+        self.active = 0
+        self.rejected = 0
+
+    def _release(self):
+        self.active -= 1
+
+    async def open(self, prompt):
+        """Start an upstream stream and return (AsyncChatStream, content_type)
+
+        Raises ChatBusy when the cap is reached, and httpx exceptions if the
+        upstream can't be reached.
+        """
+        if self.active >= self.max_streams:
+            self.rejected += 1
+            raise ChatBusy(f'{self.max_streams} chat streams already open')
+        self.active += 1
+
+        upstream = None
+        start = time.perf_counter()
+        try:
+            request = self.client.build_request(
+                'POST', self.url,
+                headers={"Content-Type": "application/json", "x-api-key": self.api_key},
+                json={"prompt": prompt},
+            )
+            upstream = await self.client.send(request, stream=True)
+            upstream.raise_for_status()
+        except BaseException:
+            metrics.error('chat')
+            if upstream is not None:
+                await upstream.aclose()
+            self._release()
+            raise
+        finally:
+            latencies.record('chat', time.perf_counter() - start)
+        content_type = upstream.headers.get('Content-Type', 'text/plain')
+        return AsyncChatStream(upstream, self._release), content_type
+
+    def stats(self):
+        return {'active': self.active, 'max_streams': self.max_streams, 'rejected': self.rejected}
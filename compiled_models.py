@@ -0,0 +1,302 @@
+import os
+import numpy as np
+import pandas as pd
+from price_store import file_checksum
+
+# Flattened copies of the pickled models, written by model_export.py
+CROP_MODEL_ARRAYS = os.getenv('CROP_MODEL_ARRAYS', 'crop_model.npz')
+PRICE_MODEL_ARRAYS = os.getenv('PRICE_MODEL_ARRAYS', 'price_model.npz')
+# Set COMPILED_MODELS=0 to always unpickle the original estimators
+USE_COMPILED_MODELS = os.getenv('COMPILED_MODELS', '1') != '0'
+
+_MAGIC_MULT = np.uint64(0x4906ba494954cb65)
+
+
+def _load_arrays(path):
+    """Every array in an .npz, read-only so they stay shared between forked workers"""
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    for array in arrays.values():
+        array.flags.writeable = False
+    return arrays
+
+
+def _feature_matrix(X, feature_names):
+    """Columns of a DataFrame in training order, or a plain 2-D array as is"""
+    if isinstance(X, pd.DataFrame):
+        return X[list(feature_names)]
+    return np.asarray(X).reshape(-1, len(feature_names))
+
+
+class LabelTable:
+    """The part of a fitted LabelEncoder the app uses: classes_ and inverse_transform"""
+
+    def __init__(self, classes):
+        self.classes_ = np.asarray(classes)
+
+    @classmethod
+    def load(cls, path=CROP_MODEL_ARRAYS):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['label_classes'])
+
+    def inverse_transform(self, y):
+        return self.classes_[np.asarray(y, dtype=np.int64)]
+
+    def transform(self, labels):
+        return np.searchsorted(self.classes_, np.asarray(labels))
+
+
+class ForestClassifier:
+    """Random-forest classifier evaluated from flat node arrays
+
+    Every tree's nodes live in one set of arrays; leaves point to themselves,
+    so all (row, tree) pairs descend together for max_depth steps.
+    Inputs are rounded to float32 before comparison, as scikit-learn does,
+    which keeps predict_proba identical to the original estimator.
+    """
+
+    def __init__(self, classes, feature_names, roots, feature, threshold, left, right, proba, max_depth):
+        self.classes_ = np.asarray(classes)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.n_features_in_ = len(feature_names)
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.proba = proba
+        self.max_depth = int(max_depth)
+
+    @classmethod
+    def load(cls, path=CROP_MODEL_ARRAYS):
+        data = _load_arrays(path)
+        return cls(
+            data['classes'], data['feature_names'].tolist(), data['roots'], data['feature'],
+            data['threshold'], data['left'], data['right'], data['proba'], data['max_depth'],
+        )
+
+    def apply(self, X):
+        """Leaf node index per (row, tree)"""
+        X = np.asarray(_feature_matrix(X, self.feature_names_in_), dtype=np.float32).astype(np.float64)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        # Accumulate tree by tree, in estimator order, like RandomForestClassifier
+        total = np.zeros((len(leaves), len(self.classes_)))
+        for tree in range(leaves.shape[1]):
+            total += self.proba[leaves[:, tree]]
+        return total / leaves.shape[1]
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def _combine_hash(a, b):
+    """CatBoost's CalcHash on uint64 arrays (wraps modulo 2**64)"""
+    return _MAGIC_MULT * (a + _MAGIC_MULT * b)
+
+
+class ObliviousBoostingRegressor:
+    """CatBoost regressor evaluated from exported arrays
+
+    Float features are bucketed against the model's float32 borders. Each
+    categorical CTR is resolved by hashing the row's category hashes with the
+    binary features of its projection, then looking the hash up in a sorted table
+    that stores the CTR's bucket index directly. All trees are oblivious, so a
+    leaf index is the split bits of a tree packed into an integer.
+    """
+
+    def __init__(self, arrays):
+        self.feature_names_ = arrays['feature_names'].tolist()
+        self.cat_feature_indices = arrays['cat_feature_indices'].tolist()
+        self.float_feature_indices = arrays['float_feature_indices'].tolist()
+        self.binary_feature_count = int(arrays['binary_feature_count'])
+        # Float feature i becomes binary feature float_bin_index[i], if it has borders
+        self.float_bin_index = arrays['float_bin_index']
+        self.float_borders = np.split(arrays['float_borders'], arrays['float_border_offsets'][1:-1])
+        self.category_names = arrays['category_names'].tolist()
+        self.category_hashes = dict(zip(self.category_names, arrays['category_hashes'].astype(np.uint64)))
+        self.unknown_hash = np.uint64(arrays['unknown_hash'])
+        # Whether model_export checked that names missing from category_hashes score
+        # like CatBoost scores them; older exports didn't check, so assume not
+        self.unseen_categories_exact = (
+            bool(arrays['unseen_categories_exact']) if 'unseen_categories_exact' in arrays else False
+        )
+        # Model that scores rows with unseen names instead, set by load_price_model
+        self.fallback = None
+
+        # CTRs: projection, output binary feature, and bucket when the hash is unknown
+        self.ctr_projection = arrays['ctr_projection']
+        self.ctr_bin_index = arrays['ctr_bin_index']
+        self.ctr_default = arrays['ctr_default']
+        self._build_lookup_tables(
+            np.split(arrays['projection_cats'], arrays['projection_cat_offsets'][1:-1]),
+            np.split(arrays['projection_bins'], arrays['projection_bin_offsets'][1:-1]),
+            arrays['ctr_keys'], arrays['ctr_values'], arrays['ctr_offsets'],
+        )
+
+        self.split_feature = arrays['split_feature']
+        self.split_border = arrays['split_border']
+        self.split_xor = arrays['split_xor']
+        self.split_weight = arrays['split_weight']
+        self.tree_split_offsets = arrays['tree_split_offsets']
+        self.leaf_offsets = arrays['leaf_offsets']
+        self.leaf_values = arrays['leaf_values']
+        self.scale = float(arrays['scale'])
+        self.bias = float(arrays['bias'])
+
+    def _build_lookup_tables(self, projection_cats, projection_bins, ctr_keys, ctr_values, ctr_offsets):
+        """Pad projections into matrices and merge every CTR hash table into one sorted array
+
+        A projection hashes its cat features, then (binary feature, value, equal?)
+        terms; padding slots are -1 and leave the hash unchanged. Keys of CTR c are
+        re-hashed with c, so one searchsorted resolves every CTR of every row.
+        """
+        n_projections = len(projection_cats)
+        width = max([len(cats) for cats in projection_cats] + [0])
+        self.projection_cat_matrix = np.full((n_projections, width), -1, dtype=np.int64)
+        for p, cats in enumerate(projection_cats):
+            self.projection_cat_matrix[p, :len(cats)] = cats
+        width = max([len(terms) for terms in projection_bins] + [0])
+        self.projection_term_matrix = np.full((n_projections, width, 3), -1, dtype=np.int64)
+        for p, terms in enumerate(projection_bins):
+            self.projection_term_matrix[p, :len(terms)] = terms
+
+        ctr_ids = np.repeat(np.arange(len(ctr_offsets) - 1, dtype=np.uint64), np.diff(ctr_offsets))
+        keys = _combine_hash(ctr_keys.astype(np.uint64), ctr_ids)
+        order = np.argsort(keys)
+        self.ctr_table_keys = keys[order]
+        self.ctr_table_values = ctr_values[order]
+        if len(keys) and (np.diff(self.ctr_table_keys) == 0).any():
+            raise ValueError("CTR hash tables collide after merging")
+
+    @classmethod
+    def load(cls, path=PRICE_MODEL_ARRAYS):
+        return cls(_load_arrays(path))
+
+    def _category_hashes(self, values):
+        lookup = self.category_hashes
+        unknown = self.unknown_hash
+        return np.array([lookup.get(str(value), unknown) for value in values], dtype=np.uint64)
+
+    def _columns(self, X):
+        if isinstance(X, pd.DataFrame):
+            return [X[name].to_numpy() for name in self.feature_names_]
+        X = np.asarray(X, dtype=object).reshape(-1, len(self.feature_names_))
+        return [X[:, i] for i in range(X.shape[1])]
+
+    def unseen_rows(self, X):
+        """Boolean mask of the rows with a category name the export has no hash for"""
+        columns = self._columns(X)
+        unseen = np.zeros(len(columns[0]), dtype=bool)
+        for feature in self.cat_feature_indices:
+            unseen |= np.array([str(value) not in self.category_hashes for value in columns[feature]], dtype=bool)
+        return unseen
+
+    def binarize(self, X):
+        """(rows, binary_feature_count) bucket indices, as CatBoost computes them"""
+        columns = self._columns(X)
+        n_rows = len(columns[0])
+        bins = np.zeros((n_rows, self.binary_feature_count), dtype=np.int32)
+
+        for i, feature in enumerate(self.float_feature_indices):
+            if self.float_bin_index[i] < 0:
+                continue
+            values = np.asarray(columns[feature], dtype=np.float32)
+            # Count of borders strictly below each value; NaN goes to the lowest bucket
+            buckets = np.searchsorted(self.float_borders[i], values, side='left')
+            bins[:, self.float_bin_index[i]] = np.where(np.isnan(values), 0, buckets)
+
+        # Category hashes per row, with a zero column for padded projection slots
+        cat_hashes = np.zeros((n_rows, len(self.cat_feature_indices) + 1), dtype=np.uint64)
+        for i, feature in enumerate(self.cat_feature_indices):
+            cat_hashes[:, i] = self._category_hashes(columns[feature])
+
+        hashes = np.zeros((n_rows, len(self.projection_cat_matrix)), dtype=np.uint64)
+        for slot in range(self.projection_cat_matrix.shape[1]):
+            cats = self.projection_cat_matrix[:, slot]
+            hashes = np.where(cats >= 0, _combine_hash(hashes, cat_hashes[:, cats]), hashes)
+        for slot in range(self.projection_term_matrix.shape[1]):
+            bin_index, value, check_equal = self.projection_term_matrix[:, slot].T
+            feature_bins = bins[:, np.maximum(bin_index, 0)]
+            bit = np.where(check_equal == 1, feature_bins == value, feature_bins >= value)
+            hashes = np.where(bin_index >= 0, _combine_hash(hashes, bit.astype(np.uint64)), hashes)
+
+        keys = _combine_hash(hashes[:, self.ctr_projection], np.arange(len(self.ctr_projection), dtype=np.uint64))
+        position = np.minimum(np.searchsorted(self.ctr_table_keys, keys), max(len(self.ctr_table_keys) - 1, 0))
+        if len(self.ctr_table_keys):
+            found = self.ctr_table_keys[position] == keys
+            bins[:, self.ctr_bin_index] = np.where(found, self.ctr_table_values[position], self.ctr_default)
+        else:
+            bins[:, self.ctr_bin_index] = self.ctr_default
+        return bins
+
+    def predict(self, X):
+        bins = self.binarize(X)
+        bits = (bins[:, self.split_feature] ^ self.split_xor) >= self.split_border
+        leaf_index = np.add.reduceat(bits * self.split_weight, self.tree_split_offsets[:-1], axis=1)
+        leaves = self.leaf_values[self.leaf_offsets[:-1] + leaf_index]
+        predictions = leaves.sum(axis=1) * self.scale + self.bias
+        if self.fallback is not None and not self.unseen_categories_exact:
+            unseen = self.unseen_rows(X)
+            if unseen.any():
+                if not isinstance(X, pd.DataFrame):
+                    X = pd.DataFrame(np.asarray(X, dtype=object).reshape(-1, len(self.feature_names_)),
+                                     columns=self.feature_names_)
+                predictions[unseen] = self.fallback.predict(X[unseen])
+        return predictions
+
+
+def _is_current(arrays_path, source_path, encoder_path=None):
+    """True if the exported arrays exist and were built from these exact pickles
+
+    The crop export also carries the label encoder's classes, so it is only
+    current if the encoder is unchanged too.
+    """
+    if not USE_COMPILED_MODELS or not os.path.exists(arrays_path):
+        return False
+    with np.load(arrays_path, allow_pickle=False) as data:
+        source_sha256 = str(data['source_sha256']) if 'source_sha256' in data.files else None
+        encoder_sha256 = str(data['encoder_sha256']) if 'encoder_sha256' in data.files else None
+    if source_sha256 != file_checksum(source_path):
+        return False
+    return encoder_path is None or encoder_sha256 == file_checksum(encoder_path)
+
+
+def load_crop_model(model_path='crop_model.pkl', encoder_path='label_encoder.pkl', arrays_path=CROP_MODEL_ARRAYS):
+    """(model, label_encoder), from the exported arrays when they match the pickle
+
+    Falls back to unpickling with joblib (which imports scikit-learn) otherwise.
+    """
+    if _is_current(arrays_path, model_path, encoder_path):
+        return ForestClassifier.load(arrays_path), LabelTable.load(arrays_path)
+    import joblib
+
+    print(f"{arrays_path} missing or stale, loading {model_path} with joblib")
+    return joblib.load(model_path), joblib.load(encoder_path)
+
+
+def load_price_model(model_path='price_model.pkl', arrays_path=PRICE_MODEL_ARRAYS):
+    """The price model, from the exported arrays when they match the pickle
+
+    If the export couldn't confirm that unseen crop or district names score as
+    they do in CatBoost, the pickle is loaded too and scores those rows.
+    """
+    if _is_current(arrays_path, model_path):
+        model = ObliviousBoostingRegressor.load(arrays_path)
+        if not model.unseen_categories_exact:
+            import joblib
+
+            print(f"{arrays_path} not verified on unseen categories, loading {model_path} with joblib for those rows")
+            model.fallback = joblib.load(model_path)
+        return model
+    import joblib
+
+    print(f"{arrays_path} missing or stale, loading {model_path} with joblib")
+    return joblib.load(model_path)
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+from metrics import metrics
+
+# The order of columns MUST match the order used during training
+FEATURES = ['N', 'temperature', 'humidity', 'ph', 'rainfall']
+
+
+def build_class_names(model, label_encoder):
+    """Decode every class index of the model to a crop name once, at load time"""
+    classes = getattr(model, 'classes_', None)
+    if classes is None:
+        classes = np.arange(len(getattr(label_encoder, 'classes_', [])))
+    try:
+        names = label_encoder.inverse_transform(np.asarray(classes))
+        return np.array([str(name) for name in names], dtype=object)
+    except Exception:
+        pass
+
+    # Mixed or already-decoded labels: decode one by one, keeping labels the encoder doesn't know
+    names = []
+    for label in classes:
+        try:
+            names.append(str(label_encoder.inverse_transform([label])[0]))
+        except Exception:
+            names.append(str(label))
+    return np.array(names, dtype=object)
+
+
+def top_k_indices(proba, k):
+    """Column indices of the k highest probabilities per row, best first
+
+    Uses a partial selection instead of sorting every class. Ties are broken by
+    class index, matching a stable descending sort.
+    """
+    proba = np.asarray(proba)
+    n_classes = proba.shape[1]
+    k = max(1, min(int(k), n_classes))
+
+    # k-th largest value per row, then everything above it plus the first tied entries
+    threshold = np.partition(proba, n_classes - k, axis=1)[:, n_classes - k, None]
+    above = proba > threshold
+    tied = proba == threshold
+    needed = k - above.sum(axis=1, keepdims=True)
+    selected = above | (tied & (np.cumsum(tied, axis=1) <= needed))
+    candidates = np.nonzero(selected)[1].reshape(len(proba), k)
+
+    order = np.argsort(-np.take_along_axis(proba, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class CropRanker:
+    """Ranks crops for batches of feature rows with one predict_proba call
+
+    With a batcher (see micro_batching.py), concurrent calls from different
+    request threads share a single predict_proba call. version names the
+    model version, so cached answers can be keyed by it.
+    """
+
+    def __init__(self, model, label_encoder, batcher=None, version=None):
+        self.model = model
+        self.label_encoder = label_encoder
+        self.batcher = batcher
+        self.version = version
+        self.class_names = build_class_names(model, label_encoder)
+        self.has_proba = hasattr(model, 'predict_proba')
+
+    def to_frame(self, rows):
+        """Build the model input frame from feature dicts or an (n, 5) matrix"""
+        if isinstance(rows, pd.DataFrame):
+            return rows[FEATURES]
+        with metrics.time('feature_frame'):
+            if len(rows) and isinstance(rows[0], dict):
+                return pd.DataFrame(rows, columns=FEATURES)
+            return pd.DataFrame(np.asarray(rows, dtype=np.float64).reshape(-1, len(FEATURES)), columns=FEATURES)
+
+    def predict_proba(self, input_df):
+        # Includes the wait for a shared batch when batching
+        with metrics.time('predict_proba'):
+            if self.batcher is not None:
+                return self.batcher.submit(input_df.to_numpy(dtype=np.float64))
+            return self.model.predict_proba(input_df)
+
+    def predict(self, rows):
+        """Most likely crop name per input row"""
+        input_df = self.to_frame(rows)
+        if not self.has_proba:
+            with metrics.time('predict'):
+                predictions = self.model.predict(input_df)
+            with metrics.time('label_decode'):
+                return [str(crop) for crop in self.label_encoder.inverse_transform(predictions)]
+        proba = self.predict_proba(input_df)
+        with metrics.time('label_decode'):
+            return self.best(proba)[0].tolist()
+
+    def probabilities(self, rows):
+        """(n, classes) probability matrix in class_names order, one-hot if the model has no predict_proba"""
+        input_df = self.to_frame(rows)
+        if self.has_proba:
+            return np.asarray(self.predict_proba(input_df))
+        predicted = self.predict(input_df)
+        return (np.asarray(predicted, dtype=object)[:, None] == self.class_names[None, :]).astype(np.float64)
+
+    def top_k(self, rows, k=3):
+        """Return a list of [{"name", "score"}, ...] rankings, one per input row"""
+        input_df = self.to_frame(rows)
+        if len(input_df) == 0:
+            return []
+
+        if not self.has_proba:
+            # Fallback to single prediction if probabilities are unavailable
+            with metrics.time('predict'):
+                predictions = self.model.predict(input_df)
+            with metrics.time('label_decode'):
+                predictions = self.label_encoder.inverse_transform(predictions)
+            return [[{"name": str(crop), "score": 1.0}] for crop in predictions]
+
+        proba = self.predict_proba(input_df)
+        with metrics.time('label_decode'):
+            indices = top_k_indices(proba, k)
+            names = self.class_names[indices]
+            scores = np.take_along_axis(proba, indices, axis=1)
+            return [
+                [{"name": name, "score": float(score)} for name, score in zip(row_names, row_scores)]
+                for row_names, row_scores in zip(names.tolist(), scores.tolist())
+            ]
+
+    def best(self, proba):
+        """Crop names and probabilities of the top class for each row of a probability matrix"""
+        best = np.asarray(proba).argmax(axis=1)
+        return self.class_names[best], proba[np.arange(len(best)), best]
@@ -0,0 +1,92 @@
+import os
+import numpy as np
+from crop_ranking import FEATURES
+
+# How /recommend orders crops. Each score is computed from one entry's
+# probability and, except for 'probability', its 90-day price forecast
+RECOMMEND_SCORES = {
+    # Probability the crop suits the field times its forecast price
+    'expected_value': lambda entry: entry['probability'] * entry['predicted_price_90d'],
+    # Probability times the forecast change from today's price
+    'expected_gain': lambda entry: entry['probability'] * entry['price_change'],
+    'price': lambda entry: entry['predicted_price_90d'],
+    'probability': lambda entry: entry['probability'],
+}
+RECOMMEND_SCORE = os.getenv('RECOMMEND_SCORE', 'expected_value')
+# Crops less likely than this are left out, so a price-based score can't put
+# an unsuitable but expensive crop first
+RECOMMEND_MIN_PROBABILITY = float(os.getenv('RECOMMEND_MIN_PROBABILITY', '0.01'))
+
+
+def parse_features(data):
+    """The FEATURES values of a request body as floats, or raise ValueError naming the bad ones"""
+    values = []
+    invalid = []
+    for feature in FEATURES:
+        try:
+            value = float(data[feature])
+        except (KeyError, TypeError, ValueError):
+            invalid.append(feature)
+            continue
+        if not np.isfinite(value):
+            invalid.append(feature)
+        values.append(value)
+    if invalid:
+        raise ValueError(f"Missing or invalid features: {', '.join(invalid)}")
+    return values
+
+
+def parse_ranking_options(k, min_probability):
+    """A request's k and min_probability, or raise ValueError
+
+    k=0 returns every candidate; a negative k would silently drop the last ones.
+    """
+    try:
+        k = int(k)
+        min_probability = float(min_probability)
+    except (TypeError, ValueError):
+        raise ValueError('k and min_probability must be numbers')
+    if k < 0:
+        raise ValueError('k must be 0 (every crop) or a positive number')
+    if not np.isfinite(min_probability):
+        raise ValueError('min_probability must be a finite number')
+    return k, min_probability
+
+
+def recommend(ranker, price_service, features, lat, lon, score=RECOMMEND_SCORE, k=None,
+              min_probability=RECOMMEND_MIN_PROBABILITY, proba=None):
+    """Crops for one feature vector, with their price forecasts, ranked by score
+
+    Every crop's probability comes from a single predict_proba call (or proba,
+    the row already computed, e.g. by cached_probabilities) and the forecasts
+    of all candidates from a single predict_prices call. Crops without a
+    forecast (no price data, or no price service) get a score of None under
+    price-based scores and are listed after the scored ones, most likely
+    first. Equal scores keep probability order.
+    """
+    score_fn = RECOMMEND_SCORES[score]
+    if proba is None:
+        proba = ranker.probabilities([features])[0]
+    order = np.argsort(-proba, kind='stable')
+    candidates = [i for i in order.tolist() if proba[i] >= min_probability] or order[:1].tolist()
+    names = ranker.class_names[candidates].tolist()
+
+    forecasts = {}
+    if price_service is not None:
+        for forecast in price_service.predict_prices(names, lat, lon):
+            forecasts[forecast['crop_name']] = forecast
+
+    entries = []
+    for name, index in zip(names, candidates):
+        entry = {'name': name, 'probability': float(proba[index])}
+        forecast = forecasts.get(name)
+        if forecast is not None:
+            entry.update((key, value) for key, value in forecast.items() if key != 'crop_name')
+        if forecast is not None or score == 'probability':
+            entry['score'] = round(float(score_fn(entry)), 4)
+        else:
+            entry['score'] = None
+        entries.append(entry)
+
+    entries.sort(key=lambda entry: (entry['score'] is None, -(entry['score'] or 0)))
+    return entries[:k] if k else entries
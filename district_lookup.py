@@ -0,0 +1,121 @@
+from bisect import bisect_left
+import numpy as np
+
+# Default district from the price dataset, used outside every known region
+DEFAULT_DISTRICT = "Adilabad"
+
+# (name, lat_min, lat_max, lon_min, lon_max), bounds inclusive.
+# Boxes overlap; where they do, the first box in this list wins.
+REGION_BOXES = [
+    ("Delhi", 28.4, 28.9, 76.8, 77.4),
+    ("Mumbai", 18.8, 19.3, 72.7, 73.2),
+    ("Bangalore", 12.8, 13.2, 77.4, 77.8),
+    ("Chennai", 12.8, 13.2, 80.1, 80.4),
+    ("Kolkata", 22.4, 22.8, 88.2, 88.6),
+    ("Hyderabad", 17.2, 17.6, 78.2, 78.8),
+    ("Punjab", 30.5, 31.5, 74.5, 76.5),
+    ("Gujarat", 22.0, 24.5, 68.0, 74.5),
+    ("Tamil Nadu", 8.0, 13.5, 76.0, 80.5),
+    ("Karnataka", 11.5, 18.5, 74.0, 78.5),
+    ("Maharashtra", 15.5, 22.0, 72.5, 80.5),
+    ("Andhra Pradesh", 12.0, 19.5, 76.5, 84.5),
+    ("Telangana", 15.5, 19.5, 77.0, 81.0),
+    ("West Bengal", 21.5, 27.0, 85.5, 89.5),
+    ("Uttar Pradesh", 24.0, 31.0, 77.0, 84.5),
+    ("Madhya Pradesh", 21.0, 26.5, 74.0, 82.5),
+    ("Rajasthan", 23.0, 30.5, 69.5, 78.5),
+    ("Haryana", 27.5, 30.5, 74.5, 77.5),
+    ("Kerala", 8.0, 12.5, 74.5, 77.5),
+    ("Odisha", 17.5, 22.5, 81.0, 87.5),
+    ("Assam", 24.0, 28.0, 89.5, 96.5),
+    ("Bihar", 24.0, 27.5, 83.0, 88.5),
+    ("Jharkhand", 21.5, 25.0, 83.0, 87.5),
+    ("Chhattisgarh", 17.5, 24.0, 80.0, 84.5),
+    ("Uttarakhand", 28.5, 31.5, 77.5, 81.5),
+    ("Himachal Pradesh", 30.5, 33.5, 75.5, 79.5),
+    ("Jammu and Kashmir", 32.0, 37.0, 73.5, 80.5),
+    ("Ladakh", 32.0, 37.0, 75.5, 80.5),
+    ("Goa", 14.5, 15.8, 73.5, 74.5),
+    ("Sikkim", 27.0, 28.5, 88.0, 89.0),
+    ("Arunachal Pradesh", 26.0, 29.5, 91.5, 97.5),
+    ("Nagaland", 25.0, 27.5, 93.0, 95.5),
+    ("Manipur", 23.5, 25.5, 93.0, 94.5),
+    ("Mizoram", 22.0, 24.5, 92.0, 93.5),
+    ("Tripura", 22.5, 24.5, 91.0, 92.5),
+    ("Meghalaya", 25.0, 26.5, 89.5, 92.5),
+    ("Andaman and Nicobar", 6.0, 14.0, 92.0, 94.0),
+    ("Lakshadweep", 8.0, 12.0, 71.0, 74.0),
+    ("Puducherry", 11.5, 12.5, 79.5, 80.0),
+    ("Dadra and Nagar Haveli", 20.0, 20.5, 72.5, 73.5),
+    ("Daman and Diu", 20.0, 20.5, 72.5, 73.5),
+    ("Chandigarh", 30.5, 31.0, 76.5, 77.0),
+]
+
+
+def _axis_membership(edges, lows, highs):
+    """Boolean [box, slot] table of which boxes cover each slot along one axis
+
+    Slot 2*i + 1 is the coordinate edges[i] itself, slot 2*i is the open
+    interval just below it, and slot 2*len(edges) is everything above the last edge.
+    """
+    n_slots = 2 * len(edges) + 1
+    inside = np.zeros((len(lows), n_slots), dtype=bool)
+    lows = np.asarray(lows)[:, None]
+    highs = np.asarray(highs)[:, None]
+    inside[:, 1::2] = (lows <= edges) & (edges <= highs)
+    # Open interval (edges[i - 1], edges[i]) is covered when both ends are
+    inside[:, 2:-1:2] = (lows <= edges[:-1]) & (edges[1:] <= highs)
+    return inside
+
+
+def _slot(edges, value):
+    position = bisect_left(edges, value)
+    return 2 * position + (position < len(edges) and edges[position] == value)
+
+
+def _slots(edges, values):
+    positions = np.searchsorted(edges, values, side='left')
+    on_edge = edges[np.minimum(positions, len(edges) - 1)] == values
+    return 2 * positions + on_edge
+
+
+class DistrictGrid:
+    """Lookup table over the region boxes, split at every box edge
+
+    Resolving a point takes one binary search per axis plus a table read, and
+    gives the same answer as checking the boxes in order.
+    """
+
+    def __init__(self, boxes=REGION_BOXES, default=DEFAULT_DISTRICT):
+        names, lat_lows, lat_highs, lon_lows, lon_highs = zip(*boxes)
+        self.names = np.array((default,) + names, dtype=object)
+        self.lat_edges = np.unique(lat_lows + lat_highs)
+        self.lon_edges = np.unique(lon_lows + lon_highs)
+
+        lat_inside = _axis_membership(self.lat_edges, lat_lows, lat_highs)
+        lon_inside = _axis_membership(self.lon_edges, lon_lows, lon_highs)
+
+        # Code 0 is the default; paint boxes last-to-first so earlier boxes win overlaps
+        self.table = np.zeros((lat_inside.shape[1], lon_inside.shape[1]), dtype=np.int16)
+        for code in range(len(boxes), 0, -1):
+            self.table[np.ix_(lat_inside[code - 1], lon_inside[code - 1])] = code
+
+        # Plain-Python copies for single lookups, where NumPy call overhead dominates
+        self._lat_edge_list = self.lat_edges.tolist()
+        self._lon_edge_list = self.lon_edges.tolist()
+        self._name_rows = self.names[self.table].tolist()
+
+    def lookup_codes(self, lats, lons):
+        """Region codes for arrays of coordinates (0 means the default district)"""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        return self.table[_slots(self.lat_edges, lats), _slots(self.lon_edges, lons)]
+
+    def lookup(self, lats, lons):
+        """District names for arrays of coordinates"""
+        return self.names[self.lookup_codes(lats, lons)]
+
+    def lookup_one(self, lat, lon):
+        """District name for a single coordinate pair"""
+        row = self._name_rows[_slot(self._lat_edge_list, float(lat))]
+        return row[_slot(self._lon_edge_list, float(lon))]
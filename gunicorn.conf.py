@@ -0,0 +1,49 @@
+import gc
+import os
+from process_memory import memory_usage
+
+# Threaded workers: an open chat stream holds one thread, not a whole process.
+# chat_proxy caps streams per worker (CHAT_MAX_STREAMS) below GUNICORN_THREADS,
+# so /predict and the other routes always have free threads.
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# Keep idle keep-alive connections short so they don't hold threads
+keepalive = 5
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+# Load the app (models, price index, caches) once in the master and fork the
+# workers from it, so they share those pages copy-on-write instead of each
+# holding a copy. Set GUNICORN_PRELOAD=0 to load the app in every worker.
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+
+
+def warm_up(app):
+    """Serve one request per route in the master, so lazy imports and first-call
+    setup happen once before the fork instead of once in every worker"""
+    client = app.test_client()
+    features = {'N': 90, 'temperature': 25, 'humidity': 80, 'ph': 6.5, 'rainfall': 200}
+    client.post('/predict-top3', json=features)
+    client.post('/predict-prices', json={'crops': ['rice', 'maize'], 'latitude': 28.6, 'longitude': 77.2})
+    client.post('/recommend', json={**features, 'latitude': 28.6, 'longitude': 77.2})
+
+
+def when_ready(server):
+    if preload_app:
+        try:
+            warm_up(server.app.wsgi())
+        except Exception as e:
+            server.log.warning("Warm-up before fork failed: %s", e)
+        # Objects loaded so far are permanent; keeping them out of the cyclic GC
+        # stops collections in the workers from writing to (and un-sharing) their pages
+        gc.collect()
+        gc.freeze()
+    usage = memory_usage()
+    if usage:
+        server.log.info("Master ready: rss %.1f MB", usage['rss_kb'] / 1024)
+
+
+def post_worker_init(worker):
+    usage = memory_usage()
+    if usage:
+        worker.log.info("Worker %s ready: rss %.1f MB, unique %.1f MB", worker.pid, usage['rss_kb'] / 1024, usage['uss_kb'] / 1024)
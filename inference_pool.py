@@ -0,0 +1,117 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from batch_prediction import score_chunk
+from crop_recommendation import recommend
+
+# Inference processes behind the ASGI app; defaults to one per CPU
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', str(os.cpu_count() or 1)))
+
+# Loaded once in each pool process by _load_models
+_registry = None
+_price_service = None
+# The model version serving the task in progress, set by _call
+_bundle = None
+
+
+def _load_models():
+    global _registry, _price_service
+    from model_registry import ModelRegistry
+    from price_prediction_service import PricePredictionService
+
+    # Each process follows MODEL_DIR itself; one task runs at a time, so no batching
+    _registry = ModelRegistry(batching=False)
+    bundle = _registry.load_initial()
+    _price_service = PricePredictionService(bundle.price_model, bundle.version)
+    _price_service.follow(_registry)
+
+
+def _warm_up():
+    # Hold the process briefly so concurrent warm-up calls land on different processes
+    time.sleep(0.2)
+    return os.getpid(), _registry.active.version
+
+
+def _call(fn, args):
+    # Pin the model version for the whole task and report it with the result
+    global _bundle
+    _bundle = _registry.current()
+    return _bundle.version, fn(*args)
+
+
+def predict_crops(rows):
+    return _bundle.crop_ranker.predict(rows)
+
+
+def top_k(rows, k):
+    return _bundle.crop_ranker.top_k(rows, k)
+
+
+def score_rows(rows, offset):
+    return score_chunk(_bundle.crop_ranker, rows, offset)
+
+
+def predict_prices(crops, lat, lon):
+    return _price_service.predict_prices(crops, lat, lon)
+
+
+def predict_price_series(crops, lat, lon, horizons):
+    return _price_service.predict_price_series(crops, lat, lon, horizons)
+
+
+def recommend_crops(features, lat, lon, score, k, min_probability):
+    return recommend(_bundle.crop_ranker, _price_service, features, lat, lon, score, k, min_probability)
+
+
+class InferencePool:
+    """Process pool for CPU-bound model calls, awaited from the event loop
+
+    Every process loads the crop model and the price service once, when the
+    pool starts, so requests never pay for loading and inference runs in
+    parallel across cores instead of contending for one GIL. Processes pick
+    up newly published model versions on their own; on_version_change
+    callbacks run in the event loop when results start arriving from another
+    version.
+    """
+
+    def __init__(self, workers=INFERENCE_WORKERS):
+        self.workers = max(1, workers)
+        self._executor = None
+        self._callbacks = []
+        self.pids = []
+        self.model_version = None
+
+    def on_version_change(self, callback):
+        self._callbacks.append(callback)
+
+    def start(self):
+        # spawn: children start clean instead of inheriting the event loop and its threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_load_models,
+        )
+        futures = [self._executor.submit(_warm_up) for _ in range(self.workers)]
+        ready = [future.result() for future in futures]
+        self.pids = sorted({pid for pid, _ in ready})
+        self.model_version = ready[0][1]
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        version, result = await loop.run_in_executor(self._executor, _call, fn, args)
+        if version != self.model_version:
+            # While processes switch over one by one this can fire a few times
+            self.model_version = version
+            for callback in self._callbacks:
+                callback(version)
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        return {'workers': self.workers, 'pids': self.pids, 'model_version': self.model_version}
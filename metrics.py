@@ -0,0 +1,193 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Set METRICS=0 to turn every timer and counter into a no-op
+METRICS_ENABLED = os.getenv('METRICS', '1') != '0'
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+# family: (metric name, type, help, label names)
+FAMILIES = {
+    'stage': ('agro_stage_duration_seconds', 'histogram', "Time spent in each hot-path stage", ('stage',)),
+    'upstream': ('agro_upstream_request_duration_seconds', 'histogram', "Duration of calls to upstream services", ('upstream',)),
+    'request': ('agro_http_request_duration_seconds', 'histogram', "Time to build each response, by route", ('route',)),
+    'response': ('agro_http_responses_total', 'counter', "Responses by route and status code", ('route', 'status')),
+    'error': ('agro_errors_total', 'counter', "Errors caught and handled, by stage", ('stage',)),
+    'fallback': ('agro_fallbacks_total', 'counter', "Answers built from fallback values, by kind", ('kind',)),
+}
+
+
+class Histogram:
+    """Thread-safe counts per upper bound, plus an overflow bucket"""
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            labels = [str(bound) for bound in self.bounds] + ['+Inf']
+            return {
+                'buckets': dict(zip(labels, self.counts)),
+                'count': self.total,
+                'mean': round(self.sum / self.total, 3) if self.total else 0,
+            }
+
+    def cumulative(self):
+        """([(bound, observations <= bound), ..., ('+Inf', total)], sum), as Prometheus reports them"""
+        with self._lock:
+            counts, total, value_sum = list(self.counts), self.total, self.sum
+        running = 0
+        buckets = []
+        for bound, count in zip(self.bounds + ['+Inf'], counts):
+            running += count
+            buckets.append((bound, running))
+        return buckets, value_sum
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _label_values(labels):
+    return labels if isinstance(labels, tuple) else (labels,)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Process-wide latency histograms and event counters, rendered as Prometheus text
+
+    Each observation is a bisect and an uncontended lock, cheap enough to stay
+    on in production. Series carry a pid label: with several gunicorn workers,
+    each scrape of /metrics reaches one worker, so sum over pid when querying.
+    A forked worker starts from zero instead of inheriting the master's counts.
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED, buckets=LATENCY_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            self._histograms = {}
+            self._counters = {}
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    def histogram(self, family, labels):
+        key = (family, _label_values(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None or self._pid != os.getpid():
+            with self._lock:
+                self._check_fork()
+                histogram = self._histograms.setdefault(key, Histogram(self.buckets))
+        return histogram
+
+    def time(self, stage, family='stage'):
+        """Context manager recording how long its block took under stage"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self.histogram(family, stage))
+
+    def observe(self, family, labels, seconds):
+        if self.enabled:
+            self.histogram(family, labels).observe(seconds)
+
+    def count(self, family, labels, amount=1):
+        if not self.enabled:
+            return
+        key = (family, _label_values(labels))
+        with self._lock:
+            self._check_fork()
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def error(self, stage):
+        self.count('error', stage)
+
+    def fallback(self, kind):
+        self.count('fallback', kind)
+
+    def render(self):
+        """Every series in the Prometheus text exposition format"""
+        with self._lock:
+            self._check_fork()
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+        pid = (('pid', os.getpid()),)
+        lines = []
+        for family, (name, kind, help_text, label_names) in FAMILIES.items():
+            if kind == 'histogram':
+                series = sorted((labels, h) for (f, labels), h in histograms.items() if f == family)
+            else:
+                series = sorted((labels, value) for (f, labels), value in counters.items() if f == family)
+            if not series:
+                continue
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in series:
+                if kind == 'counter':
+                    lines.append(f'{name}{_format_labels(label_names, labels, pid)} {value}')
+                    continue
+                buckets, value_sum = value.cumulative()
+                for bound, count in buckets:
+                    bucket_labels = _format_labels(label_names, labels, pid + (('le', bound),))
+                    lines.append(f'{name}_bucket{bucket_labels} {count}')
+                lines.append(f'{name}_sum{_format_labels(label_names, labels, pid)} {_format_value(value_sum)}')
+                lines.append(f'{name}_count{_format_labels(label_names, labels, pid)} {buckets[-1][1]}')
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by every module of the process
+metrics = Metrics()
@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+import pandas as pd
+from metrics import Histogram
+
+# Requests arriving within this window of the oldest queued one share a model call.
+# The window only applies under concurrency; a lone request is scored immediately.
+# 0 still coalesces whatever queued up while the previous batch was running.
+BATCH_WINDOW_MS = float(os.getenv('PREDICT_BATCH_WINDOW_MS', '2'))
+# A batch is dispatched as soon as it holds this many rows
+BATCH_MAX_ROWS = int(os.getenv('PREDICT_BATCH_MAX_ROWS', '64'))
+# Set PREDICT_BATCHING=0 to call the model directly from each request thread
+USE_BATCHING = os.getenv('PREDICT_BATCHING', '1') != '0'
+
+
+def power_of_two_bounds(limit):
+    """1, 2, 4, ... up to the first power of two >= limit"""
+    bounds = [1]
+    while bounds[-1] < limit:
+        bounds.append(bounds[-1] * 2)
+    return bounds
+
+
+class MicroBatcher:
+    """Coalesces concurrent model calls into one call over the stacked rows
+
+    submit() queues a caller's (n, features) matrix and blocks until its rows
+    come back. A background thread takes the oldest request, waits until
+    window seconds after it arrived or until max_rows rows are queued,
+    runs predict once on all of them and hands each caller its own slice.
+    A request that arrives while no other request is in flight is scored
+    directly in the caller's thread, so batching adds no latency at low load.
+    If a batch fails, its requests are retried one by one, so a bad row
+    only fails the request that sent it. After close(), queued requests are
+    still answered and new ones are scored in the caller's thread.
+    """
+
+    def __init__(self, predict, window=BATCH_WINDOW_MS / 1000, max_rows=BATCH_MAX_ROWS):
+        self.predict = predict
+        self.window = window
+        self.max_rows = max(1, max_rows)
+        self._queue = deque()
+        self._queued_rows = 0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.requests = 0
+        self.batch_sizes = Histogram(power_of_two_bounds(self.max_rows))
+        self.queue_depths = Histogram(power_of_two_bounds(self.max_rows))
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Requests queued in the parent belong to threads that don't exist here
+            self._queue.clear()
+            self._queued_rows = 0
+            self._in_flight = 0
+            self._pid = os.getpid()
+            self._thread = None
+
+    def _ensure_thread(self):
+        # Started on the first concurrent request, so a preloading master that only
+        # serves warm-up requests never forks with the thread running
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+            self._thread.start()
+
+    def submit(self, rows):
+        """Model output for rows, computed together with concurrent submissions"""
+        rows = np.atleast_2d(np.asarray(rows, dtype=np.float64))
+        if len(rows) >= self.max_rows:
+            # Already a full batch on its own
+            self.batch_sizes.observe(len(rows))
+            return self.predict(rows)
+
+        future = None
+        with self._cond:
+            self._check_fork()
+            self._in_flight += 1
+            self.requests += 1
+            if self._in_flight > 1 and not self._closed:
+                self._ensure_thread()
+                future = Future()
+                self._queue.append((rows, future, time.monotonic() + self.window))
+                self._queued_rows += len(rows)
+                self._cond.notify()
+            self.queue_depths.observe(len(self._queue))
+        try:
+            if future is None:
+                # Nothing else in flight: skip the hand-off to the batching thread
+                self.batch_sizes.observe(len(rows))
+                return self.predict(rows)
+            return future.result()
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._queue:
+                if self._closed:
+                    return None, 0
+                self._cond.wait()
+            deadline = self._queue[0][2]
+            while self._queued_rows < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = [self._queue.popleft()]
+            rows = len(batch[0][0])
+            while self._queue and rows + len(self._queue[0][0]) <= self.max_rows:
+                batch.append(self._queue.popleft())
+                rows += len(batch[-1][0])
+            self._queued_rows -= rows
+            return batch, rows
+
+    def _run(self):
+        while True:
+            batch, rows = self._take_batch()
+            if batch is None:
+                return
+            self.batch_sizes.observe(rows)
+            try:
+                output = self.predict(np.concatenate([item[0] for item in batch]))
+            except Exception:
+                for item_rows, future, _ in batch:
+                    self._run_alone(item_rows, future)
+                continue
+            offset = 0
+            for item_rows, future, _ in batch:
+                future.set_result(output[offset:offset + len(item_rows)])
+                offset += len(item_rows)
+
+    def close(self):
+        """Stop the batching thread once the queue drains, e.g. when the model is replaced"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _run_alone(self, rows, future):
+        try:
+            future.set_result(self.predict(rows))
+        except Exception as e:
+            future.set_exception(e)
+
+    def stats(self):
+        with self._cond:
+            queued = len(self._queue)
+        return {
+            'window_ms': self.window * 1000,
+            'max_rows': self.max_rows,
+            'queue_depth': queued,
+            'requests': self.requests,
+            'batches': self.batch_sizes.total,
+            'batch_size': self.batch_sizes.snapshot(),
+            'queue_depth_on_submit': self.queue_depths.snapshot(),
+        }
+
+
+def make_prediction_batcher(model, feature_names):
+    """A MicroBatcher over model.predict_proba, or None if batching is off or unsupported"""
+    if not USE_BATCHING or model is None or not hasattr(model, 'predict_proba'):
+        return None
+
+    def predict_proba(matrix):
+        return model.predict_proba(pd.DataFrame(matrix, columns=feature_names))
+
+    return MicroBatcher(predict_proba)
@@ -0,0 +1,331 @@
+import os
+import sys
+import tempfile
+import joblib
+import numpy as np
+import pandas as pd
+from compiled_models import (
+    CROP_MODEL_ARRAYS, PRICE_MODEL_ARRAYS, ForestClassifier, LabelTable, ObliviousBoostingRegressor,
+)
+from crop_ranking import FEATURES
+from price_store import file_checksum
+
+# Largest allowed difference between the original and exported models
+PROBA_TOLERANCE = 1e-12
+PRICE_TOLERANCE = 1e-6
+
+
+def _save(path, arrays):
+    tmp_path = f'{path}.tmp{os.getpid()}.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def export_forest(model, label_encoder, source_sha256, encoder_sha256):
+    """Concatenate every tree of a fitted RandomForestClassifier into flat node arrays"""
+    roots, features, thresholds, lefts, rights, probas = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left < 0
+        node_ids = np.arange(tree.node_count)
+        # Leaves loop back to themselves so every row can take the same number of steps
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+        # Same normalisation as DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :]
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        probas.append(value / normalizer)
+        roots.append(offset)
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    index_dtype = np.int32 if offset < np.iinfo(np.int32).max else np.int64
+    return {
+        'source_sha256': np.array(source_sha256),
+        'encoder_sha256': np.array(encoder_sha256),
+        'classes': np.asarray(model.classes_),
+        'label_classes': np.asarray(label_encoder.classes_, dtype=str),
+        'feature_names': np.array(getattr(model, 'feature_names_in_', FEATURES), dtype=str),
+        'roots': np.array(roots, dtype=index_dtype),
+        'feature': np.concatenate(features).astype(np.int32),
+        'threshold': np.concatenate(thresholds),
+        'left': np.concatenate(lefts).astype(index_dtype),
+        'right': np.concatenate(rights).astype(index_dtype),
+        'proba': np.concatenate(probas),
+        'max_depth': np.int64(max_depth),
+    }
+
+
+def _catboost_reference(model, categories):
+    """CatBoost's standalone Python applier for the model, as a namespace
+
+    CatBoost hashes category strings with a function the saved model doesn't
+    include, so the export is given every category value the app can send and
+    records their hashes alongside the trees and CTR tables.
+    """
+    columns = model.feature_names_
+    cat_indices = set(model.get_cat_feature_indices())
+    n_rows = max(len(values) for values in categories.values())
+    frame = {}
+    for i, name in enumerate(columns):
+        if i in cat_indices:
+            values = list(categories[name])
+            frame[name] = values + values[:1] * (n_rows - len(values))
+        else:
+            frame[name] = [0.0] * n_rows
+    from catboost import Pool
+
+    pool = Pool(pd.DataFrame(frame, columns=columns), cat_features=sorted(cat_indices))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'catboost_model.py')
+        model.save_model(path, format='python', pool=pool)
+        with open(path) as f:
+            source = f.read()
+    namespace = {}
+    exec(compile(source, path, 'exec'), namespace)
+    return namespace
+
+
+def _ctr_value(ctr, table, bucket):
+    """One CTR value for a hash bucket (None if the hash was never seen), as calc_ctrs computes it"""
+    if bucket is None:
+        return ctr.calc(0, 0)
+    ctr_type = ctr.base_ctr_type
+    if ctr_type in ("BinarizedTargetMeanValue", "FloatTargetMeanValue"):
+        history = table.ctr_mean_history[bucket]
+        return ctr.calc(history.sum, history.count)
+    if ctr_type in ("Counter", "FeatureFreq"):
+        return ctr.calc(table.ctr_total[bucket], table.counter_denominator)
+    history = table.ctr_total
+    n_classes = table.target_classes_count
+    counts = history[bucket * n_classes:(bucket + 1) * n_classes]
+    if ctr_type == "Buckets":
+        return ctr.calc(counts[ctr.target_border_idx], sum(counts))
+    if n_classes > 2:
+        good = sum(counts[ctr.target_border_idx + 1:])
+        return ctr.calc(good, sum(counts))
+    return ctr.calc(counts[1], counts[0] + counts[1])
+
+
+def _to_uint64(value):
+    return np.uint64(int(value) & 0xFFFFFFFFFFFFFFFF)
+
+
+def export_catboost(model, categories, source_sha256):
+    """Flatten a CatBoost regressor with oblivious trees and categorical CTRs"""
+    namespace = _catboost_reference(model, categories)
+    reference = namespace['catboost_model']
+    if reference.dimension != 1:
+        raise ValueError("Only single-output CatBoost models can be exported")
+    if reference.one_hot_cat_feature_index:
+        raise ValueError("One-hot encoded categorical features are not supported")
+
+    cat_indices = model.get_cat_feature_indices()
+    float_indices = [i for i in range(len(model.feature_names_)) if i not in set(cat_indices)]
+
+    # Binary features: one per float feature with borders, then one per CTR (see apply_catboost_model_multi)
+    float_bin_index = []
+    float_borders = []
+    binary_index = 0
+    for borders in reference.float_feature_borders:
+        float_bin_index.append(binary_index if borders else -1)
+        float_borders.append(np.asarray(borders, dtype=np.float32))
+        binary_index += 1 if borders else 0
+
+    projection_cats, projection_bins = [], []
+    ctr_projection, ctr_bin_index, ctr_default, ctr_keys, ctr_values = [], [], [], [], []
+    ctr_index = 0
+    model_ctrs = getattr(reference, 'model_ctrs', None)
+    learn_ctrs = model_ctrs.ctr_data.learn_ctrs if model_ctrs is not None else {}
+    for p, compressed in enumerate(model_ctrs.compressed_model_ctrs if model_ctrs is not None else []):
+        projection = compressed.projection
+        projection_cats.append(np.asarray(projection.transposed_cat_feature_indexes, dtype=np.int32))
+        projection_bins.append(np.array(
+            [(term.bin_index, term.value, term.check_value_equal) for term in projection.binarized_indexes],
+            dtype=np.int32,
+        ).reshape(-1, 3))
+        for ctr in compressed.model_ctrs:
+            table = learn_ctrs[ctr.base_hash]
+            borders = reference.ctr_feature_borders[ctr_index]
+            # The tree only sees how many CTR borders a value exceeds, so store that per hash
+            items = sorted((_to_uint64(h), bucket) for h, bucket in table.index_hash_viewer.items())
+            ctr_projection.append(p)
+            ctr_bin_index.append(binary_index)
+            ctr_default.append(sum(_ctr_value(ctr, table, None) > border for border in borders))
+            ctr_keys.append(np.array([h for h, _ in items], dtype=np.uint64))
+            ctr_values.append(np.array(
+                [sum(_ctr_value(ctr, table, bucket) > border for border in borders) for _, bucket in items],
+                dtype=np.int32,
+            ))
+            ctr_index += 1
+            binary_index += 1
+    if binary_index != reference.binary_feature_count:
+        raise ValueError(f"Expected {reference.binary_feature_count} binary features, built {binary_index}")
+
+    depths = np.asarray(reference.tree_depth, dtype=np.int64)
+    if (depths == 0).any():
+        raise ValueError("Trees without splits are not supported")
+    split_offsets = np.concatenate([[0], np.cumsum(depths)])
+    leaf_offsets = np.concatenate([[0], np.cumsum(1 << depths)])
+    # Bit position of each split inside its tree's leaf index
+    split_weight = np.concatenate([1 << np.arange(depth) for depth in depths])
+
+    hashes = namespace['cat_features_hashes']
+    names = sorted(hashes)
+
+    def offsets(parts):
+        return np.concatenate([[0], np.cumsum([len(part) for part in parts])]).astype(np.int64)
+
+    return {
+        'source_sha256': np.array(source_sha256),
+        'feature_names': np.array(model.feature_names_, dtype=str),
+        'cat_feature_indices': np.asarray(cat_indices, dtype=np.int64),
+        'float_feature_indices': np.asarray(float_indices, dtype=np.int64),
+        'binary_feature_count': np.int64(reference.binary_feature_count),
+        'float_bin_index': np.asarray(float_bin_index, dtype=np.int64),
+        'float_borders': np.concatenate(float_borders) if float_borders else np.zeros(0, np.float32),
+        'float_border_offsets': offsets(float_borders),
+        'category_names': np.array(names, dtype=str),
+        'category_hashes': np.array([int(hashes[name]) for name in names], dtype=np.int64),
+        # Hash the applier gives values it has no mapping for; it matches no CTR table entry
+        'unknown_hash': np.int64(0x7FFFFFFF),
+        'projection_cats': np.concatenate(projection_cats) if projection_cats else np.zeros(0, np.int32),
+        'projection_cat_offsets': offsets(projection_cats),
+        'projection_bins': np.concatenate(projection_bins) if projection_bins else np.zeros((0, 3), np.int32),
+        'projection_bin_offsets': offsets(projection_bins),
+        'ctr_projection': np.asarray(ctr_projection, dtype=np.int64),
+        'ctr_bin_index': np.asarray(ctr_bin_index, dtype=np.int64),
+        'ctr_default': np.asarray(ctr_default, dtype=np.int32),
+        'ctr_keys': np.concatenate(ctr_keys) if ctr_keys else np.zeros(0, np.uint64),
+        'ctr_values': np.concatenate(ctr_values) if ctr_values else np.zeros(0, np.int32),
+        'ctr_offsets': offsets(ctr_keys),
+        'split_feature': np.asarray(reference.tree_split_feature_index, dtype=np.int64),
+        'split_border': np.asarray(reference.tree_split_border, dtype=np.int32),
+        'split_xor': np.asarray(reference.tree_split_xor_mask, dtype=np.int32),
+        'split_weight': split_weight.astype(np.int64),
+        'tree_split_offsets': split_offsets.astype(np.int64),
+        'leaf_offsets': leaf_offsets.astype(np.int64),
+        'leaf_values': np.asarray([values[0] for values in reference.leaf_values], dtype=np.float64),
+        'scale': np.float64(reference.scale),
+        'bias': np.float64(reference.biases[0]),
+    }
+
+
+def crop_sample(n_rows=20000, seed=0):
+    """Random crop-model inputs spanning the training ranges"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'N': rng.uniform(0, 140, n_rows),
+        'temperature': rng.uniform(5, 45, n_rows),
+        'humidity': rng.uniform(10, 100, n_rows),
+        'ph': rng.uniform(3.5, 10, n_rows),
+        'rainfall': rng.uniform(20, 300, n_rows),
+    })[FEATURES]
+
+
+def price_sample(crops, districts, n_rows=20000, seed=0):
+    """Random price-model inputs over the given crop and district names"""
+    rng = np.random.default_rng(seed)
+    day_of_year = rng.integers(1, 367, n_rows)
+    return pd.DataFrame({
+        'crop_id': rng.choice(np.asarray(crops, dtype=object), n_rows),
+        'district_id': rng.choice(np.asarray(districts, dtype=object), n_rows),
+        'month': np.minimum((day_of_year - 1) // 31 + 1, 12),
+        'day_of_year': day_of_year,
+        'price_lag_90d': np.round(rng.uniform(0, 15000, n_rows), 2),
+        'price_lag_365d': np.round(rng.uniform(0, 15000, n_rows), 2),
+    })
+
+
+def unseen_price_sample(categories, n_rows=5000, seed=1):
+    """Price-model inputs where the crop, the district or both are names the model has never seen
+
+    Besides made-up names, these include near misses of real ones (case, spacing)
+    and strings a missing value can turn into.
+    """
+    rng = np.random.default_rng(seed)
+    sample = price_sample(categories['crop_id'], categories['district_id'], n_rows, seed)
+    for column, made_up in (('crop_id', 'Unknown crop'), ('district_id', 'Unknown district')):
+        known = list(categories[column])[:3]
+        unseen = [made_up, '', 'nan', 'None', '0'] + [name.upper() for name in known] + [f' {name}' for name in known]
+        sample[column] = sample[column].astype(object)
+        replace = rng.random(n_rows) < 0.6
+        sample.loc[replace, column] = rng.choice(np.asarray(unseen, dtype=object), replace.sum())
+    # Rows where neither was replaced get an unseen crop, so every row has one
+    both_known = sample['crop_id'].isin(categories['crop_id']) & sample['district_id'].isin(categories['district_id'])
+    sample.loc[both_known, 'crop_id'] = 'Unknown crop'
+    return sample
+
+
+def price_categories():
+    """Every crop and district name the price service can send to the model"""
+    from district_lookup import DEFAULT_DISTRICT, REGION_BOXES
+    from price_store import load_price_columns
+    from process_prices_simple import CROP_MAPPING
+
+    columns = load_price_columns()
+    crops = sorted(set(columns.crops) | set(CROP_MAPPING.values()))
+    districts = sorted(set(columns.districts) | {box[0] for box in REGION_BOXES} | {DEFAULT_DISTRICT})
+    return {'crop_id': crops, 'district_id': districts}
+
+
+def export_crop_model(model_path='crop_model.pkl', encoder_path='label_encoder.pkl', arrays_path=CROP_MODEL_ARRAYS):
+    model = joblib.load(model_path)
+    label_encoder = joblib.load(encoder_path)
+    arrays = export_forest(model, label_encoder, file_checksum(model_path), file_checksum(encoder_path))
+
+    compiled = ForestClassifier(
+        arrays['classes'], arrays['feature_names'].tolist(), arrays['roots'], arrays['feature'],
+        arrays['threshold'], arrays['left'], arrays['right'], arrays['proba'], arrays['max_depth'],
+    )
+    sample = crop_sample()
+    difference = np.abs(compiled.predict_proba(sample) - model.predict_proba(sample)).max()
+    labels_match = (LabelTable(arrays['label_classes']).inverse_transform(compiled.predict(sample))
+                    == label_encoder.inverse_transform(model.predict(sample))).all()
+    print(f"{model_path}: max |proba difference| {difference:.3g}, labels match: {labels_match}")
+    if difference > PROBA_TOLERANCE or not labels_match:
+        raise ValueError(f"Exported {model_path} does not match the original model")
+    _save(arrays_path, arrays)
+    print(f"Saved {arrays_path} ({len(arrays['feature'])} nodes in {len(arrays['roots'])} trees)")
+
+
+def export_price_model(model_path='price_model.pkl', arrays_path=PRICE_MODEL_ARRAYS):
+    model = joblib.load(model_path)
+    categories = price_categories()
+    arrays = export_catboost(model, categories, file_checksum(model_path))
+
+    compiled = ObliviousBoostingRegressor(arrays)
+    sample = price_sample(categories['crop_id'], categories['district_id'])
+    expected = model.predict(sample)
+    difference = np.abs(compiled.predict(sample) - expected).max()
+    print(f"{model_path}: max |price difference| {difference:.3g} over {len(sample)} rows")
+    if difference > PRICE_TOLERANCE * max(1.0, np.abs(expected).max()):
+        raise ValueError(f"Exported {model_path} does not match the original model")
+
+    # Unseen names all get unknown_hash, which is only right if CatBoost treats them alike.
+    # If not, the server keeps the pickle around for those rows (see load_price_model)
+    unseen = unseen_price_sample(categories)
+    expected = model.predict(unseen)
+    difference = np.abs(compiled.predict(unseen) - expected).max()
+    exact = bool(difference <= PRICE_TOLERANCE * max(1.0, np.abs(expected).max()))
+    print(f"{model_path}: max |price difference| {difference:.3g} over {len(unseen)} rows with unseen names"
+          + ("" if exact else ", the pickle will score those rows"))
+    arrays['unseen_categories_exact'] = np.bool_(exact)
+    _save(arrays_path, arrays)
+    print(f"Saved {arrays_path} ({len(arrays['tree_split_offsets']) - 1} trees, "
+          f"{len(arrays['ctr_projection'])} CTRs, {len(arrays['category_names'])} category values)")
+
+
+if __name__ == "__main__":
+    # Run after retraining (needs scikit-learn and catboost, the server doesn't).
+    # Optional arguments: "crop" and/or "price" to export only those models.
+    targets = sys.argv[1:] or ['crop', 'price']
+    if 'crop' in targets:
+        export_crop_model()
+    if 'price' in targets:
+        export_price_model()
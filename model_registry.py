@@ -0,0 +1,309 @@
+import argparse
+import os
+import shutil
+import threading
+import time
+import numpy as np
+import pandas as pd
+from compiled_models import load_crop_model, load_price_model
+from crop_ranking import CropRanker, FEATURES
+from micro_batching import make_prediction_batcher
+
+# One subdirectory per model version, e.g. models/v20250101-120000/, each holding
+# crop_model.pkl, label_encoder.pkl and price_model.pkl (plus their .npz exports).
+# The newest complete version is served; without any, the pickles in the repo root.
+MODEL_DIR = os.getenv('MODEL_DIR', 'models')
+# Serve this version instead of following the newest one (e.g. to roll back by hand)
+MODEL_VERSION = os.getenv('MODEL_VERSION') or None
+# How often requests check the directory for a new version; 0 disables hot reload
+MODEL_POLL_SECONDS = float(os.getenv('MODEL_POLL_SECONDS', '30'))
+
+BUNDLED_VERSION = 'bundled'
+MODEL_FILES = ('crop_model.pkl', 'label_encoder.pkl', 'price_model.pkl')
+
+# Feature rows run through a new version before it serves traffic
+WARM_UP_FEATURES = [
+    [90, 25, 80, 6.5, 200],
+    [20, 30, 50, 7.5, 60],
+    [120, 18, 65, 5.5, 110],
+]
+WARM_UP_PRICE_ROWS = pd.DataFrame({
+    'crop_id': ['Rice', 'Maize', 'Unknown crop'],
+    'district_id': ['Adilabad', 'Adilabad', 'Unknown district'],
+    'month': [1, 6, 12],
+    'day_of_year': [15, 160, 350],
+    'price_lag_90d': [2000.0, 1800.0, 0.0],
+    'price_lag_365d': [1900.0, 1700.0, 0.0],
+})
+
+
+class ModelWarmUpError(Exception):
+    """A model version loaded but produced unusable predictions"""
+
+
+def version_dir(version, model_dir=MODEL_DIR):
+    return '.' if version == BUNDLED_VERSION else os.path.join(model_dir, version)
+
+
+def list_versions(model_dir=MODEL_DIR):
+    """Complete version directories, oldest first (names sort by publish time)"""
+    try:
+        entries = os.listdir(model_dir)
+    except OSError:
+        return []
+    return sorted(
+        name for name in entries
+        if not name.startswith('.') and not name.endswith('.tmp')
+        and all(os.path.exists(os.path.join(model_dir, name, filename)) for filename in MODEL_FILES)
+    )
+
+
+def resolve_version(model_dir=MODEL_DIR, pinned=MODEL_VERSION):
+    """The version that should be served: the pinned one, else the newest, else the bundled pickles"""
+    if pinned:
+        return pinned
+    versions = list_versions(model_dir)
+    return versions[-1] if versions else BUNDLED_VERSION
+
+
+def load_price_model_version(version, model_dir=MODEL_DIR):
+    path = version_dir(version, model_dir)
+    return load_price_model(os.path.join(path, 'price_model.pkl'), os.path.join(path, 'price_model.npz'))
+
+
+class ModelBundle:
+    """The crop model, label encoder and price model of one version, served together"""
+
+    def __init__(self, version, model, label_encoder, price_model, batching=True):
+        self.version = version
+        self.model = model
+        self.label_encoder = label_encoder
+        self.price_model = price_model
+        self.batcher = make_prediction_batcher(model, FEATURES) if batching else None
+        self.crop_ranker = CropRanker(model, label_encoder, batcher=self.batcher, version=version)
+        # Price-side state built from price_model, attached by an on_prepare callback
+        self.price_state = None
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, version, model_dir=MODEL_DIR, batching=True):
+        path = version_dir(version, model_dir)
+        model, label_encoder = load_crop_model(
+            os.path.join(path, 'crop_model.pkl'), os.path.join(path, 'label_encoder.pkl'),
+            os.path.join(path, 'crop_model.npz'),
+        )
+        return cls(version, model, label_encoder, load_price_model_version(version, model_dir), batching)
+
+    def warm_up(self):
+        """Run sample predictions through every model, raising ModelWarmUpError if any looks wrong"""
+        try:
+            rankings = self.crop_ranker.top_k(WARM_UP_FEATURES, 3)
+            predicted = self.crop_ranker.predict(WARM_UP_FEATURES)
+            prices = np.asarray(self.price_model.predict(WARM_UP_PRICE_ROWS), dtype=np.float64)
+        except Exception as e:
+            raise ModelWarmUpError(f'{self.version}: sample prediction failed: {e}') from e
+        if len(rankings) != len(WARM_UP_FEATURES) or not all(rankings) or len(predicted) != len(WARM_UP_FEATURES):
+            raise ModelWarmUpError(f'{self.version}: crop model returned {len(rankings)} rankings')
+        scores = [entry['score'] for ranking in rankings for entry in ranking]
+        if not all(0 <= score <= 1 for score in scores) or not all(str(name) for name in predicted):
+            raise ModelWarmUpError(f'{self.version}: crop model returned invalid scores or labels')
+        if prices.shape != (len(WARM_UP_PRICE_ROWS),) or not np.isfinite(prices).all():
+            raise ModelWarmUpError(f'{self.version}: price model returned {prices!r}')
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+
+
+class ModelRegistry:
+    """Serves one ModelBundle at a time and hot-swaps in new versions from MODEL_DIR
+
+    Call current() on every request. At most every poll_seconds it checks the
+    directory; when a different version should be served, a background thread
+    loads and warms it and runs the on_prepare callbacks while requests keep
+    using the active one, then swaps it in with a single assignment and runs
+    the on_swap callbacks. A version that fails to load, warm up or prepare is
+    never swapped in (the active one stays), and isn't retried until its files
+    change. There is no long-lived watcher
+    thread, so a preloading gunicorn master can fork safely.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, pinned=MODEL_VERSION, poll_seconds=MODEL_POLL_SECONDS, batching=True):
+        self.model_dir = model_dir
+        self.pinned = pinned
+        self.poll_seconds = poll_seconds
+        self.batching = batching
+        self.active = None
+        self.failed = {}
+        self.last_error = None
+        self.swaps = 0
+        self._prepare_callbacks = []
+        self._callbacks = []
+        self._loading = threading.Lock()
+        # Guards failed, which the reload thread writes while stats() reads it
+        self._failed_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._next_check = 0.0
+
+    def load_initial(self):
+        """Load and warm the version to serve, synchronously
+
+        If the newest version won't load or warm up, older ones are tried in
+        turn, down to the bundled pickles; a pinned version has no fallback.
+        """
+        if self.pinned:
+            candidates = [self.pinned]
+        else:
+            candidates = list_versions(self.model_dir)[::-1] + [BUNDLED_VERSION]
+        for version in candidates:
+            try:
+                bundle = self._prepare(version)
+            except Exception as e:
+                self._reject(version, self._fingerprint(version), e)
+                print(f"Model version {version} rejected: {e}")
+                if version == candidates[-1]:
+                    raise
+                continue
+            self.active = bundle
+            self._next_check = time.monotonic() + self.poll_seconds
+            return bundle
+
+    def on_prepare(self, callback):
+        """Call callback(bundle) on every new version before it is published
+
+        Use it to attach state built from the bundle's models, so it is served
+        from the same assignment as the models. An exception rejects the version.
+        """
+        self._prepare_callbacks.append(callback)
+
+    def on_swap(self, callback):
+        """Call callback(new_bundle, old_bundle) after every hot swap"""
+        self._callbacks.append(callback)
+
+    def _prepare(self, version):
+        """Load, warm up and prepare a version, ready to publish"""
+        bundle = ModelBundle.load(version, self.model_dir, self.batching)
+        bundle.warm_up()
+        for callback in self._prepare_callbacks:
+            callback(bundle)
+        return bundle
+
+    def _reject(self, version, fingerprint, error):
+        with self._failed_lock:
+            self.failed[version] = {'fingerprint': fingerprint, 'error': str(error)}
+        self.last_error = f'{version}: {error}'
+
+    def current(self):
+        if self._pid != os.getpid():
+            # Forked mid-reload: the loading thread didn't come along, so its locks never free
+            self._loading = threading.Lock()
+            self._failed_lock = threading.Lock()
+            self._pid = os.getpid()
+        if self.poll_seconds > 0 and time.monotonic() >= self._next_check:
+            self._next_check = time.monotonic() + self.poll_seconds
+            self.check_for_update()
+        return self.active
+
+    def _fingerprint(self, version):
+        path = version_dir(version, self.model_dir)
+        try:
+            return tuple(os.stat(os.path.join(path, filename)).st_mtime_ns for filename in MODEL_FILES)
+        except OSError:
+            return None
+
+    def check_for_update(self, wait=False):
+        """Start loading the version that should be served if it isn't the active one"""
+        version = resolve_version(self.model_dir, self.pinned)
+        if self.active is not None and version == self.active.version:
+            return False
+        fingerprint = self._fingerprint(version)
+        if self.failed.get(version, {}).get('fingerprint') == fingerprint:
+            return False
+        if not self._loading.acquire(blocking=False):
+            return False
+        thread = threading.Thread(target=self._reload, args=(version, fingerprint), name='model-reload', daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def _reload(self, version, fingerprint):
+        try:
+            start = time.perf_counter()
+            try:
+                bundle = self._prepare(version)
+            except Exception as e:
+                self._reject(version, fingerprint, e)
+                print(f"Model version {version} rejected, keeping {self.active.version if self.active else None}: {e}")
+                return
+            old = self.active
+            self.active = bundle
+            self.swaps += 1
+            print(f"Model version {version} active (loaded and prepared in {time.perf_counter() - start:.2f}s)")
+            for callback in self._callbacks:
+                try:
+                    callback(bundle, old)
+                except Exception as e:
+                    print(f"Model swap callback failed: {e}")
+            if old is not None:
+                old.close()
+        finally:
+            self._loading.release()
+
+    def stats(self):
+        active = self.active
+        with self._failed_lock:
+            rejected = {version: info['error'] for version, info in self.failed.items()}
+        return {
+            'version': active.version if active else None,
+            'loaded_at': active.loaded_at if active else None,
+            'pinned': self.pinned,
+            'available': list_versions(self.model_dir),
+            'swaps': self.swaps,
+            'rejected': rejected,
+            'last_error': self.last_error,
+        }
+
+
+def publish(source_dir='.', model_dir=MODEL_DIR, version=None):
+    """Copy freshly trained pickles into a new version directory, atomically
+
+    The .npz exports are added when model_export's dependencies are installed;
+    otherwise servers unpickle that version. Returns the version name.
+    """
+    version = version or time.strftime('v%Y%m%d-%H%M%S', time.gmtime())
+    target = os.path.join(model_dir, version)
+    tmp = f'{target}.tmp'
+    if os.path.exists(target):
+        raise FileExistsError(f'{target} already exists')
+    os.makedirs(tmp, exist_ok=True)
+    for filename in MODEL_FILES:
+        shutil.copy2(os.path.join(source_dir, filename), os.path.join(tmp, filename))
+    try:
+        from model_export import export_crop_model, export_price_model
+
+        export_crop_model(*(os.path.join(tmp, name) for name in ('crop_model.pkl', 'label_encoder.pkl', 'crop_model.npz')))
+        export_price_model(os.path.join(tmp, 'price_model.pkl'), os.path.join(tmp, 'price_model.npz'))
+    except Exception as e:
+        print(f"Skipping array export for {version}: {e}")
+    # Servers only see the directory once it is complete
+    os.rename(tmp, target)
+    return version
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage versioned model directories")
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish_parser = commands.add_parser('publish', help="copy trained pickles into a new version")
+    publish_parser.add_argument('source_dir', nargs='?', default='.')
+    publish_parser.add_argument('--version')
+    commands.add_parser('list', help="list published versions")
+    args = parser.parse_args()
+
+    if args.command == 'publish':
+        print(f"Published {publish(args.source_dir, version=args.version)} to {MODEL_DIR}")
+    else:
+        versions = list_versions()
+        serving = resolve_version()
+        for name in versions or [BUNDLED_VERSION]:
+            print(f"{name}{'  (served)' if name == serving else ''}")
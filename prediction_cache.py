@@ -0,0 +1,239 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from crop_ranking import FEATURES
+
+# Quantization step per feature; vectors that round to the same grid point share a cache entry
+DEFAULT_STEPS = {'N': 1.0, 'temperature': 0.1, 'humidity': 1.0, 'ph': 0.01, 'rainfall': 0.1}
+
+# Rough per-entry bookkeeping cost (OrderedDict node, tuple key, timestamps) for the memory cap
+ENTRY_OVERHEAD_BYTES = 200
+
+
+def parse_steps(spec):
+    """Parse "N=1,ph=0.05" into a step table, starting from DEFAULT_STEPS"""
+    steps = dict(DEFAULT_STEPS)
+    for item in (spec or '').split(','):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            if name.strip() in steps:
+                steps[name.strip()] = float(value)
+    return steps
+
+
+def quantize_features(values, steps=DEFAULT_STEPS):
+    """Snap a feature dict (or a sequence in FEATURES order) to the quantization grid
+
+    Returns a tuple in FEATURES order, or None if a value is missing or not a finite number.
+    """
+    if isinstance(values, dict):
+        values = [values.get(feature) for feature in FEATURES]
+    quantized = []
+    for feature, value in zip(FEATURES, values):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+        if value != value or value in (float('inf'), float('-inf')):
+            return None
+        step = steps[feature]
+        # round() again to drop float noise such as 20.800000000000001
+        quantized.append(round(round(value / step) * step, 10) if step > 0 else value)
+    return tuple(quantized)
+
+
+# Feature quantization used to build cache keys, configurable as "N=1,ph=0.05,..."
+CACHE_STEPS = parse_steps(os.getenv('PREDICTION_CACHE_PRECISION'))
+
+
+class PredictionCache:
+    """Thread-safe in-process LRU cache with TTL, an approximate memory cap and hit/miss counters"""
+
+    def __init__(self, max_entries=10000, ttl=3600, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _entry_size(self, key, value):
+        return ENTRY_OVERHEAD_BYTES + len(repr(key)) + len(json.dumps(value))
+
+    def get(self, key):
+        """Return the cached value, or None on a miss or an expired entry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        size = self._entry_size(key, value)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        """Drop every entry, e.g. after the model is reloaded"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class RedisPredictionCache:
+    """Same interface as PredictionCache, shared by every worker through Redis
+
+    Redis enforces the memory cap and LRU eviction (maxmemory / allkeys-lru).
+    Keys carry the model version, so a hot swap needs no invalidation.
+    clear() bumps a generation number so old entries stop matching and age
+    out; workers re-read it at most every generation_seconds rather than on
+    every lookup.
+    """
+
+    def __init__(self, url, ttl=3600, prefix='prediction-cache', generation_seconds=5):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.generation_seconds = generation_seconds
+        self._generation = 0
+        self._generation_expires = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key):
+        if time.monotonic() >= self._generation_expires:
+            # On failure keep the last known generation; get/set report the outage
+            self._generation_expires = time.monotonic() + self.generation_seconds
+            try:
+                self._generation = int(self.client.get(f'{self.prefix}:generation') or 0)
+            except Exception:
+                pass
+        return f'{self.prefix}:{self._generation}:{json.dumps(key)}'
+
+    def get(self, key):
+        try:
+            value = self.client.get(self._key(key))
+        except Exception as e:
+            print(f"Prediction cache unavailable: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        try:
+            self.client.set(self._key(key), json.dumps(value), ex=max(1, int(self.ttl)))
+        except Exception as e:
+            print(f"Prediction cache unavailable: {e}")
+
+    def clear(self):
+        try:
+            self._generation = int(self.client.incr(f'{self.prefix}:generation'))
+        except Exception as e:
+            print(f"Prediction cache unavailable: {e}")
+
+    def stats(self):
+        return {'backend': 'redis', 'hits': self.hits, 'misses': self.misses}
+
+
+def make_prediction_cache():
+    """Build the response cache from PREDICTION_CACHE_* environment variables
+
+    PREDICTION_CACHE_SIZE=0 disables caching. With PREDICTION_CACHE_REDIS_URL set
+    (and the redis package installed) the cache is shared across workers.
+    """
+    ttl = float(os.getenv('PREDICTION_CACHE_TTL', '3600'))
+    redis_url = os.getenv('PREDICTION_CACHE_REDIS_URL')
+    if redis_url:
+        try:
+            return RedisPredictionCache(redis_url, ttl=ttl)
+        except ImportError:
+            print("redis package not installed, using the in-process prediction cache")
+    return PredictionCache(
+        max_entries=int(os.getenv('PREDICTION_CACHE_SIZE', '10000')),
+        ttl=ttl,
+        max_bytes=int(os.getenv('PREDICTION_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+    )
+
+
+def cached_top_k(cache, ranker, rows, k, steps=CACHE_STEPS):
+    """Top-k rankings for feature dicts, scoring only the cache misses in one batch
+
+    The quantized features and the ranker's model version form the key; misses
+    are scored on the features as sent.
+    """
+    results = [None] * len(rows)
+    keys = []
+    inputs = []
+    misses = []
+    for i, row in enumerate(rows):
+        quantized = quantize_features(row, steps)
+        key = ('top', ranker.version, k, quantized) if quantized is not None else None
+        cached = cache.get(key) if key is not None else None
+        keys.append(key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            misses.append(i)
+            inputs.append([row.get(feature) for feature in FEATURES])
+
+    if misses:
+        rankings = ranker.top_k(pd.DataFrame(inputs, columns=FEATURES), k)
+        for i, ranking in zip(misses, rankings):
+            results[i] = ranking
+            if keys[i] is not None:
+                cache.set(keys[i], ranking)
+    return results
+
+
+def cached_probabilities(cache, ranker, row, steps=CACHE_STEPS):
+    """Probability of every class for one feature dict or vector, cached like cached_top_k"""
+    quantized = quantize_features(row, steps)
+    key = ('proba', ranker.version, quantized) if quantized is not None else None
+    cached = cache.get(key) if key is not None else None
+    if cached is not None:
+        return np.asarray(cached)
+    values = [row.get(feature) for feature in FEATURES] if isinstance(row, dict) else list(row)
+    proba = ranker.probabilities([values])[0]
+    if key is not None:
+        cache.set(key, proba.tolist())
+    return proba
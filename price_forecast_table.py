@@ -0,0 +1,105 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from price_history import to_day_number
+
+# Written by the daily job below, loaded by PricePredictionService
+PRICE_FORECAST_TABLE = os.getenv('PRICE_FORECAST_TABLE', 'price_forecasts.npz')
+
+
+class ForecastTable:
+    """Precomputed 90-day forecasts indexed by (day, crop_id, district_id)
+
+    predicted and lag_90d are float arrays shaped [day, crop, district].
+    model_version names the price model version that produced them.
+    """
+
+    def __init__(self, first_day, crops, districts, predicted, lag_90d, model_version='bundled'):
+        self.first_day = int(first_day)
+        self.model_version = model_version
+        self.crops = list(crops)
+        self.districts = list(districts)
+        self.predicted = predicted
+        self.lag_90d = lag_90d
+        self._crop_index = {crop_id: i for i, crop_id in enumerate(self.crops)}
+        self._district_index = {district_id: i for i, district_id in enumerate(self.districts)}
+
+    def covers(self, day_number):
+        """True if the table has forecasts made on that day"""
+        return 0 <= day_number - self.first_day < self.predicted.shape[0]
+
+    def get(self, day_number, crop_id, district_id):
+        """Return (predicted_price, price_lag_90d) for a day number, or None on a miss"""
+        day = day_number - self.first_day
+        crop = self._crop_index.get(crop_id)
+        district = self._district_index.get(district_id)
+        if crop is None or district is None or not 0 <= day < self.predicted.shape[0]:
+            return None
+        return float(self.predicted[day, crop, district]), float(self.lag_90d[day, crop, district])
+
+    def save(self, path=PRICE_FORECAST_TABLE):
+        tmp_path = f'{path}.tmp{os.getpid()}.npz'
+        np.savez(
+            tmp_path,
+            first_day=np.int64(self.first_day),
+            crops=np.array(self.crops, dtype=str),
+            districts=np.array(self.districts, dtype=str),
+            predicted=self.predicted,
+            lag_90d=self.lag_90d,
+            model_version=np.array(self.model_version),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=PRICE_FORECAST_TABLE):
+        """Load a saved table, or return None if there isn't one"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            # Tables saved before versioned models came from the bundled pickle
+            model_version = str(data['model_version']) if 'model_version' in data.files else 'bundled'
+            return cls(
+                data['first_day'], data['crops'].tolist(), data['districts'].tolist(),
+                data['predicted'], data['lag_90d'], model_version,
+            )
+
+
+def build_forecast_table(service, start_date=None, n_days=2, price_model=None, model_version=None):
+    """Score every mapped crop in every district the service can return, for n_days from start_date
+
+    All rows go through a single price_model.predict call (the service's model
+    unless another is given). Covering tomorrow too keeps the table warm across
+    midnight until the next daily run.
+    """
+    if price_model is None:
+        price_model, model_version = service.price_model, service.model_version
+    start_date = start_date or datetime.now()
+    crops = sorted(set(service.crop_mapping.values()))
+    districts = sorted(set(service.district_grid.names.tolist()))
+    dates = [start_date + timedelta(days=offset) for offset in range(n_days)]
+
+    rows = [
+        service.build_features(crop_id, district_id, current_date)
+        for current_date in dates
+        for crop_id in crops
+        for district_id in districts
+    ]
+    input_df = pd.DataFrame(rows)
+    shape = (len(dates), len(crops), len(districts))
+    predicted = np.asarray(price_model.predict(input_df), dtype=np.float64).reshape(shape)
+    lag_90d = input_df['price_lag_90d'].to_numpy(dtype=np.float64).reshape(shape)
+    return ForecastTable(to_day_number(start_date), crops, districts, predicted, lag_90d, model_version)
+
+
+if __name__ == "__main__":
+    from price_prediction_service import PricePredictionService
+
+    # Optional argument: number of days to cover, starting today
+    n_days = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    table = build_forecast_table(PricePredictionService(), n_days=n_days)
+    table.save()
+    print(f"Saved {table.predicted.size} forecasts "
+          f"({len(table.crops)} crops x {len(table.districts)} districts x {n_days} days, "
+          f"model {table.model_version}) to {PRICE_FORECAST_TABLE}")
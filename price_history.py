@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+from price_store import exact_prices
+
+EMPTY_SERIES = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32))
+
+
+def to_day_number(value):
+    """Convert a date/datetime (or array of them) to integer days since the epoch"""
+    return pd.to_datetime(value).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def _run_bounds(*keys):
+    """Start/end offsets of runs of equal consecutive values across the key arrays"""
+    n = len(keys[0])
+    if n == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    changed = np.zeros(n - 1, dtype=bool)
+    for key in keys:
+        changed |= key[1:] != key[:-1]
+    boundaries = np.flatnonzero(changed) + 1
+    return np.concatenate(([0], boundaries)), np.concatenate((boundaries, [n]))
+
+
+class PriceHistoryIndex:
+    """Per-(crop, district) price series for binary-search lag lookups
+
+    Built from PriceColumns, which are already sorted by (crop, district, day),
+    so the series are slices of the (possibly memory-mapped) column arrays.
+    Slice bounds and the crop averages live in flat NumPy arrays rather than
+    per-series Python objects, so workers forked from a preloading master read
+    them without touching (and un-sharing) the pages they sit on.
+    """
+
+    def __init__(self, columns):
+        self.days = columns.days
+        self.prices = columns.prices
+        crop_codes = np.asarray(columns.crop_codes)
+        district_codes = np.asarray(columns.district_codes)
+        self.crop_index = {name: code for code, name in enumerate(columns.crops)}
+        self.district_index = {name: code for code, name in enumerate(columns.districts)}
+
+        # [crop code, district code] -> (start, end) slice into the column arrays; (0, 0) if absent
+        self.bounds = np.zeros((len(columns.crops), len(columns.districts), 2), dtype=np.int64)
+        starts, ends = _run_bounds(crop_codes, district_codes)
+        if len(starts):
+            self.bounds[crop_codes[starts], district_codes[starts]] = np.column_stack((starts, ends))
+
+        # Daily average across all districts, used when a district has no data for a crop;
+        # PriceColumns keeps them sorted by (crop, day), so crop code c owns
+        # average_offsets[c]:average_offsets[c + 1]
+        self.average_days = columns.average_days
+        self.average_prices = columns.average_prices
+        average_codes = np.asarray(columns.average_crop_codes)
+        self.average_offsets = np.zeros(len(columns.crops) + 1, dtype=np.int64)
+        starts, ends = _run_bounds(average_codes)
+        if len(starts):
+            self.average_offsets[average_codes[starts] + 1] = ends - starts
+        np.cumsum(self.average_offsets, out=self.average_offsets)
+        for array in (self.bounds, self.average_offsets):
+            array.flags.writeable = False
+
+    def get_series(self, crop_id, district_id):
+        """Return (days, prices) for the crop in the district, falling back to the national average"""
+        crop = self.crop_index.get(crop_id)
+        if crop is None:
+            return EMPTY_SERIES
+        district = self.district_index.get(district_id)
+        if district is not None:
+            start, end = self.bounds[crop, district]
+            if end > start:
+                return self.days[start:end], self.prices[start:end]
+        start, end = self.average_offsets[crop], self.average_offsets[crop + 1]
+        return self.average_days[start:end], self.average_prices[start:end]
+
+    def get_lags(self, crop_id, district_id, current_date, lag_days=(90, 365)):
+        """Latest price on or before current_date minus each lag, or None if the crop has no data
+
+        When no observation is old enough the most recent price is used instead.
+        Lags are the float64 values parsed from the CSV (or their pandas mean), unrounded.
+        """
+        days, prices = self.get_series(crop_id, district_id)
+        if len(days) == 0:
+            return None
+
+        targets = int(to_day_number(current_date)) - np.asarray(lag_days, dtype=np.int64)
+        positions = np.searchsorted(days, targets, side='right') - 1
+        lags = np.where(positions >= 0, prices[positions], prices[-1])
+        return exact_prices(lags).tolist()
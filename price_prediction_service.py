@@ -1,20 +1,86 @@
-import joblib
+import os
+import threading
+import time
+import numpy as np
 import pandas as pd
 import requests
 from datetime import datetime, timedelta
 import json
+from price_history import PriceHistoryIndex, to_day_number
+from price_store import load_price_columns
+from district_lookup import DistrictGrid, DEFAULT_DISTRICT
+from price_forecast_table import ForecastTable, build_forecast_table, PRICE_FORECAST_TABLE
+from model_registry import resolve_version, load_price_model_version
+from metrics import metrics
+
+# Days ahead of the original forecast (predicted_price_90d and the forecast table)
+DEFAULT_HORIZON = 90
+# Horizons of a forecast series unless the request names others
+FORECAST_HORIZONS = (30, 60, 90, 120, 180)
+# Longest horizon and most horizons a request may ask for
+MAX_HORIZON_DAYS = 365
+MAX_HORIZONS = 12
+# How often a worker looks for a forecast table rewritten by the daily job
+# (it also looks on the first request of each day)
+FORECAST_TABLE_POLL_SECONDS = float(os.getenv('FORECAST_TABLE_POLL_SECONDS', '60'))
+
+
+def parse_horizons(value):
+    """A request's horizons as sorted unique ints, or raise ValueError"""
+    if value is None:
+        return list(FORECAST_HORIZONS)
+    if not isinstance(value, list) or not value or len(value) > MAX_HORIZONS:
+        raise ValueError(f'horizons must be a list of 1 to {MAX_HORIZONS} day counts')
+    try:
+        horizons = sorted(set(int(days) for days in value))
+    except (TypeError, ValueError):
+        raise ValueError('horizons must be whole numbers of days')
+    if horizons[0] < 1 or horizons[-1] > MAX_HORIZON_DAYS:
+        raise ValueError(f'horizons must be between 1 and {MAX_HORIZON_DAYS} days')
+    return horizons
+
+
+class PriceModelState:
+    """A price model, its version and the forecast table made with it
+
+    Replaced as a whole, never field by field, so a request that reads it once
+    never mixes one version's model with another's forecasts.
+    """
+
+    def __init__(self, price_model, model_version, forecast_table=None):
+        self.price_model = price_model
+        self.model_version = model_version
+        self.forecast_table = forecast_table
+
 
 class PricePredictionService:
-    def __init__(self):
-        # Load the price prediction model
-        self.price_model = joblib.load('price_model.pkl')
+    def __init__(self, price_model=None, model_version=None):
+        # Load the price prediction model of the version being served
+        # (exported arrays when present, else the pickle), unless one is passed in
+        if price_model is None:
+            model_version = resolve_version()
+            price_model = load_price_model_version(model_version)
+        model_version = model_version or 'bundled'
+        # Set by follow(): the model state is then the active bundle's
+        self.registry = None
+        
+        # Load price data for lag calculations from the columnar cache
+        # (rebuilt from latest_one_year_prices.csv whenever the CSV changes)
+        self.price_columns = load_price_columns()
         
-        # Load price data for lag calculations
-        self.price_df = pd.read_csv('latest_one_year_prices.csv')
-        # Handle date parsing with error handling
-        self.price_df['date'] = pd.to_datetime(self.price_df['date'], errors='coerce')
-        # Remove rows with invalid dates
-        self.price_df = self.price_df.dropna(subset=['date'])
+        # Index the price history once so lag lookups are binary searches
+        self.price_index = PriceHistoryIndex(self.price_columns)
+        
+        # Precomputed region grid for coordinate -> district lookups
+        self.district_grid = DistrictGrid()
+        
+        # Forecasts precomputed by the daily price_forecast_table.py job, if present
+        # and made by this price model; reloaded when the job rewrites the file
+        self.forecast_table_path = PRICE_FORECAST_TABLE
+        self._table_lock = threading.Lock()
+        self._table_stat = None
+        self._table_checked = (None, 0.0)
+        self._state = PriceModelState(price_model, model_version, self.load_forecast_table(model_version))
         
         # Crop name mapping from model 1 to model 2
         self.crop_mapping = {
@@ -37,237 +103,318 @@ class PricePredictionService:
             'soybeans': 'Soybeans'
         }
     
+    @property
+    def state(self):
+        """The PriceModelState being served"""
+        if self.registry is not None:
+            return self.registry.active.price_state
+        return self._state
+    
+    @property
+    def price_model(self):
+        return self.state.price_model
+    
+    @property
+    def model_version(self):
+        return self.state.model_version
+    
+    @property
+    def forecast_table(self):
+        return self.state.forecast_table
+    
+    def prepare_price_model(self, price_model, model_version):
+        """A PriceModelState for another price model version, e.g. after a hot reload
+
+        A forecast table in use is rebuilt in memory with the new model, so the
+        new state is complete before anything serves it. If that fails, the new
+        model scores every request itself.
+        """
+        forecast_table = None
+        if self.state.forecast_table is not None:
+            try:
+                with metrics.time('forecast_table_build'):
+                    forecast_table = build_forecast_table(self, price_model=price_model, model_version=model_version)
+            except Exception as e:
+                print(f"Error building forecast table for model {model_version}: {e}")
+                metrics.error('forecast_table')
+        return PriceModelState(price_model, model_version, forecast_table)
+    
+    def follow(self, registry):
+        """Serve the price model of registry's active bundle from now on
+
+        Each new version gets its PriceModelState before the registry publishes
+        it (see ModelRegistry.on_prepare), so the crop model, price model and
+        forecast table change in the same assignment.
+        """
+        registry.on_prepare(self.prepare_bundle)
+        state = self.state
+        if state.model_version != registry.active.version:
+            state = self.prepare_price_model(registry.active.price_model, registry.active.version)
+        registry.active.price_state = state
+        self.registry = registry
+    
+    def prepare_bundle(self, bundle):
+        """Give a new ModelBundle its PriceModelState (an on_prepare callback)"""
+        bundle.price_state = self.prepare_price_model(bundle.price_model, bundle.version)
+    
+    def _replace_state(self, old, new):
+        """Serve new instead of old, unless old was already replaced (a model swap wins)"""
+        if self.registry is None:
+            if self._state is old:
+                self._state = new
+            return
+        bundle = self.registry.active
+        if bundle.price_state is old:
+            bundle.price_state = new
+    
+    def _forecast_file_stat(self):
+        try:
+            stat = os.stat(self.forecast_table_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def load_forecast_table(self, model_version):
+        """Read the forecast table file, or return None if there is none or another model made it"""
+        self._table_stat = self._forecast_file_stat()
+        if self._table_stat is None:
+            return None
+        table = ForecastTable.load(self.forecast_table_path)
+        if table is not None and table.model_version != model_version:
+            print(f"Ignoring forecast table from model {table.model_version} (serving {model_version})")
+            return None
+        return table
+    
+    def current_state(self, today):
+        """The PriceModelState to use on day number today
+
+        Every FORECAST_TABLE_POLL_SECONDS, and on the first call of a new day,
+        the file is checked and reloaded if the daily job rewrote it. A table
+        in use that doesn't cover today (the job didn't run, or runs where this
+        worker can't see its output) is rebuilt in memory with the serving
+        model. One thread refreshes at a time, the others carry on with the
+        state they have. Callers keep the returned reference for the whole
+        request, so a swap in between never mixes two models or tables.
+        """
+        state = self.state
+        day, checked = self._table_checked
+        now = time.monotonic()
+        if day == today and now - checked < FORECAST_TABLE_POLL_SECONDS:
+            return state
+        if not self._table_lock.acquire(blocking=False):
+            return state
+        try:
+            self._table_checked = (today, now)
+            table = state.forecast_table
+            if self._forecast_file_stat() != self._table_stat:
+                loaded = self.load_forecast_table(state.model_version)
+                if loaded is not None:
+                    table = loaded
+            if table is not None and not table.covers(today):
+                with metrics.time('forecast_table_build'):
+                    table = build_forecast_table(self, price_model=state.price_model, model_version=state.model_version)
+            if table is not state.forecast_table:
+                refreshed = PriceModelState(state.price_model, state.model_version, table)
+                self._replace_state(state, refreshed)
+                state = refreshed
+        except Exception as e:
+            print(f"Error refreshing forecast table: {e}")
+            metrics.error('forecast_table')
+        finally:
+            self._table_lock.release()
+        return state
+    
     def get_district_from_coords(self, lat, lon):
-        """Get district name from coordinates using reverse geocoding"""
+        """Get district name from coordinates using the region lookup grid"""
         try:
             # Simple mapping based on coordinates for major Indian regions
             # This is a simplified approach - in production you'd use a proper geocoding service
-            
-            # Delhi region
-            if 28.4 <= lat <= 28.9 and 76.8 <= lon <= 77.4:
-                return "Delhi"
-            # Mumbai region  
-            elif 18.8 <= lat <= 19.3 and 72.7 <= lon <= 73.2:
-                return "Mumbai"
-            # Bangalore region
-            elif 12.8 <= lat <= 13.2 and 77.4 <= lon <= 77.8:
-                return "Bangalore"
-            # Chennai region
-            elif 12.8 <= lat <= 13.2 and 80.1 <= lon <= 80.4:
-                return "Chennai"
-            # Kolkata region
-            elif 22.4 <= lat <= 22.8 and 88.2 <= lon <= 88.6:
-                return "Kolkata"
-            # Hyderabad region
-            elif 17.2 <= lat <= 17.6 and 78.2 <= lon <= 78.8:
-                return "Hyderabad"
-            # Punjab region
-            elif 30.5 <= lat <= 31.5 and 74.5 <= lon <= 76.5:
-                return "Punjab"
-            # Gujarat region
-            elif 22.0 <= lat <= 24.5 and 68.0 <= lon <= 74.5:
-                return "Gujarat"
-            # Tamil Nadu region
-            elif 8.0 <= lat <= 13.5 and 76.0 <= lon <= 80.5:
-                return "Tamil Nadu"
-            # Karnataka region
-            elif 11.5 <= lat <= 18.5 and 74.0 <= lon <= 78.5:
-                return "Karnataka"
-            # Maharashtra region
-            elif 15.5 <= lat <= 22.0 and 72.5 <= lon <= 80.5:
-                return "Maharashtra"
-            # Andhra Pradesh region
-            elif 12.0 <= lat <= 19.5 and 76.5 <= lon <= 84.5:
-                return "Andhra Pradesh"
-            # Telangana region
-            elif 15.5 <= lat <= 19.5 and 77.0 <= lon <= 81.0:
-                return "Telangana"
-            # West Bengal region
-            elif 21.5 <= lat <= 27.0 and 85.5 <= lon <= 89.5:
-                return "West Bengal"
-            # Uttar Pradesh region
-            elif 24.0 <= lat <= 31.0 and 77.0 <= lon <= 84.5:
-                return "Uttar Pradesh"
-            # Madhya Pradesh region
-            elif 21.0 <= lat <= 26.5 and 74.0 <= lon <= 82.5:
-                return "Madhya Pradesh"
-            # Rajasthan region
-            elif 23.0 <= lat <= 30.5 and 69.5 <= lon <= 78.5:
-                return "Rajasthan"
-            # Haryana region
-            elif 27.5 <= lat <= 30.5 and 74.5 <= lon <= 77.5:
-                return "Haryana"
-            # Kerala region
-            elif 8.0 <= lat <= 12.5 and 74.5 <= lon <= 77.5:
-                return "Kerala"
-            # Odisha region
-            elif 17.5 <= lat <= 22.5 and 81.0 <= lon <= 87.5:
-                return "Odisha"
-            # Assam region
-            elif 24.0 <= lat <= 28.0 and 89.5 <= lon <= 96.5:
-                return "Assam"
-            # Bihar region
-            elif 24.0 <= lat <= 27.5 and 83.0 <= lon <= 88.5:
-                return "Bihar"
-            # Jharkhand region
-            elif 21.5 <= lat <= 25.0 and 83.0 <= lon <= 87.5:
-                return "Jharkhand"
-            # Chhattisgarh region
-            elif 17.5 <= lat <= 24.0 and 80.0 <= lon <= 84.5:
-                return "Chhattisgarh"
-            # Uttarakhand region
-            elif 28.5 <= lat <= 31.5 and 77.5 <= lon <= 81.5:
-                return "Uttarakhand"
-            # Himachal Pradesh region
-            elif 30.5 <= lat <= 33.5 and 75.5 <= lon <= 79.5:
-                return "Himachal Pradesh"
-            # Jammu and Kashmir region
-            elif 32.0 <= lat <= 37.0 and 73.5 <= lon <= 80.5:
-                return "Jammu and Kashmir"
-            # Ladakh region
-            elif 32.0 <= lat <= 37.0 and 75.5 <= lon <= 80.5:
-                return "Ladakh"
-            # Goa region
-            elif 14.5 <= lat <= 15.8 and 73.5 <= lon <= 74.5:
-                return "Goa"
-            # Sikkim region
-            elif 27.0 <= lat <= 28.5 and 88.0 <= lon <= 89.0:
-                return "Sikkim"
-            # Arunachal Pradesh region
-            elif 26.0 <= lat <= 29.5 and 91.5 <= lon <= 97.5:
-                return "Arunachal Pradesh"
-            # Nagaland region
-            elif 25.0 <= lat <= 27.5 and 93.0 <= lon <= 95.5:
-                return "Nagaland"
-            # Manipur region
-            elif 23.5 <= lat <= 25.5 and 93.0 <= lon <= 94.5:
-                return "Manipur"
-            # Mizoram region
-            elif 22.0 <= lat <= 24.5 and 92.0 <= lon <= 93.5:
-                return "Mizoram"
-            # Tripura region
-            elif 22.5 <= lat <= 24.5 and 91.0 <= lon <= 92.5:
-                return "Tripura"
-            # Meghalaya region
-            elif 25.0 <= lat <= 26.5 and 89.5 <= lon <= 92.5:
-                return "Meghalaya"
-            # Andaman and Nicobar region
-            elif 6.0 <= lat <= 14.0 and 92.0 <= lon <= 94.0:
-                return "Andaman and Nicobar"
-            # Lakshadweep region
-            elif 8.0 <= lat <= 12.0 and 71.0 <= lon <= 74.0:
-                return "Lakshadweep"
-            # Puducherry region
-            elif 11.5 <= lat <= 12.5 and 79.5 <= lon <= 80.0:
-                return "Puducherry"
-            # Dadra and Nagar Haveli region
-            elif 20.0 <= lat <= 20.5 and 72.5 <= lon <= 73.5:
-                return "Dadra and Nagar Haveli"
-            # Daman and Diu region
-            elif 20.0 <= lat <= 20.5 and 72.5 <= lon <= 73.5:
-                return "Daman and Diu"
-            # Chandigarh region
-            elif 30.5 <= lat <= 31.0 and 76.5 <= lon <= 77.0:
-                return "Chandigarh"
-            else:
-                # Default fallback for coordinates outside India or unrecognized regions
-                return "Adilabad"  # Default district from your dataset
+            with metrics.time('district_lookup'):
+                district = self.district_grid.lookup_one(lat, lon)
+            if district == DEFAULT_DISTRICT:
+                metrics.fallback('default_district')
+            return district
             
         except Exception as e:
             print(f"Error getting district: {e}")
-            return "Adilabad"  # Default fallback
+            metrics.error('district_lookup')
+            metrics.fallback('default_district')
+            return DEFAULT_DISTRICT  # Default fallback
+    
+    def get_districts_from_coords(self, lats, lons):
+        """Get district names for arrays of coordinates in one vectorized lookup"""
+        return self.district_grid.lookup(lats, lons)
     
     def get_price_lags(self, crop_id, district_id, current_date):
         """Get price lags for the given crop and district"""
         try:
-            # Filter data for the specific crop and district
-            crop_district_data = self.price_df[
-                (self.price_df['crop_id'] == crop_id) & 
-                (self.price_df['district_id'] == district_id)
-            ].copy()
-            
-            if len(crop_district_data) == 0:
-                # If no data for this district, get average across all districts
-                crop_district_data = self.price_df[self.price_df['crop_id'] == crop_id].copy()
-                if len(crop_district_data) > 0:
-                    # Group by date and take average
-                    crop_district_data = crop_district_data.groupby('date')['price'].mean().reset_index()
-                    crop_district_data['district_id'] = district_id
-            
-            if len(crop_district_data) == 0:
+            with metrics.time('price_lags'):
+                lags = self.price_index.get_lags(crop_id, district_id, current_date)
+            if lags is None:
+                metrics.fallback('zero_lags')
                 return 0, 0  # Return zeros if no data available
             
-            # Sort by date
-            crop_district_data = crop_district_data.sort_values('date')
-            
-            # Get the most recent price
-            latest_price = crop_district_data['price'].iloc[-1]
-            
-            # Calculate 90-day lag
-            current_date = pd.to_datetime(current_date)
-            lag_90_date = current_date - timedelta(days=90)
-            
-            # Find closest date to 90 days ago
-            lag_90_data = crop_district_data[crop_district_data['date'] <= lag_90_date]
-            price_lag_90d = lag_90_data['price'].iloc[-1] if len(lag_90_data) > 0 else latest_price
-            
-            # Calculate 365-day lag
-            lag_365_date = current_date - timedelta(days=365)
-            lag_365_data = crop_district_data[crop_district_data['date'] <= lag_365_date]
-            price_lag_365d = lag_365_data['price'].iloc[-1] if len(lag_365_data) > 0 else latest_price
-            
+            price_lag_90d, price_lag_365d = lags
             return price_lag_90d, price_lag_365d
             
         except Exception as e:
             print(f"Error calculating price lags: {e}")
+            metrics.error('price_lags')
+            metrics.fallback('zero_lags')
             return 0, 0
     
     def predict_price(self, crop_name, lat, lon):
         """Predict 90-day future price for a crop"""
+        predictions = self.predict_prices([crop_name], lat, lon)
+        return predictions[0] if predictions else None
+    
+    def predict_prices(self, crop_names, lat, lon):
+        """Predict 90-day future prices for several crops in a single model call"""
         try:
-            # Map crop name to model 2 format
-            crop_id = self.crop_mapping.get(crop_name.lower())
-            if not crop_id:
-                return None
+            crops, district_id, current_date = self._resolve(crop_names, lat, lon)
+            if not crops:
+                return []
+            predicted, lags_90d = self.forecast(crops, district_id, current_date, [DEFAULT_HORIZON])
+            future_date = current_date + timedelta(days=DEFAULT_HORIZON)
+            return [
+                self._format_prediction(crop_name, float(prices[0]), lag_90d, future_date)
+                for (crop_name, _), prices, lag_90d in zip(crops, predicted, lags_90d)
+            ]
             
-            # Get district from coordinates
-            district_id = self.get_district_from_coords(lat, lon)
-            
-            # Get current date and calculate future date (90 days from now)
-            current_date = datetime.now()
-            future_date = current_date + timedelta(days=90)
-            
-            # Get price lags
-            price_lag_90d, price_lag_365d = self.get_price_lags(crop_id, district_id, current_date)
-            
-            # Prepare input features for model 2
-            input_features = {
-                'crop_id': crop_id,
-                'district_id': district_id,
-                'month': future_date.month,
-                'day_of_year': future_date.timetuple().tm_yday,
-                'price_lag_90d': price_lag_90d,
-                'price_lag_365d': price_lag_365d
-            }
-            
-            # Convert to DataFrame for prediction
-            input_df = pd.DataFrame([input_features])
-            
-            # Make prediction
-            predicted_price = self.price_model.predict(input_df)[0]
-            
-            return {
-                'crop_name': crop_name,
-                'predicted_price_90d': round(predicted_price, 2),
-                'current_price': price_lag_90d,
-                'price_change': round(predicted_price - price_lag_90d, 2),
-                'price_change_percent': round(((predicted_price - price_lag_90d) / price_lag_90d) * 100, 2) if price_lag_90d > 0 else 0,
-                'harvest_month': future_date.strftime('%B %Y')
-            }
+        except Exception as e:
+            print(f"Error predicting prices for {list(crop_names)}: {e}")
+            metrics.error('predict_prices')
+            return []
+    
+    def predict_price_series(self, crop_names, lat, lon, horizons=FORECAST_HORIZONS):
+        """Forecasts at several horizons (days ahead) for several crops in a single model call
+
+        Returns one entry per known crop with today's price and a 'forecasts'
+        list, one point per horizon in ascending order.
+        """
+        try:
+            horizons = sorted(set(int(days) for days in horizons))
+            crops, district_id, current_date = self._resolve(crop_names, lat, lon)
+            if not crops or not horizons:
+                return []
+            predicted, lags_90d = self.forecast(crops, district_id, current_date, horizons)
+            future_dates = [current_date + timedelta(days=days) for days in horizons]
+            return [
+                {
+                    'crop_name': crop_name,
+                    'current_price': lag_90d,
+                    'forecasts': [
+                        self._format_point(days, float(price), lag_90d, future_date)
+                        for days, price, future_date in zip(horizons, prices, future_dates)
+                    ],
+                }
+                for (crop_name, _), prices, lag_90d in zip(crops, predicted, lags_90d)
+            ]
             
         except Exception as e:
-            print(f"Error predicting price for {crop_name}: {e}")
-            return None
+            print(f"Error predicting price series for {list(crop_names)}: {e}")
+            metrics.error('predict_prices')
+            return []
+    
+    def _resolve(self, crop_names, lat, lon):
+        """(crop_name, crop_id) pairs the model knows, the district and the forecast date"""
+        # Map crop names to model 2 format, skipping crops the model doesn't know
+        crops = []
+        for crop_name in crop_names:
+            crop_id = self.crop_mapping.get(str(crop_name).lower())
+            if crop_id:
+                crops.append((crop_name, crop_id))
+        if not crops:
+            return [], None, None
+        # Get district from coordinates (once for the whole batch)
+        return crops, self.get_district_from_coords(lat, lon), datetime.now()
+    
+    def forecast(self, crops, district_id, current_date, horizons):
+        """Predicted prices [crop, horizon] and each crop's price 90 days back
+
+        Lags are looked up once per crop and shared by all of its horizons:
+        every forecast starts from the prices known today. Only the month and
+        day of year of the target date differ between horizons. 90-day
+        forecasts come from the precomputed table when it has them; everything
+        else goes through one price_model.predict call.
+        """
+        today = int(to_day_number(current_date))
+        predicted = np.full((len(crops), len(horizons)), np.nan)
+        lags_90d = [None] * len(crops)
+        misses = []
+        # Read once: a reload or model swap may replace it while this request runs
+        state = self.current_state(today) if DEFAULT_HORIZON in horizons else self.state
+        table = state.forecast_table if DEFAULT_HORIZON in horizons else None
+        for i, (_, crop_id) in enumerate(crops):
+            cached = None
+            if table is not None:
+                cached = table.get(today, crop_id, district_id)
+            if cached is None:
+                misses.append(i)
+            else:
+                predicted[i, horizons.index(DEFAULT_HORIZON)], lags_90d[i] = cached
+        
+        # Rows still to score: every horizon of a missed crop, and the other horizons of table hits
+        rows = [(i, j) for i in range(len(crops)) for j in range(len(horizons)) if np.isnan(predicted[i, j])]
+        if rows:
+            with metrics.time('price_feature_frame'):
+                lags = {}
+                for i in sorted(set(i for i, _ in rows)):
+                    lags[i] = self.get_price_lags(crops[i][1], district_id, current_date)
+                    if lags_90d[i] is None:
+                        lags_90d[i] = lags[i][0]
+                future_dates = [current_date + timedelta(days=days) for days in horizons]
+                crop_rows = np.array([i for i, _ in rows])
+                horizon_rows = np.array([j for _, j in rows])
+                crop_lags = np.array([lags[i] for i, _ in rows], dtype=np.float64).reshape(-1, 2)
+                input_df = pd.DataFrame({
+                    'crop_id': [crops[i][1] for i in crop_rows.tolist()],
+                    'district_id': district_id,
+                    'month': np.array([date.month for date in future_dates])[horizon_rows],
+                    'day_of_year': np.array([date.timetuple().tm_yday for date in future_dates])[horizon_rows],
+                    'price_lag_90d': crop_lags[:, 0],
+                    'price_lag_365d': crop_lags[:, 1],
+                })
+            
+            # Score every missing (crop, horizon) pair in one prediction call
+            with metrics.time('price_predict'):
+                predicted[crop_rows, horizon_rows] = np.asarray(state.price_model.predict(input_df), dtype=np.float64)
+        
+        return predicted, lags_90d
+    
+    def build_features(self, crop_id, district_id, current_date, horizon_days=DEFAULT_HORIZON):
+        """Model 2 input features for a forecast horizon_days ahead made on current_date"""
+        future_date = current_date + timedelta(days=horizon_days)
+        price_lag_90d, price_lag_365d = self.get_price_lags(crop_id, district_id, current_date)
+        return {
+            'crop_id': crop_id,
+            'district_id': district_id,
+            'month': future_date.month,
+            'day_of_year': future_date.timetuple().tm_yday,
+            'price_lag_90d': price_lag_90d,
+            'price_lag_365d': price_lag_365d
+        }
+    
+    def _format_prediction(self, crop_name, predicted_price, price_lag_90d, future_date):
+        """Build the API response entry for one crop"""
+        return {
+            'crop_name': crop_name,
+            'predicted_price_90d': round(predicted_price, 2),
+            'current_price': price_lag_90d,
+            'price_change': round(predicted_price - price_lag_90d, 2),
+            'price_change_percent': round(((predicted_price - price_lag_90d) / price_lag_90d) * 100, 2) if price_lag_90d > 0 else 0,
+            'harvest_month': future_date.strftime('%B %Y')
+        }
+    
+    def _format_point(self, horizon_days, predicted_price, current_price, future_date):
+        """Build one point of a crop's forecast series"""
+        return {
+            'horizon_days': horizon_days,
+            'predicted_price': round(predicted_price, 2),
+            'price_change': round(predicted_price - current_price, 2),
+            'price_change_percent': round(((predicted_price - current_price) / current_price) * 100, 2) if current_price > 0 else 0,
+            'harvest_month': future_date.strftime('%B %Y')
+        }
 
 # Test the service
 if __name__ == "__main__":
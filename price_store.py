@@ -0,0 +1,213 @@
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+PRICE_CSV = os.getenv('PRICE_CSV', 'latest_one_year_prices.csv')
+# Directory holding the columnar copy of PRICE_CSV, next to it by default
+PRICE_CACHE_DIR = os.getenv('PRICE_CACHE_DIR', 'latest_one_year_prices.cache')
+
+CACHE_VERSION = 2
+COLUMNS = ('crop_codes', 'district_codes', 'days', 'prices', 'average_crop_codes', 'average_days', 'average_prices')
+# Prices are stored as float32 when rounding back to this many decimals recovers
+# the parsed float64 values exactly, and as float64 otherwise
+PRICE_DECIMALS = 2
+
+
+class PriceColumns:
+    """Price history as flat arrays, sorted by (crop, district, day)
+
+    crop_codes/district_codes index into the crops/districts name lists, days
+    are int32 days since 1970-01-01 and prices are float32 (see exact_prices).
+    average_* hold each crop's daily average across districts, sorted by
+    (crop, day) and computed in float64 from the CSV's row order, so they
+    equal a pandas groupby('date')['price'].mean() over the crop's rows.
+    """
+
+    def __init__(self, crops, districts, crop_codes, district_codes, days, prices,
+                 average_crop_codes, average_days, average_prices):
+        self.crops = list(crops)
+        self.districts = list(districts)
+        self.crop_codes = crop_codes
+        self.district_codes = district_codes
+        self.days = days
+        self.prices = prices
+        self.average_crop_codes = average_crop_codes
+        self.average_days = average_days
+        self.average_prices = average_prices
+
+    def __len__(self):
+        return len(self.days)
+
+    def to_frame(self):
+        """Expand back to a DataFrame with categorical crop/district columns"""
+        return pd.DataFrame({
+            'crop_id': pd.Categorical.from_codes(self.crop_codes, self.crops),
+            'district_id': pd.Categorical.from_codes(self.district_codes, self.districts),
+            'date': pd.to_datetime(np.asarray(self.days, dtype='datetime64[D]')),
+            'price': exact_prices(self.prices),
+        })
+
+    def averages_frame(self):
+        """Daily average price per crop as a crop_id/date/price DataFrame"""
+        return pd.DataFrame({
+            'crop_id': pd.Categorical.from_codes(self.average_crop_codes, self.crops),
+            'date': pd.to_datetime(np.asarray(self.average_days, dtype='datetime64[D]')),
+            'price': np.asarray(self.average_prices),
+        })
+
+
+def exact_prices(prices):
+    """Widen stored prices to the float64 values parsed from the CSV"""
+    if np.asarray(prices).dtype == np.float32:
+        return np.round(np.asarray(prices, dtype=np.float64), PRICE_DECIMALS)
+    return np.asarray(prices, dtype=np.float64)
+
+
+def _stored_prices(prices):
+    """float32 copy of the prices if exact_prices() gets the originals back, else float64"""
+    narrow = prices.astype(np.float32)
+    if np.array_equal(exact_prices(narrow), prices, equal_nan=True):
+        return narrow
+    return prices
+
+
+def _code_dtype(n_categories):
+    return np.int16 if n_categories < np.iinfo(np.int16).max else np.int32
+
+
+def columns_from_frame(price_df):
+    """Encode a crop_id/district_id/date/price DataFrame as sorted PriceColumns"""
+    crop = pd.Categorical(price_df['crop_id'].astype(str))
+    district = pd.Categorical(price_df['district_id'].astype(str))
+    days = pd.to_datetime(price_df['date']).to_numpy().astype('datetime64[D]').astype(np.int32)
+
+    prices = price_df['price'].to_numpy(dtype=np.float64)
+    crop_dtype = _code_dtype(len(crop.categories))
+
+    # Averaged before sorting: pandas sums each group in row order, as the
+    # per-crop groupby in the services always has
+    averages = pd.Series(prices).groupby([crop.codes, days]).mean()
+
+    # Categories are sorted, so code order is name order; stable sort keeps file order for ties
+    order = np.lexsort((days, district.codes, crop.codes))
+    return PriceColumns(
+        crop.categories.tolist(),
+        district.categories.tolist(),
+        crop.codes[order].astype(crop_dtype),
+        district.codes[order].astype(_code_dtype(len(district.categories))),
+        days[order],
+        _stored_prices(prices[order]),
+        averages.index.get_level_values(0).to_numpy().astype(crop_dtype),
+        averages.index.get_level_values(1).to_numpy().astype(np.int32),
+        averages.to_numpy(dtype=np.float64),
+    )
+
+
+def read_price_csv(csv_path=PRICE_CSV):
+    """Parse the price CSV from text, dropping rows with invalid dates"""
+    price_df = pd.read_csv(csv_path, usecols=['crop_id', 'district_id', 'date', 'price'])
+    price_df['date'] = pd.to_datetime(price_df['date'], errors='coerce')
+    return price_df.dropna(subset=['date'])
+
+
+def file_checksum(path):
+    """SHA-256 of a file, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_stat(csv_path):
+    stat = os.stat(csv_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def build_price_cache(csv_path=PRICE_CSV, cache_dir=PRICE_CACHE_DIR):
+    """Convert the price CSV to the columnar cache and return its metadata"""
+    columns = columns_from_frame(read_price_csv(csv_path))
+    os.makedirs(cache_dir, exist_ok=True)
+    for name in COLUMNS:
+        path = os.path.join(cache_dir, f'{name}.npy')
+        tmp_path = f'{path}.tmp{os.getpid()}.npy'
+        np.save(tmp_path, getattr(columns, name))
+        os.replace(tmp_path, path)
+
+    # meta.json is written last, so a half-written cache never validates
+    meta = {
+        'version': CACHE_VERSION,
+        'source_sha256': file_checksum(csv_path),
+        'source': _source_stat(csv_path),
+        'rows': len(columns),
+        'crops': columns.crops,
+        'districts': columns.districts,
+    }
+    _write_json(os.path.join(cache_dir, 'meta.json'), meta)
+    return meta
+
+
+def _cache_is_current(meta, csv_path, cache_dir):
+    """Check the cache against the CSV; only re-hash the CSV when its size or mtime changed"""
+    if not meta or meta.get('version') != CACHE_VERSION:
+        return False
+    if not all(os.path.exists(os.path.join(cache_dir, f'{name}.npy')) for name in COLUMNS):
+        return False
+    if meta.get('source') == _source_stat(csv_path):
+        return True
+    if meta.get('source_sha256') != file_checksum(csv_path):
+        return False
+    # Same content with a new mtime (copied or checked out again): remember the new stat
+    meta['source'] = _source_stat(csv_path)
+    try:
+        _write_json(os.path.join(cache_dir, 'meta.json'), meta)
+    except OSError:
+        pass
+    return True
+
+
+def load_price_columns(csv_path=PRICE_CSV, cache_dir=PRICE_CACHE_DIR, mmap=True):
+    """Load the price history from the columnar cache, rebuilding it if the CSV changed
+
+    Arrays are memory-mapped read-only by default, so forked workers share the pages.
+    If the cache can't be written or read (read-only checkout, full disk), the
+    CSV is parsed into memory instead; set PRICE_CACHE_DIR to a writable
+    directory to keep the shared copy.
+    """
+    try:
+        meta = _read_meta(cache_dir)
+        if not _cache_is_current(meta, csv_path, cache_dir):
+            print(f"Building price cache {cache_dir} from {csv_path}...")
+            meta = build_price_cache(csv_path, cache_dir)
+
+        mmap_mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(cache_dir, f'{name}.npy'), mmap_mode=mmap_mode) for name in COLUMNS]
+    except OSError as e:
+        print(f"Price cache {cache_dir} unavailable ({e}), loading {csv_path} into memory")
+        return columns_from_frame(read_price_csv(csv_path))
+    return PriceColumns(meta['crops'], meta['districts'], *arrays)
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else PRICE_CSV
+    cache_dir = sys.argv[2] if len(sys.argv) > 2 else PRICE_CACHE_DIR
+    meta = build_price_cache(csv_path, cache_dir)
+    print(f"Wrote {meta['rows']} rows ({len(meta['crops'])} crops, {len(meta['districts'])} districts) to {cache_dir}")
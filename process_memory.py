@@ -0,0 +1,455 @@
+import functools
+import gc
+import mmap
+import os
+import sys
+import threading
+import tracemalloc
+import types
+import numpy as np
+
+# Frames kept per allocation once tracing starts (more frames, more overhead)
+MEMORY_TRACE_FRAMES = int(os.getenv('MEMORY_TRACE_FRAMES', '1'))
+# tracemalloc snapshots kept per process for /memory diffs
+MEMORY_SNAPSHOTS_KEEP = int(os.getenv('MEMORY_SNAPSHOTS_KEEP', '5'))
+# Objects visited per component before retained_size gives up (the size is then a lower bound)
+RETAINED_SIZE_MAX_OBJECTS = 2_000_000
+
+# smaps_rollup fields, in kB, summed into the report
+_FIELDS = {
+    'Rss': 'rss_kb',
+    'Pss': 'pss_kb',
+    'Shared_Clean': 'shared_clean_kb',
+    'Shared_Dirty': 'shared_dirty_kb',
+    'Private_Clean': 'private_clean_kb',
+    'Private_Dirty': 'private_dirty_kb',
+}
+
+
+def memory_usage(pid='self'):
+    """RSS, PSS and unique (private) memory of a process in kB, or None off Linux
+
+    uss_kb is what the process alone holds: the memory freed if it exited.
+    With preloaded gunicorn workers, pages still shared with the master count
+    towards rss_kb but not uss_kb, so uss_kb is the per-worker cost.
+    """
+    path = f'/proc/{pid}/smaps_rollup'
+    if not os.path.exists(path):
+        path = f'/proc/{pid}/smaps'
+        if not os.path.exists(path):
+            return None
+    usage = dict.fromkeys(_FIELDS.values(), 0)
+    try:
+        with open(path) as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in _FIELDS:
+                    usage[_FIELDS[name]] += int(rest.split()[0])
+    except (OSError, ValueError):
+        return None
+    usage['uss_kb'] = usage['private_clean_kb'] + usage['private_dirty_kb']
+    usage['pid'] = os.getpid() if pid == 'self' else int(pid)
+    return usage
+
+
+def child_pids(parent_pid):
+    """Direct children of a process, e.g. the workers of a gunicorn master"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name is in parentheses and may contain spaces
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == parent_pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def worker_report(master_pid):
+    """Memory of a gunicorn master and each of its workers"""
+    master = memory_usage(master_pid)
+    workers = [usage for usage in map(memory_usage, child_pids(master_pid)) if usage]
+    return {
+        'master': master,
+        'workers': workers,
+        'worker_uss_kb_mean': round(sum(w['uss_kb'] for w in workers) / len(workers)) if workers else None,
+        'total_pss_kb': (master['pss_kb'] if master else 0) + sum(w['pss_kb'] for w in workers),
+    }
+
+
+# Shared, not owned: walking into these would reach most of the interpreter
+_SKIPPED_TYPES = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+    types.CodeType, types.FrameType, threading.Thread, threading.local,
+)
+
+
+def _array_owner(array):
+    """The object holding an array's data: the array itself, the array it views, or a buffer"""
+    while isinstance(array, np.ndarray) and array.base is not None:
+        array = array.base
+    return array
+
+
+def _native_size(obj):
+    """Bytes held outside the Python heap by model objects that don't report them"""
+    kind = type(obj)
+    if kind.__module__ == 'sklearn.tree._tree' and kind.__name__ == 'Tree':
+        state = obj.__getstate__()
+        return state['nodes'].nbytes + state['values'].nbytes
+    if kind.__module__.startswith('catboost') and hasattr(obj, '_serialize_model'):
+        # The serialized model, close to what the C++ side holds
+        return len(obj._serialize_model())
+    return 0
+
+
+def retained_size(obj, seen=None, max_objects=RETAINED_SIZE_MAX_OBJECTS):
+    """Bytes kept alive by obj: everything reachable from it that isn't already in seen
+
+    heap_bytes is memory owned by the objects, including array data and the
+    native trees of scikit-learn and CatBoost models. mapped_bytes is array data
+    backed by a memory-mapped file, which the kernel shares between workers and
+    can page out. Modules, classes and functions are not followed. Pass the same
+    seen set for several components so objects they share count once, towards
+    the first.
+    """
+    seen = set() if seen is None else seen
+    pandas = sys.modules.get('pandas')
+    heap_bytes = mapped_bytes = objects = 0
+    stack = [obj]
+    while stack and objects < max_objects:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, _SKIPPED_TYPES):
+            continue
+        seen.add(id(item))
+        objects += 1
+        if isinstance(item, np.ndarray):
+            # getsizeof includes the data only when the array owns it
+            heap_bytes += sys.getsizeof(item)
+            owner = _array_owner(item)
+            if isinstance(owner, mmap.mmap):
+                if id(owner) not in seen:
+                    seen.add(id(owner))
+                    mapped_bytes += len(owner)
+            elif owner is not item:
+                stack.append(owner)
+            if item.dtype == object:
+                stack.extend(item.ravel().tolist())
+            continue
+        if pandas is not None and isinstance(item, (pandas.DataFrame, pandas.Series, pandas.Index)):
+            # deep=True counts the strings of object columns
+            usage = item.memory_usage(deep=True)
+            heap_bytes += int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+            continue
+        heap_bytes += sys.getsizeof(item) + _native_size(item)
+        stack.extend(gc.get_referents(item))
+    return {'heap_bytes': heap_bytes, 'mapped_bytes': mapped_bytes, 'objects': objects, 'complete': not stack}
+
+
+def column_sizes(table):
+    """Bytes per column of a DataFrame, or of an object holding one array per column
+
+    Object columns include their strings; array columns say whether they are
+    memory-mapped (shared by every worker) or private heap.
+    """
+    pandas = sys.modules.get('pandas')
+    if pandas is not None and isinstance(table, pandas.DataFrame):
+        usage = table.memory_usage(deep=True, index=False)
+        return {column: {'bytes': int(usage[column]), 'dtype': str(table[column].dtype)} for column in table.columns}
+    columns = {}
+    for name, value in vars(table).items():
+        if isinstance(value, np.ndarray):
+            mapped = isinstance(_array_owner(value), mmap.mmap)
+            columns[name] = {'bytes': int(value.nbytes), 'dtype': str(value.dtype), 'mapped': mapped}
+    return columns
+
+
+def component_report(components):
+    """retained_size of each named component, in the order given
+
+    Objects shared between components count once, towards the first that
+    reaches them, so order components from the most to the least specific.
+    """
+    seen = set()
+    report = {}
+    for name, obj in components.items():
+        if obj is None:
+            continue
+        size = retained_size(obj, seen)
+        report[name] = {
+            'heap_kb': round(size['heap_bytes'] / 1024),
+            'mapped_kb': round(size['mapped_bytes'] / 1024),
+            'objects': size['objects'],
+            'complete': size['complete'],
+        }
+    return report
+
+
+@functools.lru_cache(maxsize=None)
+def _package(filename):
+    """Top-level package of a source file, e.g. 'pandas' or 'app.py'"""
+    parts = filename.replace('\\', '/').split('/')
+    for marker in ('site-packages', 'dist-packages'):
+        if marker in parts:
+            return parts[parts.index(marker) + 1]
+    if filename.startswith('<'):
+        return filename
+    if os.path.abspath(filename).startswith(os.getcwd()):
+        return os.path.relpath(filename)
+    return 'stdlib'
+
+
+def _origin(traceback):
+    """The most recent frame outside the import machinery
+
+    Code objects of an imported module are allocated inside importlib; with
+    more than one traced frame they are charged to the module importing it.
+    """
+    for frame in reversed(traceback):
+        if not frame.filename.startswith('<frozen'):
+            return frame.filename
+    return traceback[-1].filename
+
+
+def _diff_entry(stat):
+    frame = stat.traceback[-1]
+    return {
+        'location': f'{frame.filename}:{frame.lineno}',
+        'size_kb': round(stat.size / 1024, 1),
+        'size_diff_kb': round(stat.size_diff / 1024, 1),
+        'count': stat.count,
+        'count_diff': stat.count_diff,
+    }
+
+
+class MemorySnapshots:
+    """tracemalloc snapshots of this process, for top allocations and diffs between them
+
+    take() starts tracing on first use unless it is already on (PYTHONTRACEMALLOC=1
+    traces from interpreter start, which also covers import-time allocations
+    such as Flask's). Tracing slows every allocation and stores a traceback for
+    each live block, so stop() it once done. The oldest snapshots are dropped
+    beyond keep.
+    """
+
+    def __init__(self, frames=MEMORY_TRACE_FRAMES, keep=MEMORY_SNAPSHOTS_KEEP):
+        self.frames = frames
+        self.keep = keep
+        self.snapshots = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def take(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        # Not filtered here: filter_traces is slow on large snapshots, so the
+        # snapshots' own memory is skipped when reporting instead
+        snapshot = tracemalloc.take_snapshot()
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self.snapshots[snapshot_id] = snapshot
+            for old_id in sorted(self.snapshots)[:-self.keep]:
+                del self.snapshots[old_id]
+        return snapshot_id
+
+    def get(self, snapshot_id):
+        with self._lock:
+            return self.snapshots.get(snapshot_id)
+
+    def top(self, snapshot_id, limit=20):
+        """The allocation sites holding the most memory, and the total per package"""
+        snapshot = self.get(snapshot_id)
+        if snapshot is None:
+            return None
+        # One grouping pass: sites by their most recent frame, packages by _origin
+        sites = {}
+        packages = {}
+        for stat in snapshot.statistics('traceback'):
+            frame = stat.traceback[-1]
+            if frame.filename == tracemalloc.__file__:
+                continue
+            site = sites.setdefault((frame.filename, frame.lineno), [0, 0])
+            site[0] += stat.size
+            site[1] += stat.count
+            package = _package(_origin(stat.traceback))
+            packages[package] = packages.get(package, 0) + stat.size
+        top = sorted(sites.items(), key=lambda item: -item[1][0])[:limit]
+        return {
+            'id': snapshot_id,
+            'traced_kb': round(sum(size for size, _ in sites.values()) / 1024),
+            'top': [
+                {'location': f'{filename}:{lineno}', 'size_kb': round(size / 1024, 1), 'count': count}
+                for (filename, lineno), (size, count) in top
+            ],
+            'packages_kb': {name: round(size / 1024) for name, size in sorted(packages.items(), key=lambda item: -item[1])[:limit]},
+        }
+
+    def diff(self, from_id, to_id, limit=20):
+        """Allocation sites that grew (or shrank) the most between two snapshots"""
+        old, new = self.get(from_id), self.get(to_id)
+        if old is None or new is None:
+            return None
+        stats = [stat for stat in new.compare_to(old, 'lineno') if stat.traceback[-1].filename != tracemalloc.__file__]
+        return {
+            'from': from_id,
+            'to': to_id,
+            'size_diff_kb': round(sum(stat.size_diff for stat in stats) / 1024),
+            'top': [_diff_entry(stat) for stat in stats[:limit]],
+        }
+
+    def stop(self):
+        tracemalloc.stop()
+        with self._lock:
+            self.snapshots.clear()
+
+    def stats(self):
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        with self._lock:
+            ids = sorted(self.snapshots)
+        return {
+            'tracing': tracing,
+            'traced_kb': round(current / 1024),
+            'peak_traced_kb': round(peak / 1024),
+            'overhead_kb': round(tracemalloc.get_tracemalloc_memory() / 1024),
+            'snapshots': ids,
+        }
+
+
+def memory_report(components, tables=None, snapshots=None):
+    """Process memory, per-component retained sizes and, optionally, per-column sizes
+
+    components maps names to the objects a worker keeps (models, price history,
+    caches); tables maps names to column-wise data for column_sizes. What the
+    components don't account for (the interpreter, imported libraries such as
+    Flask and pandas, allocator slack) is left in unattributed_kb; tracemalloc
+    packages_kb breaks the Python part of it down.
+    """
+    usage = memory_usage()
+    components = component_report(components)
+    attributed_kb = sum(entry['heap_kb'] + entry['mapped_kb'] for entry in components.values())
+    return {
+        'process': usage,
+        'components': components,
+        'columns': {name: column_sizes(table) for name, table in (tables or {}).items() if table is not None},
+        'attributed_kb': attributed_kb,
+        'unattributed_kb': usage['rss_kb'] - attributed_kb if usage else None,
+        'tracemalloc': snapshots.stats() if snapshots is not None else None,
+    }
+
+
+def install_flask_memory_routes(app, components, tables, authorized, snapshots=None):
+    """Add /memory and the tracemalloc snapshot routes to a Flask app
+
+    components and tables are callables returning the dicts for memory_report,
+    so they see the model version being served. authorized() decides from
+    the request whether to answer; otherwise every route is a 404.
+    """
+    from flask import request, jsonify
+
+    snapshots = snapshots or MemorySnapshots()
+
+    def not_found():
+        return jsonify({'error': 'Not found'}), 404
+
+    def limit():
+        return request.args.get('limit', 20, type=int)
+
+    @app.route('/memory', methods=['GET'])
+    def memory():
+        if not authorized():
+            return not_found()
+        return jsonify(memory_report(components(), tables(), snapshots))
+
+    @app.route('/memory/snapshot', methods=['POST'])
+    def take_memory_snapshot():
+        if not authorized():
+            return not_found()
+        return jsonify(snapshots.top(snapshots.take(), limit())), 201
+
+    @app.route('/memory/snapshot/<int:snapshot_id>', methods=['GET'])
+    def get_memory_snapshot(snapshot_id):
+        top = snapshots.top(snapshot_id, limit()) if authorized() else None
+        return jsonify(top) if top is not None else not_found()
+
+    @app.route('/memory/diff', methods=['GET'])
+    def memory_diff():
+        # ?from=<id>&to=<id>; without to, against a snapshot taken now
+        if not authorized():
+            return not_found()
+        from_id = request.args.get('from', type=int)
+        to_id = request.args.get('to', type=int) or snapshots.take()
+        diff = snapshots.diff(from_id, to_id, limit())
+        return jsonify(diff) if diff is not None else not_found()
+
+    @app.route('/memory/trace/stop', methods=['POST'])
+    def stop_memory_trace():
+        if not authorized():
+            return not_found()
+        snapshots.stop()
+        return jsonify(snapshots.stats())
+
+    return snapshots
+
+
+def _print_components(report):
+    print(f"{'component':<22}{'heap MB':>10}{'mapped MB':>11}{'objects':>10}")
+    for name, entry in report['components'].items():
+        print(f"{name:<22}{entry['heap_kb'] / 1024:>10.1f}{entry['mapped_kb'] / 1024:>11.1f}{entry['objects']:>10}")
+    for table, columns in report['columns'].items():
+        for column, entry in columns.items():
+            mapped = ' (mapped)' if entry.get('mapped') else ''
+            print(f"  {table}.{column:<20}{entry['bytes'] / 1024 / 1024:>8.1f} MB  {entry['dtype']}{mapped}")
+    usage = report['process']
+    if usage:
+        print(f"RSS {usage['rss_kb'] / 1024:.1f} MB, of which {report['unattributed_kb'] / 1024:.1f} MB not in a component")
+
+
+def _main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Memory of gunicorn workers, or of the app's components in-process")
+    commands = parser.add_subparsers(dest='command', required=True)
+    workers_parser = commands.add_parser('workers', help="RSS/PSS/unique memory of a gunicorn master and its workers")
+    workers_parser.add_argument('master_pid', type=int)
+    components_parser = commands.add_parser('components', help="load the app here and size its components")
+    components_parser.add_argument('--module', default='app', help="app module to import (app or app_production)")
+    components_parser.add_argument('--top', type=int, default=15, help="allocation sites and packages to list")
+    args = parser.parse_args(argv)
+
+    if args.command == 'components':
+        import importlib
+
+        # Traced from before the import, so Flask, pandas and the models show up by
+        # package; enough frames to see past importlib to the importing module
+        snapshots = MemorySnapshots(frames=max(MEMORY_TRACE_FRAMES, 10))
+        tracemalloc.start(snapshots.frames)
+        module = importlib.import_module(args.module)
+        report = memory_report(module.memory_components(), module.memory_tables(), snapshots)
+        _print_components(report)
+        top = snapshots.top(snapshots.take(), args.top)
+        print(f"\nPython allocations by package ({top['traced_kb'] / 1024:.1f} MB traced):")
+        for package, size_kb in top['packages_kb'].items():
+            print(f"  {package:<40}{size_kb / 1024:>8.1f} MB")
+        print("\nLargest allocation sites:")
+        for entry in top['top']:
+            print(f"  {entry['size_kb'] / 1024:>8.1f} MB  {entry['count']:>8}  {entry['location']}")
+        return
+
+    report = worker_report(args.master_pid)
+    rows = ([('master', report['master'])] if report['master'] else []) + [('worker', w) for w in report['workers']]
+    print(f"{'role':<8}{'pid':>8}{'rss MB':>10}{'pss MB':>10}{'unique MB':>11}")
+    for role, usage in rows:
+        print(f"{role:<8}{usage['pid']:>8}{usage['rss_kb'] / 1024:>10.1f}{usage['pss_kb'] / 1024:>10.1f}{usage['uss_kb'] / 1024:>11.1f}")
+    print(f"Total PSS: {report['total_pss_kb'] / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    # python process_memory.py MASTER_PID still works as "workers MASTER_PID"
+    argv = sys.argv[1:]
+    _main(['workers'] + argv if len(argv) == 1 and argv[0].isdigit() else argv)
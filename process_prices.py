@@ -1,19 +1,21 @@
+import argparse
 import pandas as pd
 import json
 from datetime import datetime, timedelta
 import os
+from price_store import load_price_columns
+from process_prices_simple import save_crop_price_data, refresh_crop_prices
 
 def process_crop_prices():
     """Process CSV data to get 30-day price trends for each crop"""
     
-    # Read the CSV file
-    df = pd.read_csv('latest_one_year_prices.csv')
-    
-    # Convert date column to datetime
-    df['date'] = pd.to_datetime(df['date'])
+    # Load the price history from the columnar cache (rebuilt if the CSV changed)
+    columns = load_price_columns()
+    # Daily averages across districts, computed in float64 when the cache was built
+    df = columns.averages_frame()
     
     # Get unique crops
-    crops = df['crop_id'].unique()
+    crops = columns.crops
     
     # Create mapping from model predictions to CSV crop names
     crop_mapping = {
@@ -45,9 +47,7 @@ def process_crop_prices():
             crop_df = df[df['crop_id'] == csv_name].copy()
             
             if len(crop_df) > 0:
-                # Group by date and take average price across districts
-                daily_prices = crop_df.groupby('date')['price'].mean().reset_index()
-                daily_prices = daily_prices.sort_values('date')
+                daily_prices = crop_df[['date', 'price']].sort_values('date')
                 
                 # Get the most recent 30 days of data
                 if len(daily_prices) >= 30:
@@ -72,14 +72,22 @@ def process_crop_prices():
         else:
             print(f"Crop {csv_name} not found in dataset")
     
-    # Save to JSON file for the frontend to use
-    with open('crop_price_data.json', 'w') as f:
-        json.dump(crop_data, f, indent=2)
+    # Save to JSON files for the frontend to use (root and public/ copies, atomically)
+    save_crop_price_data(crop_data)
     
     print(f"\nProcessed data for {len(crop_data)} crops")
-    print("Data saved to crop_price_data.json")
     
     return crop_data
 
 if __name__ == "__main__":
-    process_crop_prices()
+    parser = argparse.ArgumentParser(description="Build crop_price_data.json from the columnar price cache")
+    # The columnar cache is rebuilt whole whenever the CSV changes, so appended
+    # rows can't be folded in here; --incremental runs the text pipeline's
+    # watermark refresh (same crop_price_state.json, same tail-hash check)
+    parser.add_argument('--incremental', action='store_true',
+                        help="only process rows appended since the last run")
+    args = parser.parse_args()
+    if args.incremental:
+        refresh_crop_prices()
+    else:
+        process_crop_prices()
@@ -1,80 +1,180 @@
+import argparse
 import csv
+import hashlib
 import json
-from datetime import datetime
-from collections import defaultdict
+import os
+from concurrent.futures import ProcessPoolExecutor
 
-def process_crop_prices():
-    """Process CSV data to get 30-day price trends for each crop"""
-    
-    # Create mapping from model predictions to CSV crop names
-    crop_mapping = {
-        'rice': 'Rice',
-        'wheat': 'Wheat', 
-        'maize': 'Maize',
-        'cotton': 'Cotton',
-        'banana': 'Banana',
-        'grapes': 'Grapes',
-        'mango': 'Mango',
-        'orange': 'Orange',
-        'papaya': 'Papaya',
-        'pomegranate': 'Pomegranate',
-        'coconut': 'Coconut',
-        'jute': 'Jute',
-        'lentil': 'Lentil (Masur)(Whole)',
-        'chickpea': 'Kabuli Chana(Chickpeas-White)',
-        'blackgram': 'Black Gram (Urd Beans)(Whole)',
-        'moath': 'Moath Dal',
-        'soybeans': 'Soybeans'  # Fallback
-    }
-    
-    # Dictionary to store daily average prices for each crop
-    crop_daily_prices = defaultdict(lambda: defaultdict(list))
-    
-    print("Processing CSV data...")
-    
-    # Read the CSV file
-    with open('latest_one_year_prices.csv', 'r') as f:
-        reader = csv.DictReader(f)
-        row_count = 0
-        for row in reader:
+PRICE_CSV = 'latest_one_year_prices.csv'
+# Chart data for the frontend, written to the repo root and to public/ (served by Vite)
+OUTPUT_PATHS = ('crop_price_data.json', os.path.join('public', 'crop_price_data.json'))
+# Watermark and per-crop daily aggregates kept between incremental refreshes
+STATE_PATH = 'crop_price_state.json'
+STATE_VERSION = 1
+WINDOW_DAYS = 30
+
+# Create mapping from model predictions to CSV crop names
+CROP_MAPPING = {
+    'rice': 'Rice',
+    'wheat': 'Wheat',
+    'maize': 'Maize',
+    'cotton': 'Cotton',
+    'banana': 'Banana',
+    'grapes': 'Grapes',
+    'mango': 'Mango',
+    'orange': 'Orange',
+    'papaya': 'Papaya',
+    'pomegranate': 'Pomegranate',
+    'coconut': 'Coconut',
+    'jute': 'Jute',
+    'lentil': 'Lentil (Masur)(Whole)',
+    'chickpea': 'Kabuli Chana(Chickpeas-White)',
+    'blackgram': 'Black Gram (Urd Beans)(Whole)',
+    'moath': 'Moath Dal',
+    'soybeans': 'Soybeans'  # Fallback
+}
+
+# Size of the byte ranges handed to each worker process
+CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def read_header(csv_path):
+    """Return the CSV column names and the byte offset where the data rows start"""
+    with open(csv_path, 'rb') as f:
+        header_line = f.readline()
+        return next(csv.reader([header_line.decode('utf-8-sig')])), f.tell()
+
+
+def complete_size(csv_path):
+    """Byte offset just past the last newline, so a row still being appended is left alone"""
+    size = os.path.getsize(csv_path)
+    with open(csv_path, 'rb') as f:
+        position = size
+        while position > 0:
+            block_start = max(0, position - 64 * 1024)
+            f.seek(block_start)
+            block = f.read(position - block_start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return block_start + newline + 1
+            position = block_start
+    return 0
+
+
+def split_byte_ranges(start, end, chunk_bytes=CHUNK_BYTES):
+    """Split [start, end) into (start, end) byte ranges of at most chunk_bytes"""
+    return [(offset, min(offset + chunk_bytes, end)) for offset in range(start, end, chunk_bytes)]
+
+
+def iter_range_lines(f, start, end):
+    """Yield the lines that start inside [start, end) of an open binary file
+
+    A line straddling a range boundary belongs to the range it starts in.
+    Assumes no quoted field contains a newline, which holds for the exported price CSV.
+    """
+    if start > 0:
+        # Back up one byte so a line starting exactly at `start` isn't skipped
+        f.seek(start - 1)
+        f.readline()
+    else:
+        f.seek(0)
+    position = f.tell()
+    while position < end:
+        line = f.readline()
+        if not line:
+            break
+        position += len(line)
+        yield line.decode('utf-8')
+
+
+def aggregate_range(args):
+    """Running price sum and count per (crop_id, date) for mapped crops in one byte range"""
+    csv_path, start, end, header, crops = args
+    crop_col = header.index('crop_id')
+    date_col = header.index('date')
+    price_col = header.index('price')
+    wanted = set(crops)
+
+    totals = {}
+    row_count = 0
+    with open(csv_path, 'rb') as f:
+        for row in csv.reader(iter_range_lines(f, start, end)):
+            if not row:
+                continue
             row_count += 1
-            if row_count % 50000 == 0:
+            crop_id = row[crop_col]
+            if crop_id not in wanted:
+                continue
+            price = float(row[price_col]) if row[price_col] else 0
+            key = (crop_id, row[date_col])
+            total = totals.get(key)
+            if total is None:
+                totals[key] = [price, 1]
+            else:
+                total[0] += price
+                total[1] += 1
+    return totals, row_count
+
+
+def merge_totals(target, partial):
+    """Add one partial aggregate into another in place"""
+    for key, (price_sum, count) in partial.items():
+        total = target.get(key)
+        if total is None:
+            target[key] = [price_sum, count]
+        else:
+            total[0] += price_sum
+            total[1] += count
+    return target
+
+
+def aggregate_prices(csv_path=PRICE_CSV, crops=None, workers=None, chunk_bytes=CHUNK_BYTES, start=None, end=None):
+    """Aggregate the CSV into {(crop_id, date): [sum, count]} in a single streaming pass
+
+    Memory depends on the number of (crop, date) pairs, not on the row count.
+    With more than one worker, byte ranges are aggregated in a process pool and merged.
+    start/end limit the pass to a byte range (defaults: first data row to end of file).
+    """
+    crops = sorted(crops if crops is not None else set(CROP_MAPPING.values()))
+    header, data_start = read_header(csv_path)
+    start = data_start if start is None else start
+    end = os.path.getsize(csv_path) if end is None else end
+    tasks = [(csv_path, range_start, range_end, header, crops)
+             for range_start, range_end in split_byte_ranges(start, end, chunk_bytes)]
+    workers = workers or os.cpu_count() or 1
+
+    totals = {}
+    row_count = 0
+    if workers == 1 or len(tasks) <= 1:
+        for partial, rows in map(aggregate_range, tasks):
+            merge_totals(totals, partial)
+            row_count += rows
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            for partial, rows in pool.map(aggregate_range, tasks):
+                merge_totals(totals, partial)
+                row_count += rows
                 print(f"Processed {row_count} rows...")
-            
-            crop_id = row['crop_id']
-            date_str = row['date']
-            price = float(row['price']) if row['price'] else 0
-            
-            # Store price for this crop and date
-            crop_daily_prices[crop_id][date_str].append(price)
-    
+
     print(f"Total rows processed: {row_count}")
-    
-    # Process each crop
+    return totals
+
+
+def build_chart_data(totals):
+    """Turn (crop_id, date) sums into the last 30 daily averages per mapped crop"""
+    crop_daily_prices = {}
+    for (crop_id, date_str), (price_sum, count) in totals.items():
+        crop_daily_prices.setdefault(crop_id, []).append((date_str, price_sum / count))
+
     crop_data = {}
-    
-    for model_name, csv_name in crop_mapping.items():
+    for model_name, csv_name in CROP_MAPPING.items():
         if csv_name in crop_daily_prices:
-            # Get daily average prices for this crop
-            daily_prices = crop_daily_prices[csv_name]
-            
-            # Convert to list of (date, avg_price) tuples and sort by date
-            price_list = []
-            for date_str, prices in daily_prices.items():
-                if prices:  # Only include dates with valid prices
-                    avg_price = sum(prices) / len(prices)
-                    price_list.append((date_str, avg_price))
-            
             # Sort by date
-            price_list.sort(key=lambda x: x[0])
-            
-            # Get the most recent 30 days of data
-            if len(price_list) >= 30:
-                recent_30_days = price_list[-30:]
-            else:
-                # If less than 30 days, take all available data
-                recent_30_days = price_list
-            
+            price_list = sorted(crop_daily_prices[csv_name], key=lambda x: x[0])
+
+            # Get the most recent 30 days of data (or all of it if there are fewer)
+            recent_30_days = price_list[-WINDOW_DAYS:]
+
             # Format data for the chart
             chart_data = []
             for i, (date_str, avg_price) in enumerate(recent_30_days, 1):
@@ -83,20 +183,154 @@ def process_crop_prices():
                     'price': round(avg_price, 2),
                     'day': i
                 })
-            
+
             crop_data[model_name] = chart_data
             print(f"Processed {model_name} -> {csv_name}: {len(chart_data)} days")
         else:
             print(f"No data found for {csv_name}")
-    
-    # Save to JSON file for the frontend to use
-    with open('crop_price_data.json', 'w') as f:
-        json.dump(crop_data, f, indent=2)
-    
+    return crop_data
+
+
+def save_crop_price_data(crop_data, paths=OUTPUT_PATHS):
+    """Atomically write the chart data to every output path"""
+    for path in paths:
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            continue
+        tmp_path = f'{path}.tmp{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            json.dump(crop_data, f, indent=2)
+        os.replace(tmp_path, path)
+        print(f"Data saved to {path}")
+
+
+def _tail_digest(csv_path, offset, size=4096):
+    """Hash of the bytes just before offset, used to detect a rewritten CSV"""
+    with open(csv_path, 'rb') as f:
+        f.seek(max(0, offset - size))
+        return hashlib.sha256(f.read(offset - max(0, offset - size))).hexdigest()
+
+
+def prune_totals(totals, window=WINDOW_DAYS):
+    """Keep only each crop's most recent `window` dates; older dates can never re-enter the chart"""
+    by_crop = {}
+    for (crop_id, date_str), total in totals.items():
+        by_crop.setdefault(crop_id, {})[date_str] = total
+    pruned = {}
+    for crop_id, daily in by_crop.items():
+        for date_str in sorted(daily)[-window:]:
+            pruned[(crop_id, date_str)] = daily[date_str]
+    return pruned
+
+
+def load_state(csv_path, state_path=STATE_PATH):
+    """Return the saved watermark state if it still matches the CSV, else None"""
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    header, _ = read_header(csv_path)
+    offset = state.get('offset', -1)
+    if state.get('version') != STATE_VERSION or state.get('header') != header:
+        return None
+    if offset < 0 or offset > os.path.getsize(csv_path):
+        return None
+    if state.get('tail_sha256') != _tail_digest(csv_path, offset):
+        return None
+    return state
+
+
+def save_state(csv_path, totals, offset, state_path=STATE_PATH):
+    """Persist the watermark and pruned daily aggregates"""
+    crops = {}
+    for (crop_id, date_str), total in totals.items():
+        crops.setdefault(crop_id, {})[date_str] = total
+    state = {
+        'version': STATE_VERSION,
+        'header': read_header(csv_path)[0],
+        'offset': offset,
+        'tail_sha256': _tail_digest(csv_path, offset),
+        'last_date': max((date_str for _, date_str in totals), default=None),
+        'crops': crops,
+    }
+    tmp_path = f'{state_path}.tmp{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def process_crop_prices(workers=None):
+    """Process CSV data to get 30-day price trends for each crop"""
+
+    print("Processing CSV data...")
+    end = complete_size(PRICE_CSV)
+    size = os.path.getsize(PRICE_CSV)
+    totals = aggregate_prices(PRICE_CSV, workers=workers, end=end)
+
+    # The watermark stops at the last newline, so a last row without one is
+    # charted but not saved: --incremental reads it again once it is complete
+    chart_totals = totals
+    if size > end:
+        tail, rows = aggregate_range((PRICE_CSV, end, size, read_header(PRICE_CSV)[0], sorted(set(CROP_MAPPING.values()))))
+        print(f"Included {rows} row(s) after the last newline")
+        chart_totals = merge_totals({key: list(total) for key, total in totals.items()}, tail)
+    totals = prune_totals(totals)
+    crop_data = build_chart_data(prune_totals(chart_totals))
+
+    # Save to JSON files for the frontend to use, plus the watermark for later refreshes
+    save_crop_price_data(crop_data)
+    save_state(PRICE_CSV, totals, end)
+
     print(f"\nProcessed data for {len(crop_data)} crops")
-    print("Data saved to crop_price_data.json")
-    
+
+    return crop_data
+
+
+def refresh_crop_prices(workers=None):
+    """Fold only the rows appended since the last run into the saved aggregates
+
+    Falls back to a full rebuild when there is no saved state or the CSV was rewritten.
+    A last row without a trailing newline may still be being written, so it
+    waits for the next refresh.
+    """
+    state = load_state(PRICE_CSV)
+    if state is None:
+        print("No usable refresh state, processing the full CSV...")
+        return process_crop_prices(workers=workers)
+
+    totals = {
+        (crop_id, date_str): total
+        for crop_id, daily in state['crops'].items()
+        for date_str, total in daily.items()
+    }
+    end = complete_size(PRICE_CSV)
+    if end <= state['offset']:
+        print("No new rows since the last refresh")
+        return build_chart_data(totals)
+
+    print(f"Processing rows after byte {state['offset']} (last date {state['last_date']})...")
+    new_totals = aggregate_prices(PRICE_CSV, workers=workers, start=state['offset'], end=end)
+    affected = {crop_id for crop_id, _ in new_totals}
+    totals = prune_totals(merge_totals(totals, new_totals))
+    crop_data = build_chart_data(totals)
+
+    save_crop_price_data(crop_data)
+    save_state(PRICE_CSV, totals, end)
+
+    print(f"\nUpdated {len(affected)} crops: {', '.join(sorted(affected)) or 'none'}")
     return crop_data
 
+
 if __name__ == "__main__":
-    process_crop_prices()
+    parser = argparse.ArgumentParser(description="Build crop_price_data.json from the price CSV")
+    parser.add_argument('workers', nargs='?', type=int, default=None,
+                        help="number of worker processes (defaults to the CPU count)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="only process rows appended since the last run")
+    args = parser.parse_args()
+    if args.incremental:
+        refresh_crop_prices(workers=args.workers)
+    else:
+        process_crop_prices(workers=args.workers)
@@ -0,0 +1,273 @@
+import hmac
+import itertools
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# Secret for the X-Profile header and the /profile routes; profiling is off when unset
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN') or None
+# Sampling rates: a single profiled request is short, so it is sampled faster
+PROFILE_SAMPLE_HZ = float(os.getenv('PROFILE_SAMPLE_HZ', '100'))
+PROFILE_REQUEST_HZ = float(os.getenv('PROFILE_REQUEST_HZ', '1000'))
+# Caps per profile: samples taken, and the length of a time-boxed profile
+PROFILE_MAX_SAMPLES = int(os.getenv('PROFILE_MAX_SAMPLES', '10000'))
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+# Fraction of one CPU the sampler may use; it samples less often to stay under it
+PROFILE_OVERHEAD_BUDGET = float(os.getenv('PROFILE_OVERHEAD_BUDGET', '0.02'))
+# Profiles running at once per process; further requests are refused
+PROFILE_MAX_ACTIVE = int(os.getenv('PROFILE_MAX_ACTIVE', '2'))
+# Finished profiles kept in memory, and optionally written out as <id>.collapsed
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '20'))
+PROFILE_DIR = os.getenv('PROFILE_DIR') or None
+
+
+class ProfilerBusy(Exception):
+    """PROFILE_MAX_ACTIVE profiles are already running"""
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def collapse(frame):
+    """A thread's stack as 'outermost;...;innermost', the collapsed-stack format of flamegraph.pl"""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Profile:
+    """Stack samples of some threads (or every thread) of this process
+
+    A background thread samples at hz until stop(), the deadline or
+    max_samples, whichever comes first. After each sample it waits at least
+    interval, or longer if that sample took more than overhead_budget of the
+    interval, so the sampler's share of the GIL stays within the budget.
+    """
+
+    def __init__(self, profile_id, thread_ids=None, hz=PROFILE_SAMPLE_HZ, seconds=PROFILE_MAX_SECONDS,
+                 max_samples=PROFILE_MAX_SAMPLES, overhead_budget=PROFILE_OVERHEAD_BUDGET, label=''):
+        self.id = profile_id
+        self.label = label
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.interval = 1 / max(hz, 0.1)
+        self.max_samples = max_samples
+        self.overhead_budget = overhead_budget
+        self.stacks = Counter()
+        self.samples = 0
+        self.sampling_seconds = 0.0
+        self.stop_reason = None
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._deadline = self._start + min(seconds, PROFILE_MAX_SECONDS)
+        self._stopped = threading.Event()
+        self._done = threading.Event()
+        self._on_done = None
+        self._thread = threading.Thread(target=self._run, name=f'profiler-{profile_id}', daemon=True)
+
+    def start(self, on_done=None):
+        self._on_done = on_done
+        self._thread.start()
+        return self
+
+    def _sample(self, own_id):
+        frames = sys._current_frames()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in frames.items():
+            if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            self.stacks[f"{thread_names.get(thread_id, thread_id)};{collapse(frame)}"] += 1
+        self.samples += 1
+
+    def _run(self):
+        own_id = threading.get_ident()
+        try:
+            while True:
+                if self._stopped.is_set():
+                    self.stop_reason = self.stop_reason or 'stopped'
+                    break
+                if time.perf_counter() >= self._deadline:
+                    self.stop_reason = 'deadline'
+                    break
+                if self.samples >= self.max_samples:
+                    self.stop_reason = 'sample cap'
+                    break
+                start = time.perf_counter()
+                self._sample(own_id)
+                cost = time.perf_counter() - start
+                self.sampling_seconds += cost
+                self._stopped.wait(max(self.interval, cost / self.overhead_budget) - cost)
+        finally:
+            self._elapsed = time.perf_counter() - self._start
+            self._done.set()
+            if self._on_done is not None:
+                self._on_done(self)
+
+    def stop(self, wait=True):
+        self._stopped.set()
+        if wait:
+            self._done.wait()
+        return self
+
+    @property
+    def running(self):
+        return not self._done.is_set()
+
+    def collapsed(self):
+        """'stack count' lines, most sampled first, ready for flamegraph.pl or speedscope"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def summary(self):
+        elapsed = getattr(self, '_elapsed', time.perf_counter() - self._start)
+        return {
+            'id': self.id,
+            'label': self.label,
+            'running': self.running,
+            'started': self.started,
+            'seconds': round(elapsed, 3),
+            'samples': self.samples,
+            'stacks': len(self.stacks),
+            'effective_hz': round(self.samples / elapsed, 1) if elapsed else 0,
+            'overhead': round(self.sampling_seconds / elapsed, 4) if elapsed else 0,
+            'stop_reason': self.stop_reason,
+        }
+
+
+class Profiler:
+    """Starts and keeps profiles for one process, guarded by PROFILE_TOKEN"""
+
+    def __init__(self, token=PROFILE_TOKEN, max_active=PROFILE_MAX_ACTIVE, keep=PROFILE_KEEP, directory=PROFILE_DIR):
+        self.token = token
+        self.max_active = max_active
+        self.keep = keep
+        self.directory = directory
+        self.profiles = OrderedDict()
+        self.rejected = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.token is not None
+
+    def authorized(self, token):
+        return self.enabled and token is not None and hmac.compare_digest(str(token), self.token)
+
+    def start(self, thread_ids=None, **options):
+        """Start a Profile; raises ProfilerBusy when max_active are already running"""
+        with self._lock:
+            if sum(profile.running for profile in self.profiles.values()) >= self.max_active:
+                self.rejected += 1
+                raise ProfilerBusy(f'{self.max_active} profiles already running')
+            profile_id = f'{os.getpid()}-{next(self._ids)}'
+            profile = Profile(profile_id, thread_ids, **options)
+            self.profiles[profile_id] = profile
+            # Forget the oldest finished profiles beyond keep
+            finished = [key for key, kept in self.profiles.items() if not kept.running]
+            for key in finished[:max(0, len(finished) - self.keep)]:
+                del self.profiles[key]
+        return profile.start(on_done=self._save)
+
+    def profile_thread(self, label=''):
+        """Profile the calling thread, e.g. for the rest of one request"""
+        return self.start([threading.get_ident()], hz=PROFILE_REQUEST_HZ, label=label)
+
+    def _save(self, profile):
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f'{profile.id}.collapsed'), 'w') as f:
+                f.write(profile.collapsed())
+        except OSError as e:
+            print(f"Could not save profile {profile.id}: {e}")
+
+    def get(self, profile_id):
+        return self.profiles.get(profile_id)
+
+    def stats(self):
+        with self._lock:
+            profiles = list(self.profiles.values())
+        return {'enabled': self.enabled, 'rejected': self.rejected, 'profiles': [p.summary() for p in profiles]}
+
+
+def install_flask_profiling(app, profiler):
+    """Add the X-Profile request header and the /profile routes to a Flask app
+
+    X-Profile: <PROFILE_TOKEN> on any request samples the thread handling it
+    and returns the profile id in X-Profile-Id. POST /profile/start
+    {"seconds": 10} samples every thread of the worker that receives it (with
+    several gunicorn workers, one of them). GET /profile/<id> returns the
+    collapsed stacks. All of it answers 404 without the token.
+    """
+    from flask import request, jsonify, Response, g
+
+    def authorized():
+        return profiler.authorized(request.headers.get('X-Profile-Token') or request.headers.get('X-Profile'))
+
+    @app.before_request
+    def start_request_profile():
+        g.profile = None
+        token = request.headers.get('X-Profile')
+        if token is None or request.path.startswith('/profile') or not profiler.authorized(token):
+            return
+        try:
+            g.profile = profiler.profile_thread(label=f'{request.method} {request.path}')
+        except ProfilerBusy:
+            pass
+
+    @app.after_request
+    def finish_request_profile(response):
+        # Streamed bodies are produced after this point and not included
+        profile = g.get('profile')
+        if profile is not None:
+            profile.stop()
+            response.headers['X-Profile-Id'] = profile.id
+            response.headers['X-Profile-Samples'] = str(profile.samples)
+        return response
+
+    @app.route('/profile/start', methods=['POST'])
+    def start_profile():
+        if not authorized():
+            return jsonify({'error': 'Not found'}), 404
+        data = request.get_json(silent=True) or {}
+        try:
+            seconds = float(data.get('seconds', 10))
+            hz = float(data.get('hz', PROFILE_SAMPLE_HZ))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'seconds and hz must be numbers'}), 400
+        if not (math.isfinite(seconds) and math.isfinite(hz)) or seconds <= 0 or hz <= 0:
+            return jsonify({'error': 'seconds and hz must be positive numbers'}), 400
+        try:
+            profile = profiler.start(seconds=seconds, hz=min(hz, PROFILE_REQUEST_HZ), label='all threads')
+        except ProfilerBusy as e:
+            return jsonify({'error': str(e)}), 429
+        return jsonify(profile.summary()), 202
+
+    @app.route('/profile/<profile_id>/stop', methods=['POST'])
+    def stop_profile(profile_id):
+        profile = profiler.get(profile_id) if authorized() else None
+        if profile is None:
+            return jsonify({'error': 'Not found'}), 404
+        return jsonify(profile.stop().summary())
+
+    @app.route('/profile/<profile_id>', methods=['GET'])
+    def get_profile(profile_id):
+        profile = profiler.get(profile_id) if authorized() else None
+        if profile is None:
+            return jsonify({'error': 'Not found'}), 404
+        if request.args.get('format') == 'json' or profile.running:
+            return jsonify(profile.summary()), 202 if profile.running else 200
+        return Response(profile.collapsed(), mimetype='text/plain')
+
+    @app.route('/profile', methods=['GET'])
+    def list_profiles():
+        if not authorized():
+            return jsonify({'error': 'Not found'}), 404
+        return jsonify(profiler.stats())
@@ -0,0 +1,257 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+# SQLite file shared by the Streamlit runner, every Flask worker and the pre-warm job
+SOIL_CACHE_PATH = os.getenv('SOIL_CACHE_PATH', 'soil_cache.sqlite3')
+# Precision 7 cells are about 153 m x 153 m, finer than the 250 m SoilGrids grid
+GEOHASH_PRECISION = int(os.getenv('SOIL_CACHE_PRECISION', '7'))
+# Coarsest prefix still trusted as a stand-in when SoilGrids can't be reached (5 is ~5 km)
+FALLBACK_PRECISION = int(os.getenv('SOIL_CACHE_FALLBACK_PRECISION', '5'))
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_BASE32_INDEX = {char: i for i, char in enumerate(_BASE32)}
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Standard base-32 geohash of a point"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        # Bits alternate longitude, latitude, starting with longitude
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            value = value * 2 + (lon >= mid)
+            lon_lo, lon_hi = (mid, lon_hi) if lon >= mid else (lon_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            value = value * 2 + (lat >= mid)
+            lat_lo, lat_hi = (mid, lat_hi) if lat >= mid else (lat_lo, mid)
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def geohash_bounds(geohash):
+    """Return (lat_min, lat_max, lon_min, lon_max) of a geohash cell"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = _BASE32_INDEX[char]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lat_hi, lon_lo, lon_hi
+
+
+def geohash_center(geohash):
+    lat_min, lat_max, lon_min, lon_max = geohash_bounds(geohash)
+    return (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+
+
+def cell_size(precision=GEOHASH_PRECISION):
+    """(lat_degrees, lon_degrees) spanned by one cell at this precision"""
+    n_bits = 5 * precision
+    lon_bits = (n_bits + 1) // 2
+    return 180.0 / 2 ** (n_bits - lon_bits), 360.0 / 2 ** lon_bits
+
+
+def iter_bbox_cells(lat_min, lat_max, lon_min, lon_max, precision=GEOHASH_PRECISION):
+    """Yield every geohash cell overlapping a bounding box, row by row"""
+    lat_step, lon_step = cell_size(precision)
+    lat_start = int((lat_min + 90) // lat_step)
+    lat_stop = int((lat_max + 90) // lat_step)
+    lon_start = int((lon_min + 180) // lon_step)
+    lon_stop = int((lon_max + 180) // lon_step)
+    for lat_cell in range(lat_start, lat_stop + 1):
+        lat = -90 + (lat_cell + 0.5) * lat_step
+        for lon_cell in range(lon_start, lon_stop + 1):
+            yield geohash_encode(lat, -180 + (lon_cell + 0.5) * lon_step, precision)
+
+
+def _prefix_range(prefix):
+    # Every geohash starting with prefix sorts inside [prefix, prefix + '~')
+    return prefix, prefix + '~'
+
+
+class SoilCache:
+    """Topsoil nitrogen and pH per geohash cell, persisted in SQLite
+
+    Values are the raw SoilGrids means (nitrogen in cg/kg, phh2o as pH x 10).
+    Rows are also kept in an in-process dict, so repeat lookups never touch disk.
+    Connections are opened per thread and after fork, so workers can share the file.
+    """
+
+    def __init__(self, path=SOIL_CACHE_PATH, precision=GEOHASH_PRECISION, memory_entries=100000):
+        self.path = path
+        self.precision = precision
+        self.memory_entries = memory_entries
+        self._memory = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS soil ('
+                'geohash TEXT PRIMARY KEY, nitrogen REAL NOT NULL, ph REAL NOT NULL, fetched_at REAL NOT NULL)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def key(self, lat, lon):
+        return geohash_encode(float(lat), float(lon), self.precision)
+
+    def get_cell(self, geohash):
+        """Return (nitrogen, ph) for a cell, or None if it has never been fetched"""
+        value = self._memory.get(geohash)
+        if value is None:
+            row = self._connection().execute(
+                'SELECT nitrogen, ph FROM soil WHERE geohash = ?', (geohash,)
+            ).fetchone()
+            if row is not None:
+                value = self._remember(geohash, row)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def get(self, lat, lon):
+        return self.get_cell(self.key(lat, lon))
+
+    def _remember(self, geohash, value):
+        value = (float(value[0]), float(value[1]))
+        if len(self._memory) >= self.memory_entries:
+            self._memory.clear()
+        self._memory[geohash] = value
+        return value
+
+    def put_many(self, rows):
+        """Store (geohash, nitrogen, ph) rows in one transaction"""
+        now = time.time()
+        rows = [(geohash, float(nitrogen), float(ph), now) for geohash, nitrogen, ph in rows]
+        connection = self._connection()
+        with connection:
+            connection.executemany('INSERT OR REPLACE INTO soil VALUES (?, ?, ?, ?)', rows)
+        for geohash, nitrogen, ph, _ in rows:
+            self._remember(geohash, (nitrogen, ph))
+
+    def put(self, lat, lon, nitrogen, ph):
+        self.put_many([(self.key(lat, lon), nitrogen, ph)])
+
+    def nearby(self, lat, lon, min_precision=FALLBACK_PRECISION):
+        """Average of the cached cells sharing the longest geohash prefix with a point
+
+        Used when SoilGrids is down or rate limiting; None if nothing is cached
+        within the min_precision cell.
+        """
+        geohash = self.key(lat, lon)
+        connection = self._connection()
+        for precision in range(self.precision - 1, min_precision - 1, -1):
+            nitrogen, ph, count = connection.execute(
+                'SELECT AVG(nitrogen), AVG(ph), COUNT(*) FROM soil WHERE geohash >= ? AND geohash < ?',
+                _prefix_range(geohash[:precision]),
+            ).fetchone()
+            if count:
+                with self._lock:
+                    self.fallbacks += 1
+                return float(nitrogen), float(ph)
+        return None
+
+    def missing(self, cells):
+        """The subset of cells that have no cached row yet, in input order"""
+        cells = list(cells)
+        connection = self._connection()
+        found = set()
+        for i in range(0, len(cells), 500):
+            batch = cells[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            found.update(row[0] for row in connection.execute(
+                f'SELECT geohash FROM soil WHERE geohash IN ({placeholders})', batch
+            ))
+        return [cell for cell in cells if cell not in found]
+
+    def stats(self):
+        with self._lock:
+            stats = {'hits': self.hits, 'misses': self.misses, 'fallbacks': self.fallbacks}
+        stats['memory_entries'] = len(self._memory)
+        stats['entries'] = self._connection().execute('SELECT COUNT(*) FROM soil').fetchone()[0]
+        return stats
+
+
+def prewarm(cache, fetch, lat_min, lat_max, lon_min, lon_max, delay=0.0, limit=None):
+    """Fetch every uncached cell of a bounding box from its centre point
+
+    delay spaces out requests to stay under the SoilGrids rate limit. Cells that
+    fail are reported and skipped, so the job can simply be run again.
+    Returns (fetched, failed).
+    """
+    cells = cache.missing(iter_bbox_cells(lat_min, lat_max, lon_min, lon_max, cache.precision))
+    if limit is not None:
+        cells = cells[:limit]
+    print(f"{len(cells)} uncached cells to fetch")
+
+    fetched = failed = 0
+    for i, cell in enumerate(cells):
+        lat, lon = geohash_center(cell)
+        try:
+            nitrogen, ph = fetch(lat, lon)
+        except Exception as e:
+            print(f"Failed to fetch {cell} ({lat:.5f}, {lon:.5f}): {e}")
+            failed += 1
+        else:
+            cache.put_many([(cell, nitrogen, ph)])
+            fetched += 1
+        if (i + 1) % 100 == 0:
+            print(f"Processed {i + 1}/{len(cells)} cells...")
+        if delay and i + 1 < len(cells):
+            time.sleep(delay)
+    return fetched, failed
+
+
+if __name__ == "__main__":
+    from upstream_clients import fetch_soil_n_and_ph
+
+    parser = argparse.ArgumentParser(description="Pre-warm the SoilGrids cache for a bounding box")
+    parser.add_argument('lat_min', type=float)
+    parser.add_argument('lat_max', type=float)
+    parser.add_argument('lon_min', type=float)
+    parser.add_argument('lon_max', type=float)
+    parser.add_argument('--precision', type=int, default=GEOHASH_PRECISION,
+                        help="geohash precision of the cells (lower is coarser)")
+    parser.add_argument('--delay', type=float, default=1.0,
+                        help="seconds to wait between SoilGrids requests")
+    parser.add_argument('--limit', type=int, default=None,
+                        help="fetch at most this many cells in this run")
+    args = parser.parse_args()
+
+    cache = SoilCache(precision=args.precision)
+    fetched, failed = prewarm(cache, fetch_soil_n_and_ph, args.lat_min, args.lat_max, args.lon_min, args.lon_max,
+                              delay=args.delay, limit=args.limit)
+    print(f"Fetched {fetched} cells, {failed} failed; {cache.stats()['entries']} cells cached in {SOIL_CACHE_PATH}")
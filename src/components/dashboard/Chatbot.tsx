@@ -76,14 +76,17 @@ export const Chatbot = () => {
 
       const decoder = new TextDecoder();
       let done = false;
+      // The backend relays raw chunks, so a JSON line can span two reads
+      let buffered = '';
 
       while (!done) {
         const { value, done: readerDone } = await reader.read();
         done = readerDone;
 
-        if (value) {
-          const chunk = decoder.decode(value);
-          const lines = chunk.split('\n');
+        if (value || done) {
+          buffered += value ? decoder.decode(value, { stream: true }) : decoder.decode();
+          const lines = buffered.split('\n');
+          buffered = done ? '' : lines.pop() ?? '';
 
           for (const line of lines) {
             if (line.trim()) {
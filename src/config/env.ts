@@ -12,6 +12,8 @@ export const config = {
   TRANSLATE_API_URL: import.meta.env.VITE_TRANSLATE_API_URL || "http://localhost:5001/translate",
   PREDICT_TOP3_API_URL: import.meta.env.VITE_PREDICT_TOP3_API_URL || "http://localhost:5001/predict-top3",
   PREDICT_PRICES_API_URL: import.meta.env.VITE_PREDICT_PRICES_API_URL || "http://localhost:5001/predict-prices",
+  SOIL_API_URL: import.meta.env.VITE_SOIL_API_URL || "http://localhost:5001/soil",
+  RECOMMEND_API_URL: import.meta.env.VITE_RECOMMEND_API_URL || "http://localhost:5001/recommend",
   
   // External APIs
   SOILGRIDS_BASE_URL: import.meta.env.VITE_SOILGRIDS_BASE_URL || "https://rest.isric.org/soilgrids/v2.0/properties/query",
@@ -1,4 +1,4 @@
-import { createContext, useContext, useEffect, useMemo, useState } from "react";
+import { createContext, useContext, useEffect, useMemo, useRef, useState } from "react";
 import { translateAPI } from "@/services/api";
 
 type LanguageCode = string;
@@ -16,6 +16,9 @@ const LanguageContext = createContext<LanguageContextValue | null>(null);
 
 const STORAGE_KEY = "app-language";
 
+// translate() calls made within this window go to the backend as one batch
+const BATCH_WINDOW_MS = 10;
+
 function loadCacheKey(code: LanguageCode) {
   return `translations-${code}`;
 }
@@ -57,6 +60,32 @@ export const LanguageProvider = ({
     }
   };
 
+  // Strings waiting for the next batch, each with the callers awaiting it
+  const pending = useRef<Map<string, Array<(value: string) => void>>>(new Map());
+  const flushTimer = useRef<ReturnType<typeof setTimeout> | null>(null);
+
+  const flush = async (target: LanguageCode) => {
+    flushTimer.current = null;
+    const batch = pending.current;
+    pending.current = new Map();
+    const texts = Array.from(batch.keys());
+    const translated = await translateAPI.translateMany(texts, "auto", target);
+
+    const additions: TranslationCache = {};
+    texts.forEach((text, i) => {
+      const value = translated[i] ?? text;
+      if (value !== text) additions[text] = value;
+      batch.get(text)?.forEach((resolve) => resolve(value));
+    });
+    if (Object.keys(additions).length) {
+      setCache((current) => {
+        const updated = { ...current, ...additions };
+        persistCache(updated);
+        return updated;
+      });
+    }
+  };
+
   const setLanguage = (code: LanguageCode) => {
     setLanguageState(code);
   };
@@ -72,16 +101,22 @@ export const LanguageProvider = ({
     if (cache[text]) {
       return cache[text];
     }
-    try {
-      const translated = await translateAPI.translate(text, "auto", language);
-      const updated = { ...cache, [text]: translated };
-      setCache(updated);
-      persistCache(updated);
-      return translated;
-    } catch (error) {
-      console.error(`Translation failed for "${text}":`, error);
-      return text; // graceful fallback
-    }
+    // Identical strings requested before the flush share one slot in the batch
+    return new Promise<string>((resolve) => {
+      const waiters = pending.current.get(text);
+      if (waiters) {
+        waiters.push(resolve);
+      } else {
+        pending.current.set(text, [resolve]);
+      }
+      if (!flushTimer.current) {
+        flushTimer.current = setTimeout(() => {
+          flush(language).catch((error) => {
+            console.error("Batch translation failed:", error);
+          });
+        }, BATCH_WINDOW_MS);
+      }
+    });
   };
 
   const value = useMemo(
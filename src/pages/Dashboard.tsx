@@ -153,26 +153,31 @@ export const Dashboard = ({ user, onLogout }: DashboardProps) => {
           weatherData: { temperature, humidity, rainfall },
         });
 
-        const resTop = await modelAPI.predictTop3({
-          N,
-          ph,
-          temperature,
-          humidity,
-          rainfall,
-        });
-        setTop3(resTop.top3);
-        if (resTop.top3?.[0]?.name) setPredictedCrop(resTop.top3[0].name);
-
-        // Get price predictions for the top 3 crops
-        if (resTop.top3 && resTop.top3.length > 0) {
-          const cropNames = resTop.top3.map((crop) => crop.name);
-          const priceRes = await modelAPI.predictPrices(
-            cropNames,
-            location.latitude,
-            location.longitude
-          );
-          setPricePredictions(priceRes.price_predictions);
-        }
+        // Top 3 crops by probability with their price forecasts, in one request
+        const res = await modelAPI.recommend(
+          { N, ph, temperature, humidity, rainfall },
+          location.latitude,
+          location.longitude,
+          { score: "probability", k: 3, min_probability: 0 }
+        );
+        const top = res.recommendations.map((crop) => ({
+          name: crop.name,
+          score: crop.probability,
+        }));
+        setTop3(top);
+        if (top[0]?.name) setPredictedCrop(top[0].name);
+        setPricePredictions(
+          res.recommendations
+            .filter((crop) => crop.predicted_price_90d !== undefined)
+            .map((crop) => ({
+              crop_name: crop.name,
+              predicted_price_90d: crop.predicted_price_90d!,
+              current_price: crop.current_price!,
+              price_change: crop.price_change!,
+              price_change_percent: crop.price_change_percent!,
+              harvest_month: crop.harvest_month!,
+            }))
+        );
       } catch (err) {
         console.error("Recommendation pipeline error:", err);
         toast({
@@ -318,6 +318,8 @@ import { config } from "@/config/env";
 const OPENWEATHER_API_KEY = config.OPENWEATHER_API_KEY;
 const TRANSLATE_API_URL = config.TRANSLATE_API_URL;
 const SOILGRIDS_BASE_URL = config.SOILGRIDS_BASE_URL;
+const SOIL_API_URL = config.SOIL_API_URL;
+const RECOMMEND_API_URL = config.RECOMMEND_API_URL;
 
 
 
@@ -393,6 +395,19 @@ export const soilAPI = {
       lat = Math.max(-90, Math.min(90, lat));
       lon = Math.max(-180, Math.min(180, lon));
 
+      // Backend cache first: answers repeat locations locally and survives SoilGrids outages
+      try {
+        const cached = await axios.post(SOIL_API_URL, { latitude: lat, longitude: lon }, {
+          headers: { "Content-Type": "application/json" },
+        });
+        const { nitrogen, phh2o } = cached.data || {};
+        if (typeof nitrogen === "number" && typeof phh2o === "number") {
+          return { N: nitrogen, ph: phh2o / 10 }; // SoilGrids gives pH*10
+        }
+      } catch (error) {
+        console.warn("Soil cache unavailable, querying SoilGrids directly:", (error as any)?.message || error);
+      }
+
       let nitrogen: number | null = null;
       let ph: number | null = null;
 
@@ -491,6 +506,47 @@ export const modelAPI = {
       throw error;
     }
   },
+  // Crop probabilities and price forecasts in one round trip, ranked by score
+  // ("expected_value" = probability x forecast price, "probability", "price", "expected_gain")
+  recommend: async (
+    features: {
+      N: number;
+      ph: number;
+      temperature: number;
+      humidity: number;
+      rainfall: number;
+    },
+    latitude: number,
+    longitude: number,
+    options: { score?: string; k?: number; min_probability?: number } = {}
+  ) => {
+    try {
+      const response = await axios.post(RECOMMEND_API_URL, {
+        ...features,
+        latitude,
+        longitude,
+        ...options,
+      }, {
+        headers: { "Content-Type": "application/json" },
+      });
+      return response.data as {
+        score: string;
+        recommendations: Array<{
+          name: string;
+          probability: number;
+          score: number | null;
+          predicted_price_90d?: number;
+          current_price?: number;
+          price_change?: number;
+          price_change_percent?: number;
+          harvest_month?: string;
+        }>;
+      };
+    } catch (error) {
+      console.error("Error calling recommendation API:", (error as any)?.response?.data || error);
+      throw error;
+    }
+  },
 };
 
 // MyMemory Translation API
@@ -538,6 +594,39 @@ export const translateAPI = {
       return text; // Return original text on error
     }
   },
+
+  // One request for many strings; the backend only sends its cache misses upstream
+  translateMany: async (texts: string[], source: string, target: string) => {
+    if (!texts.length || !target) {
+      return texts;
+    }
+    if (!((source === 'en' && target === 'hi') || (source === 'hi' && target === 'en') || (source === 'auto' && target === 'hi'))) {
+      return texts;
+    }
+    const results: string[] = [];
+    // The backend accepts at most 500 strings per request
+    for (let start = 0; start < texts.length; start += 500) {
+      const chunk = texts.slice(start, start + 500);
+      try {
+        const response = await axios.post(TRANSLATE_API_URL, {
+          texts: chunk,
+          source,
+          target
+        }, {
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          timeout: 30000,
+        });
+        const translations = response.data?.translations;
+        results.push(...(Array.isArray(translations) && translations.length === chunk.length ? translations : chunk));
+      } catch (error) {
+        console.error("Translation error:", error.message);
+        results.push(...chunk);
+      }
+    }
+    return results;
+  },
 };
 
 // Geolocation helper
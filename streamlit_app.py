@@ -1,75 +1,10 @@
-import os
-import requests
 import streamlit as st
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-SOILGRIDS_BASE_URL = os.getenv("SOILGRIDS_BASE_URL", "https://rest.isric.org/soilgrids/v2.0/properties/query")
-OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "f273e9ce95f51d30254d4775f42c5a72")
-MODEL_PREDICT_URL = os.getenv("MODEL_PREDICT_URL", "http://127.0.0.1:5001/predict")
-
-
-def fetch_soil_n_and_ph(lat: float, lon: float) -> tuple[float, float]:
-    params = {
-        "lon": lon,
-        "lat": lat,
-        "property": ",".join(["nitrogen", "phh2o"]),
-        "depth": "0-5cm",
-        "value": "mean",
-    }
-    r = requests.get(SOILGRIDS_BASE_URL, params=params, timeout=20)
-    r.raise_for_status()
-    data = r.json()
-    layers = data.get("properties", {}).get("layers", []) or data.get("layers", [])
-
-    nitrogen = None
-    ph = None
-    for layer in layers:
-        name = str(layer.get("name") or layer.get("variable") or "").lower()
-        depths = layer.get("depths", [])
-        first_depth = depths[0] if depths else {}
-        values = first_depth.get("values", {})
-        mean = values.get("mean", None)
-        if isinstance(mean, (int, float)):
-            if "nitrogen" in name:
-                nitrogen = mean
-            if "phh2o" in name or name == "ph":
-                ph = mean
-
-    if nitrogen is None or ph is None:
-        raise ValueError("Could not parse SoilGrids response for N and pH")
-
-    return float(nitrogen), float(ph)
-
-
-def fetch_openweather(lat: float, lon: float) -> tuple[float, float, float]:
-    url = "https://api.openweathermap.org/data/2.5/weather"
-    params = {"lat": lat, "lon": lon, "appid": OPENWEATHER_API_KEY, "units": "metric"}
-    r = requests.get(url, params=params, timeout=20)
-    r.raise_for_status()
-    data = r.json()
-    temperature = float(data.get("main", {}).get("temp", 0))
-    humidity = float(data.get("main", {}).get("humidity", 0))
-    rain_block = data.get("rain", {}) or {}
-    rainfall = float(rain_block.get("1h") or rain_block.get("3h") or 0)
-    return temperature, humidity, rainfall
-
-
-def call_model_predict(N: float, temperature: float, humidity: float, ph: float, rainfall: float) -> str:
-    payload = {
-        "N": N,
-      
-        "temperature": temperature,
-        "humidity": humidity,
-        "ph": ph,
-        "rainfall": rainfall,
-    }
-    r = requests.post(MODEL_PREDICT_URL, json=payload, timeout=20)
-    r.raise_for_status()
-    data = r.json()
-    return str(data.get("predicted_crop", "Unknown"))
+from upstream_clients import (
+    MODEL_PREDICT_URL,
+    call_model_predict,
+    fetch_conditions,
+    latencies,
+)
 
 
 st.set_page_config(page_title="AI Crop Planner - Streamlit", layout="centered")
@@ -91,10 +26,8 @@ with st.form("inputs"):
 
 if submitted:
     try:
-        with st.spinner("Fetching soil properties..."):
-            N, ph = fetch_soil_n_and_ph(lat, lon)
-        with st.spinner("Fetching weather..."):
-            temperature, humidity, rainfall = fetch_openweather(lat, lon)
+        with st.spinner("Fetching soil properties and weather..."):
+            (N, ph), (temperature, humidity, rainfall) = fetch_conditions(lat, lon)
 
         # Apply manual overrides if provided (> 0)
         if manual_N > 0:
@@ -109,7 +42,7 @@ if submitted:
             rainfall = manual_rain
 
         with st.spinner("Calling model..."):
-            crop = call_model_predict(N, ph, temperature, humidity, rainfall)
+            crop = call_model_predict(N, temperature, humidity, ph, rainfall)
 
         st.success(f"Recommended Crop: {crop}")
         st.json({
@@ -123,6 +56,9 @@ if submitted:
     except Exception as e:
         st.error(f"Error: {e}")
 
+    st.caption("Upstream latency (ms)")
+    st.json(latencies.summary())
+
 st.divider()
 st.write("Model endpoint:", MODEL_PREDICT_URL)
 st.write("Set OPENWEATHER_API_KEY or MODEL_PREDICT_URL via environment variables if needed.")
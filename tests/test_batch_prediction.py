@@ -0,0 +1,55 @@
+import io
+import json
+import pytest
+
+import batch_prediction
+from batch_prediction import JsonArrayParser, iter_json_array_rows
+
+ROWS = [
+    {'N': 90, 'temperature': 25.5, 'humidity': 80.25, 'ph': 6.5, 'rainfall': 200, 'id': 'é'},
+    {'N': 1e3, 'temperature': -3, 'humidity': 0, 'ph': 7, 'rainfall': 12345678901234567890},
+    [1, 2, 3],
+    None,
+]
+BODY = (' [ ' + ' ,\n'.join(json.dumps(row, ensure_ascii=False) for row in ROWS) + ' ] ').encode()
+
+
+def iter_pieces(body, size):
+    """Feed body to a parser size bytes at a time, as an async request stream would"""
+    parser = JsonArrayParser()
+    for start in range(0, len(body), size):
+        yield from parser.feed(body[start:start + size])
+    yield from parser.feed(b'', final=True)
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, len(BODY)])
+def test_parser_matches_json_loads_for_any_split(size):
+    # Splits land inside numbers, strings and multi-byte characters
+    assert list(iter_pieces(BODY, size)) == json.loads(BODY)
+
+
+@pytest.mark.parametrize('body, rows, error', [
+    (b'[]', [], None),
+    (b'', [], 'Unexpected end of JSON array'),
+    (b'{"N": 1}', [], 'Expected a JSON array of feature rows'),
+    (b'[1, 2', [1, 2], 'Unexpected end of JSON array'),
+    (b'[1 2]', [1], 'Expected "," or "]" in JSON array'),
+    (b'[1, oops]', [1], 'Malformed JSON array element'),
+    (b'[1, 2] trailing', [1, 2], None),
+])
+@pytest.mark.parametrize('size', [1, 1000])
+def test_parser_yields_rows_before_an_error(body, rows, error, size):
+    parsed = []
+    try:
+        for row in iter_pieces(body, size):
+            parsed.append(row)
+    except ValueError as e:
+        assert str(e) == error
+    else:
+        assert error is None
+    assert parsed == rows
+
+
+def test_iter_json_array_rows_reads_the_stream(monkeypatch):
+    monkeypatch.setattr(batch_prediction, 'READ_SIZE', 5)
+    assert list(iter_json_array_rows(io.BytesIO(BODY))) == json.loads(BODY)
@@ -0,0 +1,178 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('sklearn')
+pytest.importorskip('catboost')
+joblib = pytest.importorskip('joblib')
+
+import compiled_models
+from compiled_models import ForestClassifier, LabelTable, ObliviousBoostingRegressor
+from model_export import (
+    PRICE_TOLERANCE, PROBA_TOLERANCE, crop_sample, export_catboost, export_forest, price_sample,
+    unseen_price_sample,
+)
+from price_store import file_checksum
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CROP_MODEL = os.path.join(ROOT, 'crop_model.pkl')
+LABEL_ENCODER = os.path.join(ROOT, 'label_encoder.pkl')
+PRICE_MODEL = os.path.join(ROOT, 'price_model.pkl')
+
+# A few real names, so the tests don't need the price CSV that price_categories() reads
+CATEGORIES = {
+    'crop_id': ['Maize', 'Onion', 'Potato', 'Rice', 'Tomato', 'Wheat'],
+    'district_id': ['Bangalore', 'Delhi', 'Kolkata', 'Mumbai', 'Pune', 'Unknown'],
+}
+
+
+@pytest.fixture(scope='module')
+def crop_models():
+    model = joblib.load(CROP_MODEL)
+    label_encoder = joblib.load(LABEL_ENCODER)
+    arrays = export_forest(model, label_encoder, 'test', 'test')
+    compiled = ForestClassifier(
+        arrays['classes'], arrays['feature_names'].tolist(), arrays['roots'], arrays['feature'],
+        arrays['threshold'], arrays['left'], arrays['right'], arrays['proba'], arrays['max_depth'],
+    )
+    return model, label_encoder, compiled, LabelTable(arrays['label_classes'])
+
+
+@pytest.fixture(scope='module')
+def price_models():
+    model = joblib.load(PRICE_MODEL)
+    return model, export_catboost(model, CATEGORIES, 'test')
+
+
+def split_rows(model, n_rows=200):
+    """Rows sitting exactly on split thresholds, where float32 rounding decides the branch"""
+    rng = np.random.default_rng(2)
+    rows = crop_sample(n_rows, seed=3).to_numpy(copy=True)
+    tree = model.estimators_[0].tree_
+    internal = np.flatnonzero(tree.children_left >= 0)
+    nodes = rng.choice(internal, n_rows)
+    rows[np.arange(n_rows), tree.feature[nodes]] = tree.threshold[nodes]
+    return pd.DataFrame(rows, columns=crop_sample(1).columns)
+
+
+def test_forest_matches_pickle(crop_models):
+    model, label_encoder, compiled, labels = crop_models
+    sample = pd.concat([crop_sample(5000), split_rows(model)], ignore_index=True)
+
+    assert np.abs(compiled.predict_proba(sample) - model.predict_proba(sample)).max() <= PROBA_TOLERANCE
+    assert (labels.inverse_transform(compiled.predict(sample))
+            == label_encoder.inverse_transform(model.predict(sample))).all()
+
+
+def test_forest_accepts_arrays(crop_models):
+    model, _, compiled, _ = crop_models
+    sample = crop_sample(100, seed=4)
+
+    assert np.array_equal(compiled.predict_proba(sample.to_numpy()), compiled.predict_proba(sample))
+
+
+def test_boosting_matches_pickle_on_known_names(price_models):
+    model, arrays = price_models
+    compiled = ObliviousBoostingRegressor(arrays)
+    sample = price_sample(CATEGORIES['crop_id'], CATEGORIES['district_id'], n_rows=5000)
+
+    expected = model.predict(sample)
+    assert np.abs(compiled.predict(sample) - expected).max() <= PRICE_TOLERANCE * np.abs(expected).max()
+    assert not compiled.unseen_rows(sample).any()
+
+
+def test_boosting_matches_pickle_on_unseen_names(price_models):
+    model, arrays = price_models
+    compiled = ObliviousBoostingRegressor(arrays)
+    sample = unseen_price_sample(CATEGORIES, n_rows=2000)
+
+    assert compiled.unseen_rows(sample).all()
+    expected = model.predict(sample)
+    assert np.abs(compiled.predict(sample) - expected).max() <= PRICE_TOLERANCE * np.abs(expected).max()
+
+
+class ConstantModel:
+    def __init__(self):
+        self.rows = 0
+
+    def predict(self, X):
+        self.rows += len(X)
+        return np.full(len(X), -1.0)
+
+
+def test_unverified_export_sends_unseen_rows_to_fallback(price_models):
+    model, arrays = price_models
+    compiled = ObliviousBoostingRegressor({**arrays, 'unseen_categories_exact': np.bool_(False)})
+    compiled.fallback = ConstantModel()
+    sample = pd.concat([
+        price_sample(CATEGORIES['crop_id'], CATEGORIES['district_id'], n_rows=50),
+        unseen_price_sample(CATEGORIES, n_rows=50),
+    ], ignore_index=True)
+
+    predictions = compiled.predict(sample)
+    assert compiled.fallback.rows == 50
+    assert (predictions[50:] == -1.0).all()
+    assert np.allclose(predictions[:50], model.predict(sample[:50]), rtol=PRICE_TOLERANCE)
+
+    # Plain arrays go through the same path
+    compiled.fallback = ConstantModel()
+    assert (compiled.predict(sample.to_numpy(dtype=object))[50:] == -1.0).all()
+
+
+def test_verified_export_skips_fallback(price_models):
+    _, arrays = price_models
+    compiled = ObliviousBoostingRegressor({**arrays, 'unseen_categories_exact': np.bool_(True)})
+    compiled.fallback = ConstantModel()
+
+    compiled.predict(unseen_price_sample(CATEGORIES, n_rows=50))
+    assert compiled.fallback.rows == 0
+
+
+@pytest.mark.parametrize('exact', [True, False, None])
+def test_load_price_model_loads_fallback_unless_verified(price_models, tmp_path, monkeypatch, exact):
+    _, arrays = price_models
+    arrays = {**arrays, 'source_sha256': np.array(file_checksum(PRICE_MODEL))}
+    if exact is None:
+        # Exports from before the check
+        arrays.pop('unseen_categories_exact', None)
+    else:
+        arrays['unseen_categories_exact'] = np.bool_(exact)
+    path = str(tmp_path / 'price_model.npz')
+    np.savez(path, **arrays)
+    monkeypatch.setattr(compiled_models, 'USE_COMPILED_MODELS', True)
+
+    model = compiled_models.load_price_model(PRICE_MODEL, path)
+    assert isinstance(model, ObliviousBoostingRegressor)
+    assert (model.fallback is None) == bool(exact)
+
+
+def test_load_crop_model_falls_back_when_the_encoder_changes(crop_models, tmp_path, monkeypatch):
+    model, label_encoder, _, _ = crop_models
+    encoder_path = str(tmp_path / 'label_encoder.pkl')
+    joblib.dump(label_encoder, encoder_path)
+    arrays_path = str(tmp_path / 'crop_model.npz')
+    np.savez(arrays_path, **export_forest(model, label_encoder, file_checksum(CROP_MODEL), file_checksum(encoder_path)))
+    monkeypatch.setattr(compiled_models, 'USE_COMPILED_MODELS', True)
+
+    loaded, labels = compiled_models.load_crop_model(CROP_MODEL, encoder_path, arrays_path)
+    assert isinstance(loaded, ForestClassifier) and isinstance(labels, LabelTable)
+
+    # Retrained encoder alone: the exported class names are stale
+    retrained = type(label_encoder)().fit([name.upper() for name in label_encoder.classes_])
+    joblib.dump(retrained, encoder_path)
+    loaded, labels = compiled_models.load_crop_model(CROP_MODEL, encoder_path, arrays_path)
+    assert not isinstance(loaded, ForestClassifier)
+    assert list(labels.classes_) == list(retrained.classes_)
+
+
+def test_load_crop_model_falls_back_for_exports_without_the_encoder_checksum(crop_models, tmp_path, monkeypatch):
+    model, label_encoder, _, _ = crop_models
+    arrays = export_forest(model, label_encoder, file_checksum(CROP_MODEL), 'unused')
+    del arrays['encoder_sha256']
+    arrays_path = str(tmp_path / 'crop_model.npz')
+    np.savez(arrays_path, **arrays)
+    monkeypatch.setattr(compiled_models, 'USE_COMPILED_MODELS', True)
+
+    loaded, _ = compiled_models.load_crop_model(CROP_MODEL, LABEL_ENCODER, arrays_path)
+    assert not isinstance(loaded, ForestClassifier)
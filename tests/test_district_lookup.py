@@ -0,0 +1,148 @@
+import math
+import numpy as np
+import pytest
+from district_lookup import DistrictGrid, REGION_BOXES, DEFAULT_DISTRICT
+
+
+def legacy_district(lat, lon):
+    """PricePredictionService.get_district_from_coords as it was before DistrictGrid"""
+    if 28.4 <= lat <= 28.9 and 76.8 <= lon <= 77.4:
+        return "Delhi"
+    elif 18.8 <= lat <= 19.3 and 72.7 <= lon <= 73.2:
+        return "Mumbai"
+    elif 12.8 <= lat <= 13.2 and 77.4 <= lon <= 77.8:
+        return "Bangalore"
+    elif 12.8 <= lat <= 13.2 and 80.1 <= lon <= 80.4:
+        return "Chennai"
+    elif 22.4 <= lat <= 22.8 and 88.2 <= lon <= 88.6:
+        return "Kolkata"
+    elif 17.2 <= lat <= 17.6 and 78.2 <= lon <= 78.8:
+        return "Hyderabad"
+    elif 30.5 <= lat <= 31.5 and 74.5 <= lon <= 76.5:
+        return "Punjab"
+    elif 22.0 <= lat <= 24.5 and 68.0 <= lon <= 74.5:
+        return "Gujarat"
+    elif 8.0 <= lat <= 13.5 and 76.0 <= lon <= 80.5:
+        return "Tamil Nadu"
+    elif 11.5 <= lat <= 18.5 and 74.0 <= lon <= 78.5:
+        return "Karnataka"
+    elif 15.5 <= lat <= 22.0 and 72.5 <= lon <= 80.5:
+        return "Maharashtra"
+    elif 12.0 <= lat <= 19.5 and 76.5 <= lon <= 84.5:
+        return "Andhra Pradesh"
+    elif 15.5 <= lat <= 19.5 and 77.0 <= lon <= 81.0:
+        return "Telangana"
+    elif 21.5 <= lat <= 27.0 and 85.5 <= lon <= 89.5:
+        return "West Bengal"
+    elif 24.0 <= lat <= 31.0 and 77.0 <= lon <= 84.5:
+        return "Uttar Pradesh"
+    elif 21.0 <= lat <= 26.5 and 74.0 <= lon <= 82.5:
+        return "Madhya Pradesh"
+    elif 23.0 <= lat <= 30.5 and 69.5 <= lon <= 78.5:
+        return "Rajasthan"
+    elif 27.5 <= lat <= 30.5 and 74.5 <= lon <= 77.5:
+        return "Haryana"
+    elif 8.0 <= lat <= 12.5 and 74.5 <= lon <= 77.5:
+        return "Kerala"
+    elif 17.5 <= lat <= 22.5 and 81.0 <= lon <= 87.5:
+        return "Odisha"
+    elif 24.0 <= lat <= 28.0 and 89.5 <= lon <= 96.5:
+        return "Assam"
+    elif 24.0 <= lat <= 27.5 and 83.0 <= lon <= 88.5:
+        return "Bihar"
+    elif 21.5 <= lat <= 25.0 and 83.0 <= lon <= 87.5:
+        return "Jharkhand"
+    elif 17.5 <= lat <= 24.0 and 80.0 <= lon <= 84.5:
+        return "Chhattisgarh"
+    elif 28.5 <= lat <= 31.5 and 77.5 <= lon <= 81.5:
+        return "Uttarakhand"
+    elif 30.5 <= lat <= 33.5 and 75.5 <= lon <= 79.5:
+        return "Himachal Pradesh"
+    elif 32.0 <= lat <= 37.0 and 73.5 <= lon <= 80.5:
+        return "Jammu and Kashmir"
+    elif 32.0 <= lat <= 37.0 and 75.5 <= lon <= 80.5:
+        return "Ladakh"
+    elif 14.5 <= lat <= 15.8 and 73.5 <= lon <= 74.5:
+        return "Goa"
+    elif 27.0 <= lat <= 28.5 and 88.0 <= lon <= 89.0:
+        return "Sikkim"
+    elif 26.0 <= lat <= 29.5 and 91.5 <= lon <= 97.5:
+        return "Arunachal Pradesh"
+    elif 25.0 <= lat <= 27.5 and 93.0 <= lon <= 95.5:
+        return "Nagaland"
+    elif 23.5 <= lat <= 25.5 and 93.0 <= lon <= 94.5:
+        return "Manipur"
+    elif 22.0 <= lat <= 24.5 and 92.0 <= lon <= 93.5:
+        return "Mizoram"
+    elif 22.5 <= lat <= 24.5 and 91.0 <= lon <= 92.5:
+        return "Tripura"
+    elif 25.0 <= lat <= 26.5 and 89.5 <= lon <= 92.5:
+        return "Meghalaya"
+    elif 6.0 <= lat <= 14.0 and 92.0 <= lon <= 94.0:
+        return "Andaman and Nicobar"
+    elif 8.0 <= lat <= 12.0 and 71.0 <= lon <= 74.0:
+        return "Lakshadweep"
+    elif 11.5 <= lat <= 12.5 and 79.5 <= lon <= 80.0:
+        return "Puducherry"
+    elif 20.0 <= lat <= 20.5 and 72.5 <= lon <= 73.5:
+        return "Dadra and Nagar Haveli"
+    elif 20.0 <= lat <= 20.5 and 72.5 <= lon <= 73.5:
+        return "Daman and Diu"
+    elif 30.5 <= lat <= 31.0 and 76.5 <= lon <= 77.0:
+        return "Chandigarh"
+    else:
+        return "Adilabad"
+
+
+@pytest.fixture(scope='module')
+def grid():
+    return DistrictGrid()
+
+
+def boundary_values(edges):
+    """Every box edge, the nearest floats on either side, and points a little further out"""
+    values = set()
+    for edge in edges:
+        values.update((edge, math.nextafter(edge, -math.inf), math.nextafter(edge, math.inf),
+                       edge - 0.01, edge + 0.01))
+    return sorted(values)
+
+
+def assert_matches(grid, lats, lons):
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    expected = [legacy_district(lat, lon) for lat, lon in zip(lats.tolist(), lons.tolist())]
+    assert grid.lookup(lats, lons).tolist() == expected
+    assert [grid.lookup_one(lat, lon) for lat, lon in zip(lats.tolist(), lons.tolist())] == expected
+
+
+def test_default_outside_every_region(grid):
+    assert DEFAULT_DISTRICT == legacy_district(0.0, 0.0)
+    assert grid.lookup_one(0.0, 0.0) == DEFAULT_DISTRICT
+    assert grid.lookup_one(51.5, -0.1) == DEFAULT_DISTRICT
+
+
+def test_sweep_matches_legacy_chain(grid):
+    # 0.05 degree steps over the whole area the boxes cover, plus a margin
+    lats, lons = np.meshgrid(np.arange(4.0, 39.0, 0.05), np.arange(66.0, 99.5, 0.05), indexing='ij')
+    assert_matches(grid, lats.ravel(), lons.ravel())
+
+
+def test_box_edges_match_legacy_chain(grid):
+    lat_values = boundary_values(box[1] for box in REGION_BOXES) + boundary_values(box[2] for box in REGION_BOXES)
+    lon_values = boundary_values(box[3] for box in REGION_BOXES) + boundary_values(box[4] for box in REGION_BOXES)
+    lats, lons = np.meshgrid(sorted(set(lat_values)), sorted(set(lon_values)), indexing='ij')
+    assert_matches(grid, lats.ravel(), lons.ravel())
+
+
+def test_box_corners_match_legacy_chain(grid):
+    corners = [(lat, lon) for _, lat_min, lat_max, lon_min, lon_max in REGION_BOXES
+               for lat in (lat_min, lat_max) for lon in (lon_min, lon_max)]
+    lats, lons = zip(*corners)
+    assert_matches(grid, lats, lons)
+
+
+def test_non_finite_coordinates_use_default(grid):
+    lats = [math.nan, math.inf, -math.inf, 20.0, 20.0]
+    lons = [77.0, 77.0, 77.0, math.nan, math.inf]
+    assert_matches(grid, lats, lons)
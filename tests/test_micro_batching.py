@@ -0,0 +1,146 @@
+import threading
+import time
+import numpy as np
+import pytest
+
+from micro_batching import MicroBatcher
+
+WAIT = 5
+
+
+class BlockingModel:
+    """Doubles its input; the first call blocks until released, so later submissions queue up"""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.calls = []
+        self.release = threading.Event()
+        self._first = True
+
+    def __call__(self, rows):
+        if self._first:
+            self._first = False
+            assert self.release.wait(WAIT)
+        self.calls.append(len(rows))
+        if self.fail_on is not None and (rows == self.fail_on).any():
+            raise ValueError(f'bad row {self.fail_on}')
+        return rows * 2
+
+
+def submit_in_threads(batcher, values):
+    """Submit one single-row request per value from its own thread; results[i] is output or exception"""
+    results = [None] * len(values)
+
+    def submit(i, value):
+        try:
+            results[i] = batcher.submit([[value]])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=submit, args=(i, value)) for i, value in enumerate(values)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def join(threads):
+    for thread in threads:
+        thread.join(WAIT)
+    assert not any(thread.is_alive() for thread in threads)
+
+
+def test_lone_request_is_scored_in_the_caller_thread():
+    batcher = MicroBatcher(lambda rows: rows * 2, window=10, max_rows=4)
+    assert batcher.submit([[1.0, 2.0]]).tolist() == [[2.0, 4.0]]
+    assert batcher._thread is None
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    model = BlockingModel()
+    batcher = MicroBatcher(model, window=60, max_rows=4)
+    first, first_result = submit_in_threads(batcher, [0.5])
+    while batcher.stats()['requests'] < 1:
+        time.sleep(0.001)
+
+    threads, results = submit_in_threads(batcher, [1.0, 2.0, 3.0, 4.0])
+    join(threads)
+    assert model.calls == [4]
+    assert [result.tolist() for result in results] == [[[2.0]], [[4.0]], [[6.0]], [[8.0]]]
+
+    model.release.set()
+    join(first)
+    assert first_result[0].tolist() == [[1.0]]
+    batcher.close()
+
+
+def test_partial_batch_is_sent_when_the_window_closes():
+    model = BlockingModel()
+    batcher = MicroBatcher(model, window=0.3, max_rows=64)
+    first, _ = submit_in_threads(batcher, [0.5])
+    while batcher.stats()['requests'] < 1:
+        time.sleep(0.001)
+
+    started = time.monotonic()
+    threads, results = submit_in_threads(batcher, [1.0, 2.0])
+    join(threads)
+    assert time.monotonic() - started >= 0.3
+    assert model.calls == [2]
+    assert [result.tolist() for result in results] == [[[2.0]], [[4.0]]]
+
+    model.release.set()
+    join(first)
+    batcher.close()
+
+
+def test_failed_batch_is_retried_per_request():
+    model = BlockingModel(fail_on=-1.0)
+    batcher = MicroBatcher(model, window=60, max_rows=3)
+    first, _ = submit_in_threads(batcher, [0.5])
+    while batcher.stats()['requests'] < 1:
+        time.sleep(0.001)
+
+    threads, results = submit_in_threads(batcher, [1.0, -1.0, 2.0])
+    join(threads)
+    # Only the request with the bad row fails
+    assert isinstance(results[1], ValueError)
+    assert results[0].tolist() == [[2.0]] and results[2].tolist() == [[4.0]]
+
+    model.release.set()
+    join(first)
+    batcher.close()
+
+
+def test_error_reaches_every_waiter():
+    def broken(rows):
+        raise RuntimeError('model unavailable')
+
+    model = BlockingModel()
+    batcher = MicroBatcher(model, window=60, max_rows=3)
+    first, _ = submit_in_threads(batcher, [0.5])
+    while batcher.stats()['requests'] < 1:
+        time.sleep(0.001)
+    batcher.predict = broken
+
+    threads, results = submit_in_threads(batcher, [1.0, 2.0, 3.0])
+    join(threads)
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    model.release.set()
+    join(first)
+    batcher.close()
+
+
+def test_closed_batcher_scores_in_the_caller_thread():
+    batcher = MicroBatcher(lambda rows: rows + 1, window=60, max_rows=4)
+    batcher.close()
+    threads, results = submit_in_threads(batcher, [1.0, 2.0, 3.0])
+    join(threads)
+    assert [result.tolist() for result in results] == [[[2.0]], [[3.0]], [[4.0]]]
+
+
+@pytest.mark.parametrize('n_rows', [4, 10])
+def test_large_requests_skip_the_queue(n_rows):
+    batcher = MicroBatcher(lambda rows: rows.sum(axis=1), window=60, max_rows=4)
+    rows = np.ones((n_rows, 2))
+    assert batcher.submit(rows).tolist() == [2.0] * n_rows
+    assert batcher.stats()['requests'] == 0
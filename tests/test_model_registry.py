@@ -0,0 +1,84 @@
+import os
+import shutil
+import threading
+import time
+import pytest
+
+pytest.importorskip('sklearn')
+pytest.importorskip('catboost')
+
+from model_registry import MODEL_FILES, ModelRegistry
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def add_version(model_dir, version):
+    """A version directory with the repo's pickles and, if exported, their arrays"""
+    path = os.path.join(model_dir, version)
+    os.makedirs(path)
+    for filename in MODEL_FILES + ('crop_model.npz', 'price_model.npz'):
+        if os.path.exists(os.path.join(ROOT, filename)):
+            shutil.copy2(os.path.join(ROOT, filename), os.path.join(path, filename))
+
+
+@pytest.fixture
+def registry(tmp_path):
+    add_version(tmp_path, 'v1')
+    registry = ModelRegistry(str(tmp_path), pinned=None, poll_seconds=0, batching=False)
+    registry.load_initial()
+    return registry
+
+
+def test_prepare_callbacks_run_before_the_version_is_published(registry, tmp_path):
+    seen = []
+
+    def prepare(bundle):
+        bundle.price_state = f'state of {bundle.version}'
+        seen.append((bundle.version, registry.active.version))
+
+    registry.on_prepare(prepare)
+    add_version(tmp_path, 'v2')
+    assert registry.check_for_update(wait=True)
+
+    assert seen == [('v2', 'v1')]
+    assert registry.active.version == 'v2'
+    assert registry.active.price_state == 'state of v2'
+
+
+def test_failed_prepare_rejects_the_version(registry, tmp_path):
+    def prepare(bundle):
+        raise RuntimeError('no forecast table')
+
+    registry.on_prepare(prepare)
+    add_version(tmp_path, 'v2')
+    registry.check_for_update(wait=True)
+
+    assert registry.active.version == 'v1'
+    assert registry.stats()['rejected'] == {'v2': 'no forecast table'}
+    # Not retried until its files change
+    assert not registry.check_for_update(wait=True)
+
+
+def test_stats_while_versions_are_rejected(registry):
+    stop = time.monotonic() + 0.5
+    errors = []
+
+    def reject():
+        n = 0
+        while time.monotonic() < stop:
+            registry._reject(f'v{n}', None, 'broken')
+            n += 1
+
+    def read():
+        while time.monotonic() < stop:
+            try:
+                registry.stats()
+            except RuntimeError as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=reject), threading.Thread(target=read)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
@@ -0,0 +1,135 @@
+import numpy as np
+import pytest
+
+import prediction_cache
+from prediction_cache import (
+    DEFAULT_STEPS, PredictionCache, cached_probabilities, cached_top_k, parse_steps, quantize_features,
+)
+
+ROW = {'N': 90, 'temperature': 25.04, 'humidity': 80.2, 'ph': 6.504, 'rainfall': 200.01}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(prediction_cache, 'time', clock)
+    return clock
+
+
+class CountingRanker:
+    """Ranks by feature order and remembers how many rows it scored"""
+    version = 'v1'
+
+    def __init__(self):
+        self.rows = 0
+
+    def top_k(self, frame, k):
+        self.rows += len(frame)
+        return [[{'name': f'crop{int(row.N)}', 'score': 1.0}][:k] for row in frame.itertuples()]
+
+    def probabilities(self, rows):
+        self.rows += len(rows)
+        return np.array([[0.25, 0.75]] * len(rows))
+
+
+def test_quantize_features_snaps_to_the_grid():
+    assert quantize_features(ROW) == (90.0, 25.0, 80.0, 6.5, 200.0)
+    # Sequences in FEATURES order give the same key
+    assert quantize_features([90.4, 24.96, 79.6, 6.496, 199.99]) == quantize_features(ROW)
+    # No float noise like 20.800000000000001
+    assert quantize_features({**ROW, 'temperature': 20.8})[1] == 20.8
+
+
+@pytest.mark.parametrize('value', [None, 'warm', float('nan'), float('inf'), float('-inf')])
+def test_quantize_features_rejects_missing_and_non_finite_values(value):
+    assert quantize_features({**ROW, 'temperature': value}) is None
+
+
+def test_parse_steps_overrides_known_features_only():
+    steps = parse_steps('ph=0.05, rainfall=0,unknown=3,garbage')
+    assert steps == {**DEFAULT_STEPS, 'ph': 0.05, 'rainfall': 0.0}
+    # A zero step keeps the value as sent
+    assert quantize_features(ROW, steps) == (90.0, 25.0, 80.0, 6.5, 200.01)
+
+
+def test_lru_evicts_the_least_recently_used_entry(clock):
+    cache = PredictionCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    stats = cache.stats()
+    assert (stats['entries'], stats['hits'], stats['misses'], stats['evictions']) == (2, 3, 1, 1)
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = PredictionCache(ttl=60)
+    cache.set('a', 1)
+    clock.now += 59
+    assert cache.get('a') == 1
+    clock.now += 2
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0 and cache.stats()['bytes'] == 0
+
+
+def test_memory_cap_evicts_and_skips_oversized_values(clock):
+    small = PredictionCache()._entry_size('a', 'x' * 10)
+    cache = PredictionCache(max_bytes=small * 2)
+    cache.set('a', 'x' * 10)
+    cache.set('b', 'x' * 10)
+    cache.set('c', 'x' * 10)
+    assert cache.get('a') is None and cache.get('c') is not None
+    assert cache.stats()['bytes'] == small * 2
+
+    cache.set('huge', 'x' * small * 2)
+    assert cache.get('huge') is None
+    assert cache.get('b') is not None
+
+
+def test_cached_top_k_scores_only_misses():
+    cache = PredictionCache()
+    ranker = CountingRanker()
+    rows = [ROW, {**ROW, 'N': 40}]
+
+    first = cached_top_k(cache, ranker, rows, 1)
+    assert ranker.rows == 2
+
+    # Same grid points hit the cache; a new row is scored on its own
+    nearby = {**ROW, 'temperature': 24.99}
+    assert cached_top_k(cache, ranker, [nearby, rows[1], {**ROW, 'N': 7}], 1)[:2] == first
+    assert ranker.rows == 3
+
+    # A new model version misses
+    ranker.version = 'v2'
+    cached_top_k(cache, ranker, rows, 1)
+    assert ranker.rows == 5
+
+
+def test_invalid_rows_are_scored_but_not_cached():
+    cache = PredictionCache()
+    ranker = CountingRanker()
+    row = {**ROW, 'ph': None}
+    cached_top_k(cache, ranker, [row], 1)
+    cached_top_k(cache, ranker, [row], 1)
+    assert ranker.rows == 2
+    assert cache.stats()['entries'] == 0
+
+
+def test_cached_probabilities_returns_arrays_from_the_cache():
+    cache = PredictionCache()
+    ranker = CountingRanker()
+    assert cached_probabilities(cache, ranker, ROW).tolist() == [0.25, 0.75]
+    cached = cached_probabilities(cache, ranker, list(ROW.values()))
+    assert isinstance(cached, np.ndarray) and cached.tolist() == [0.25, 0.75]
+    assert ranker.rows == 1
@@ -0,0 +1,58 @@
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+import pytest
+
+from price_history import PriceHistoryIndex
+from price_store import load_price_columns
+
+CROPS = ('Rice', 'Wheat', 'Onion')
+DISTRICTS = ('Pune', 'Delhi', 'Kolkata')
+DATES = ['2023-01-01', '2023-03-15', '2023-04-02', '2023-09-30', '2024-01-01', '2024-06-01', '2025-01-01']
+
+
+def baseline_lags(price_df, crop_id, district_id, current_date):
+    """The pandas filter-and-mean lookup the price service used before the index"""
+    crop_district_data = price_df[(price_df['crop_id'] == crop_id) & (price_df['district_id'] == district_id)]
+    if len(crop_district_data) == 0:
+        crop_district_data = price_df[price_df['crop_id'] == crop_id]
+        if len(crop_district_data) > 0:
+            crop_district_data = crop_district_data.groupby('date')['price'].mean().reset_index()
+    if len(crop_district_data) == 0:
+        return None
+
+    crop_district_data = crop_district_data.sort_values('date')
+    latest_price = crop_district_data['price'].iloc[-1]
+    lags = []
+    for days in (90, 365):
+        lag_data = crop_district_data[crop_district_data['date'] <= pd.to_datetime(current_date) - timedelta(days=days)]
+        lags.append(float(lag_data['price'].iloc[-1] if len(lag_data) > 0 else latest_price))
+    return lags
+
+
+@pytest.fixture
+def price_csv(tmp_path):
+    # Prices with cents that float32 can't hold exactly, and daily means that aren't whole cents
+    rng = np.random.default_rng(1)
+    days = pd.date_range('2023-02-01', '2024-02-01', freq='3D')
+    rows = []
+    # Onion has no rows and Wheat none in Kolkata, where the lookup uses Wheat's daily average
+    for crop, districts in (('Rice', DISTRICTS), ('Wheat', DISTRICTS[:2])):
+        for district in districts:
+            for day in rng.choice(days, 60, replace=False):
+                rows.append((day, crop, district, round(rng.uniform(500, 9000), rng.integers(0, 3))))
+    rng.shuffle(rows)
+    path = tmp_path / 'prices.csv'
+    pd.DataFrame(rows, columns=['date', 'crop_id', 'district_id', 'price']).to_csv(path, index=False)
+    return path
+
+
+def test_get_lags_matches_the_pandas_lookup(price_csv, tmp_path):
+    index = PriceHistoryIndex(load_price_columns(str(price_csv), str(tmp_path / 'cache')))
+    price_df = pd.read_csv(price_csv)
+    price_df['date'] = pd.to_datetime(price_df['date'])
+
+    for crop in CROPS:
+        for district in DISTRICTS + ('Nowhere',):
+            for date in DATES:
+                assert index.get_lags(crop, district, date) == baseline_lags(price_df, crop, district, date)
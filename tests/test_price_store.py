@@ -0,0 +1,96 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+
+import price_store
+from price_store import exact_prices, load_price_columns
+
+CSV = '''date,crop_id,district_id,price
+2024-01-02,Rice,Pune,2150.35
+2024-01-01,Rice,Pune,2100.1
+2024-01-01,Rice,Delhi,7953.09
+2024-01-02,Wheat,Delhi,1999.99
+2024-01-02,Rice,Delhi,0.3
+not a date,Rice,Delhi,1.0
+'''
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'prices.csv'
+    path.write_text(CSV)
+    return path
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Count cache rebuilds"""
+    calls = []
+    build = price_store.build_price_cache
+
+    def counting_build(*args, **kwargs):
+        calls.append(args)
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(price_store, 'build_price_cache', counting_build)
+    return calls
+
+
+def expected_frame(csv_text):
+    df = pd.read_csv(io.StringIO(csv_text))
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    return df.dropna(subset=['date'])
+
+
+def test_prices_and_averages_match_the_csv(csv_path, tmp_path):
+    columns = load_price_columns(str(csv_path), str(tmp_path / 'cache'))
+    assert columns.prices.dtype == np.float32
+
+    df = expected_frame(CSV)
+    frame = columns.to_frame()
+    assert sorted(frame['price']) == sorted(df['price'])
+    # Averages equal pandas' float64 mean, not just to the cent
+    expected = df.groupby(['crop_id', 'date'])['price'].mean()
+    averages = columns.averages_frame().set_index(['crop_id', 'date'])['price']
+    assert averages.to_dict() == expected.to_dict()
+
+
+def test_prices_that_float32_cannot_round_trip_stay_float64(tmp_path):
+    path = tmp_path / 'prices.csv'
+    path.write_text('date,crop_id,district_id,price\n2024-01-01,Rice,Pune,2100.125\n')
+    columns = load_price_columns(str(path), str(tmp_path / 'cache'))
+    assert columns.prices.dtype == np.float64
+    assert exact_prices(columns.prices).tolist() == [2100.125]
+
+
+def test_cache_rebuilds_when_the_csv_changes(csv_path, tmp_path, builds):
+    cache_dir = str(tmp_path / 'cache')
+    load_price_columns(str(csv_path), cache_dir)
+    assert len(builds) == 1
+
+    # Same content with a new mtime: the checksum still matches
+    csv_path.write_text(CSV)
+    load_price_columns(str(csv_path), cache_dir)
+    assert len(builds) == 1
+
+    # Same size, different content
+    csv_path.write_text(CSV.replace('1999.99', '1888.88'))
+    columns = load_price_columns(str(csv_path), cache_dir)
+    assert len(builds) == 2
+    assert 1888.88 in exact_prices(columns.prices).tolist()
+    assert 1999.99 not in exact_prices(columns.prices).tolist()
+
+
+def test_unwritable_cache_dir_loads_the_csv_into_memory(csv_path, tmp_path, capsys):
+    blocker = tmp_path / 'not-a-directory'
+    blocker.write_text('')
+
+    columns = load_price_columns(str(csv_path), str(blocker / 'cache'))
+
+    assert 'loading' in capsys.readouterr().out
+    assert not isinstance(columns.prices, np.memmap)
+    assert len(columns) == 5
+    cached = load_price_columns(str(csv_path), str(tmp_path / 'cache'))
+    for name in price_store.COLUMNS:
+        assert np.array_equal(getattr(columns, name), getattr(cached, name))
@@ -0,0 +1,71 @@
+import json
+import pytest
+
+import process_prices_simple
+from process_prices_simple import PRICE_CSV, process_crop_prices, refresh_crop_prices
+
+HEADER = 'date,crop_id,district_id,price\n'
+
+
+def rows(start_day, n_days, crops=('Rice', 'Wheat', 'Onion')):
+    """CSV lines for n_days dates, two districts per crop (Onion isn't mapped)"""
+    lines = []
+    for day in range(start_day, start_day + n_days):
+        for i, crop in enumerate(crops):
+            for district in ('D1', 'D2'):
+                lines.append(f'2024-01-{day:02d},{crop},{district},{1000 + 7.31 * day + 13.7 * i + (district == "D2") * 0.5}\n')
+    return ''.join(lines)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Every path the script writes is relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def output(workdir):
+    with open(workdir / 'crop_price_data.json') as f:
+        return json.load(f)
+
+
+def test_last_row_without_trailing_newline_is_charted(workdir):
+    (workdir / PRICE_CSV).write_text(HEADER + '2024-01-01,Rice,D1,100\n2024-01-02,Rice,D1,200')
+
+    crop_data = process_crop_prices(workers=1)
+
+    assert crop_data['rice'] == [
+        {'date': '2024-01-01', 'price': 100.0, 'day': 1},
+        {'date': '2024-01-02', 'price': 200.0, 'day': 2},
+    ]
+    assert output(workdir) == crop_data
+
+
+def test_incremental_refresh_matches_full_rebuild(workdir):
+    csv_path = workdir / PRICE_CSV
+    csv_path.write_text(HEADER + rows(1, 20))
+    process_crop_prices(workers=1)
+
+    with open(csv_path, 'a') as f:
+        f.write(rows(21, 15))
+    refreshed = refresh_crop_prices(workers=1)
+
+    (workdir / process_prices_simple.STATE_PATH).unlink()
+    assert refreshed == process_crop_prices(workers=1)
+    assert len(refreshed['rice']) == process_prices_simple.WINDOW_DAYS
+
+
+def test_incremental_refresh_finishes_a_partial_last_row(workdir):
+    csv_path = workdir / PRICE_CSV
+    csv_path.write_text(HEADER + rows(1, 3) + '2024-01-04,Rice,D1,50')
+    process_crop_prices(workers=1)
+
+    # The writer finishes the row and appends more
+    with open(csv_path, 'a') as f:
+        f.write('0\n' + rows(5, 2))
+    refreshed = refresh_crop_prices(workers=1)
+
+    (workdir / process_prices_simple.STATE_PATH).unlink()
+    rebuilt = process_crop_prices(workers=1)
+    assert refreshed == rebuilt
+    assert {'date': '2024-01-04', 'price': 500.0, 'day': 4} in rebuilt['rice']
@@ -0,0 +1,71 @@
+import os
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('sklearn')
+pytest.importorskip('catboost')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if not os.path.exists(os.path.join(ROOT, os.getenv('PRICE_CSV', 'latest_one_year_prices.csv'))):
+    pytest.skip('needs the price CSV the price service loads', allow_module_level=True)
+
+FEATURES = {'N': 90, 'temperature': 25, 'humidity': 80, 'ph': 6.5, 'rainfall': 200, 'latitude': 28.6, 'longitude': 77.2}
+
+
+@pytest.fixture(scope='module')
+def client():
+    # app.py reads its models, price data and caches from the repository root
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(ROOT)
+        import app
+        yield app.app.test_client()
+
+
+def recommend(client, query='', **body):
+    return client.post(f'/recommend{query}', json={**FEATURES, **body})
+
+
+def test_k_limits_the_recommendations(client):
+    everything = recommend(client, k=0, min_probability=0).get_json()['recommendations']
+    assert len(everything) > 2
+
+    top = recommend(client, k=2, min_probability=0).get_json()['recommendations']
+    assert top == everything[:2]
+    # The query string wins over the body
+    assert recommend(client, '?k=1', k=2, min_probability=0).get_json()['recommendations'] == everything[:1]
+
+
+@pytest.mark.parametrize('k', [-2, -1, 'two', None, [1]])
+def test_invalid_k_is_rejected(client, k):
+    response = recommend(client, k=k)
+    assert response.status_code == 400
+    assert 'k' in response.get_json()['error']
+
+
+def test_score_orders_the_recommendations(client):
+    response = recommend(client, score='probability', min_probability=0)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['score'] == 'probability'
+    probabilities = [entry['probability'] for entry in body['recommendations']]
+    assert probabilities == sorted(probabilities, reverse=True)
+    assert all(entry['score'] == round(entry['probability'], 4) for entry in body['recommendations'])
+
+    response = recommend(client, score='cheapest')
+    assert response.status_code == 400
+    assert 'score must be one of' in response.get_json()['error']
+
+
+def test_min_probability_filters_unlikely_crops(client):
+    everything = recommend(client, score='probability', min_probability=0).get_json()['recommendations']
+    threshold = everything[1]['probability']
+
+    kept = recommend(client, score='probability', min_probability=threshold).get_json()['recommendations']
+    assert kept == [entry for entry in everything if entry['probability'] >= threshold]
+    # Nothing above the threshold still returns the most likely crop
+    assert len(recommend(client, min_probability=1.5).get_json()['recommendations']) == 1
+
+
+@pytest.mark.parametrize('min_probability', ['often', 'nan', 'inf'])
+def test_invalid_min_probability_is_rejected(client, min_probability):
+    assert recommend(client, min_probability=min_probability).status_code == 400
@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip('flask')
+from flask import Flask
+
+from sampling_profiler import Profiler, install_flask_profiling
+
+TOKEN = 'secret'
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    install_flask_profiling(app, Profiler(token=TOKEN, directory=None))
+    return app.test_client()
+
+
+def start(client, **body):
+    return client.post('/profile/start', json=body, headers={'X-Profile-Token': TOKEN})
+
+
+def test_start_profile_needs_the_token(client):
+    assert client.post('/profile/start', json={}).status_code == 404
+
+
+@pytest.mark.parametrize('body', [
+    {'seconds': 'soon'}, {'hz': None}, {'seconds': 0}, {'seconds': -5}, {'hz': 0}, {'hz': -100},
+    {'seconds': 'nan'}, {'seconds': 'inf'}, {'hz': '-inf'}, {'hz': 'NaN'},
+])
+def test_start_profile_rejects_invalid_options(client, body):
+    response = start(client, **body)
+    assert response.status_code == 400
+    assert 'seconds and hz must be' in response.get_json()['error']
+
+
+def test_started_profile_can_be_stopped(client):
+    response = start(client, seconds=5, hz=50)
+    assert response.status_code == 202
+    profile_id = response.get_json()['id']
+
+    stopped = client.post(f'/profile/{profile_id}/stop', headers={'X-Profile-Token': TOKEN})
+    assert stopped.status_code == 200
+    assert stopped.get_json()['running'] is False
@@ -0,0 +1,86 @@
+import pytest
+
+from soil_cache import SoilCache, geohash_bounds, geohash_center, geohash_encode, iter_bbox_cells, prewarm
+
+POINT = (28.6139, 77.2090)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SoilCache(path=str(tmp_path / 'soil.sqlite3'), precision=7)
+
+
+def test_geohash_round_trip():
+    # The reference example from the geohash description
+    assert geohash_encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+
+    cell = geohash_encode(*POINT, 7)
+    lat_min, lat_max, lon_min, lon_max = geohash_bounds(cell)
+    assert lat_min <= POINT[0] < lat_max and lon_min <= POINT[1] < lon_max
+    assert geohash_encode(*geohash_center(cell), 7) == cell
+
+
+def test_bbox_cells_cover_the_box_once():
+    cells = list(iter_bbox_cells(28.60, 28.62, 77.20, 77.22, precision=6))
+    assert len(cells) == len(set(cells))
+    for lat in (28.60, 28.61, 28.62):
+        for lon in (77.20, 77.21, 77.22):
+            assert geohash_encode(lat, lon, 6) in cells
+
+
+def test_hits_and_misses(cache, tmp_path):
+    assert cache.get(*POINT) is None
+    cache.put(*POINT, 150, 65)
+    assert cache.get(*POINT) == (150.0, 65.0)
+    # Points in the same cell share the entry
+    lat_min, lat_max, lon_min, lon_max = geohash_bounds(cache.key(*POINT))
+    assert cache.get(lat_min, lon_min) == (150.0, 65.0)
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'fallbacks': 0, 'memory_entries': 1, 'entries': 1}
+
+    # Another worker finds the row in SQLite and keeps it in memory
+    other = SoilCache(path=str(tmp_path / 'soil.sqlite3'), precision=7)
+    assert other.get(*POINT) == (150.0, 65.0)
+    assert other.stats()['memory_entries'] == 1 and other.stats()['hits'] == 1
+
+
+def test_memory_copy_is_bounded(cache):
+    cache.memory_entries = 2
+    cache.put_many([('aaaaaaa', 1, 2), ('bbbbbbb', 3, 4), ('ccccccc', 5, 6)])
+    assert cache.stats()['memory_entries'] <= 2
+    assert cache.get_cell('aaaaaaa') == (1.0, 2.0)
+
+
+def test_nearby_averages_the_closest_cached_cells(cache):
+    cell = cache.key(*POINT)
+    assert cache.nearby(*POINT) is None
+
+    cache.put_many([(cell[:5] + 'zz', 100, 50)])
+    assert cache.nearby(*POINT) == (100.0, 50.0)
+
+    # Cells sharing a longer prefix win over the coarser one
+    cache.put_many([(cell[:6] + 'x', 120, 70), (cell[:6] + 'y', 140, 80)])
+    assert cache.nearby(*POINT) == pytest.approx((130.0, 75.0))
+    assert cache.stats()['fallbacks'] == 2
+
+    # Nothing inside the fallback cell
+    assert cache.nearby(-POINT[0], -POINT[1]) is None
+
+
+def test_prewarm_fetches_only_missing_cells(cache):
+    cells = list(iter_bbox_cells(28.600, 28.605, 77.200, 77.205, cache.precision))
+    cache.put_many([(cells[0], 1, 1)])
+    fetched = []
+
+    def fetch(lat, lon):
+        cell = geohash_encode(lat, lon, cache.precision)
+        fetched.append(cell)
+        if len(fetched) == 2:
+            raise ConnectionError('rate limited')
+        return 150, 65
+
+    assert prewarm(cache, fetch, 28.600, 28.605, 77.200, 77.205) == (len(cells) - 2, 1)
+    assert cells[0] not in fetched
+    # Run again: only the failed cell is left
+    assert cache.missing(cells) == [fetched[1]]
+    assert prewarm(cache, fetch, 28.600, 28.605, 77.200, 77.205) == (1, 0)
+    assert cache.missing(cells) == []
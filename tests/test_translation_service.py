@@ -0,0 +1,106 @@
+import threading
+import pytest
+
+from translation_service import PhraseCache, TranslationError, TranslationService, resolve_pair
+
+WAIT = 5
+
+
+class FakeUpstream:
+    """Stands in for fetch_mymemory, counting calls; fails for texts in fail, waits for release if given"""
+
+    def __init__(self, fail=(), release=None):
+        self.fail = set(fail)
+        self.release = release
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, text, source, target):
+        with self._lock:
+            self.calls.append(text)
+        if self.release is not None:
+            assert self.release.wait(WAIT)
+        if text in self.fail:
+            raise TranslationError('MyMemory returned status 429')
+        return f'[{target}] {text}'
+
+
+class ForgetfulCache(PhraseCache):
+    """A phrase cache that never finds anything, as seen by a caller that read it before a fetch stored"""
+
+    def get_many(self, source, target, texts):
+        return {}
+
+
+@pytest.fixture
+def phrase_cache(tmp_path):
+    return PhraseCache(path=str(tmp_path / 'translations.sqlite3'))
+
+
+def test_resolve_pair():
+    assert resolve_pair('auto', 'hi') == ('en', 'hi')
+    assert resolve_pair('hi', 'en') == ('hi', 'en')
+    assert resolve_pair('en', 'fr') is None
+
+
+def test_phrase_cache_hits_and_misses(phrase_cache, tmp_path):
+    phrase_cache.put_many('en', 'hi', {'hello': '[hi] hello', 'rice': '[hi] rice'})
+    assert phrase_cache.get_many('en', 'hi', ['hello', 'wheat', 'rice']) == {'hello': '[hi] hello', 'rice': '[hi] rice'}
+    # Keyed by language pair as well as text
+    assert phrase_cache.get_many('hi', 'en', ['hello']) == {}
+
+    # Another worker reads the same file
+    other = PhraseCache(path=str(tmp_path / 'translations.sqlite3'), memory_entries=1)
+    assert other.get_many('en', 'hi', ['hello', 'rice']) == {'hello': '[hi] hello', 'rice': '[hi] rice'}
+    assert len(other._memory) == 1
+    assert len(other) == 2
+
+
+def test_only_misses_go_upstream(phrase_cache):
+    upstream = FakeUpstream()
+    phrase_cache.put_many('en', 'hi', {'cached': '[hi] from cache'})
+    service = TranslationService(cache=phrase_cache, fetch=upstream)
+
+    texts = ['cached', 'new', '', 'new', 'other']
+    assert service.translate_many(texts, 'auto', 'hi') == ['[hi] from cache', '[hi] new', '', '[hi] new', '[hi] other']
+    assert sorted(upstream.calls) == ['new', 'other']
+
+    assert service.translate('new', 'en', 'hi') == '[hi] new'
+    assert len(upstream.calls) == 2
+    assert service.stats() == {'upstream_calls': 2, 'deduplicated': 0, 'in_flight': 0, 'cached_phrases': 3}
+
+
+def test_failed_phrases_are_not_cached(phrase_cache):
+    upstream = FakeUpstream(fail={'busy'})
+    service = TranslationService(cache=phrase_cache, fetch=upstream)
+
+    assert service.translate_many(['busy', 'fine'], 'en', 'hi') == [None, '[hi] fine']
+    with pytest.raises(TranslationError):
+        service.translate('busy', 'en', 'hi')
+    assert upstream.calls.count('busy') == 2
+    assert phrase_cache.get_many('en', 'hi', ['busy']) == {}
+
+
+def test_unsupported_pair_is_rejected(phrase_cache):
+    upstream = FakeUpstream()
+    service = TranslationService(cache=phrase_cache, fetch=upstream)
+    with pytest.raises(TranslationError, match='Only en↔hi supported'):
+        service.translate_many(['hello'], 'en', 'fr')
+    assert upstream.calls == []
+
+
+def test_caller_arriving_as_a_fetch_finishes_shares_it(tmp_path):
+    upstream = FakeUpstream(release=threading.Event())
+    service = TranslationService(cache=ForgetfulCache(path=str(tmp_path / 'translations.sqlite3')), fetch=upstream)
+
+    # Looks the phrase up again the moment the first fetch completes
+    late = []
+    future = service._start(('en', 'hi', 'hello'))
+    future.add_done_callback(lambda _: late.append(service.translate_many(['hello'], 'en', 'hi')))
+    upstream.release.set()
+    service._executor.shutdown(wait=True)
+
+    assert future.result() == '[hi] hello'
+    assert late == [['[hi] hello']]
+    assert upstream.calls == ['hello']
+    assert service.stats()['upstream_calls'] == 1 and service.stats()['in_flight'] == 0
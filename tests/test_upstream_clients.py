@@ -0,0 +1,193 @@
+import asyncio
+import os
+import threading
+import httpx
+import pytest
+import requests
+import translation_service
+import upstream_clients
+from benchmark_fixtures import StubServer
+from soil_cache import SoilCache
+from translation_service import AsyncTranslationService, PhraseCache, TranslationError, TranslationService
+
+POINT = (28.6139, 77.2090)
+CONCURRENCY = 8
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = StubServer(latency=0.2).start()
+    env = server.env()
+    monkeypatch.setattr(upstream_clients, 'SOILGRIDS_BASE_URL', env['SOILGRIDS_BASE_URL'])
+    monkeypatch.setattr(translation_service, 'MYMEMORY_URL', env['MYMEMORY_URL'])
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def soil_cache(tmp_path, monkeypatch):
+    cache = SoilCache(path=str(tmp_path / 'soil.sqlite3'))
+    monkeypatch.setattr(upstream_clients, 'soil_cache', cache)
+    return cache
+
+
+@pytest.fixture
+def phrase_cache(tmp_path):
+    return PhraseCache(path=str(tmp_path / 'translations.sqlite3'))
+
+
+@pytest.fixture
+def short_timeout(stub, monkeypatch):
+    """Upstream read timeout well below the stub's latency"""
+    stub.latency = 0.5
+    monkeypatch.setattr(upstream_clients, 'UPSTREAM_TIMEOUT', (1.0, 0.1))
+    return httpx.Timeout(0.1, connect=1.0)
+
+
+def run_concurrently(fn, n=CONCURRENCY):
+    """Call fn from n threads released at the same moment, returning the results in order"""
+    barrier = threading.Barrier(n)
+    results = [None] * n
+    errors = []
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = fn()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    return results
+
+
+def test_concurrent_soil_misses_share_one_request(stub, soil_cache):
+    results = run_concurrently(lambda: upstream_clients.lookup_soil(*POINT))
+    assert results == [(150.0, 65.0, 'soilgrids')] * CONCURRENCY
+    assert stub.requests['/soilgrids'] == 1
+
+    assert upstream_clients.lookup_soil(*POINT) == (150.0, 65.0, 'cache')
+    assert stub.requests['/soilgrids'] == 1
+    assert not upstream_clients._soil_inflight
+
+
+def test_concurrent_async_soil_misses_share_one_request(stub, soil_cache):
+    async def lookups():
+        async with httpx.AsyncClient() as client:
+            return await asyncio.gather(*(upstream_clients.lookup_soil_async(client, *POINT) for _ in range(CONCURRENCY)))
+
+    assert asyncio.run(lookups()) == [(150.0, 65.0, 'soilgrids')] * CONCURRENCY
+    assert stub.requests['/soilgrids'] == 1
+    assert not upstream_clients._soil_tasks
+
+
+def test_concurrent_translations_share_one_request(stub, phrase_cache):
+    service = TranslationService(cache=phrase_cache)
+    results = run_concurrently(lambda: service.translate_many(['hello', 'hello'], 'en', 'hi'))
+    assert results == [['[hi] hello', '[hi] hello']] * CONCURRENCY
+    assert stub.requests['/mymemory'] == 1
+    assert service.stats()['in_flight'] == 0
+
+    assert service.translate('hello', 'en', 'hi') == '[hi] hello'
+    assert stub.requests['/mymemory'] == 1
+
+
+def test_concurrent_async_translations_share_one_request(stub, phrase_cache):
+    async def translations():
+        async with httpx.AsyncClient() as client:
+            service = AsyncTranslationService(client, cache=phrase_cache)
+            results = await asyncio.gather(*(service.translate('hello', 'en', 'hi') for _ in range(CONCURRENCY)))
+            return results, service.stats()
+
+    results, stats = asyncio.run(translations())
+    assert results == ['[hi] hello'] * CONCURRENCY
+    assert stub.requests['/mymemory'] == 1
+    assert stats['upstream_calls'] == 1 and stats['in_flight'] == 0
+
+
+def test_soil_timeout_raises_without_nearby_cells(short_timeout, soil_cache):
+    with pytest.raises(requests.Timeout):
+        upstream_clients.lookup_soil(*POINT)
+    assert not upstream_clients._soil_inflight
+
+
+def test_soil_timeout_falls_back_to_nearby_cells(short_timeout, soil_cache):
+    # A cached cell in the same precision-6 cell as the point, but not the point's own
+    cell = soil_cache.key(*POINT)
+    neighbour = cell[:-1] + ('0' if cell[-1] != '0' else '1')
+    soil_cache.put_many([(neighbour, 120.0, 70.0)])
+
+    results = run_concurrently(lambda: upstream_clients.lookup_soil(*POINT), n=4)
+    assert results == [(120.0, 70.0, 'nearby')] * 4
+    assert soil_cache.get_cell(cell) is None
+
+
+def test_async_soil_timeout_falls_back_to_nearby_cells(short_timeout, soil_cache):
+    async def lookup():
+        async with httpx.AsyncClient(timeout=short_timeout) as client:
+            with pytest.raises(httpx.TimeoutException):
+                await upstream_clients.lookup_soil_async(client, *POINT)
+            cell = soil_cache.key(*POINT)
+            soil_cache.put_many([(cell[:-1] + ('0' if cell[-1] != '0' else '1'), 120.0, 70.0)])
+            return await upstream_clients.lookup_soil_async(client, *POINT)
+
+    assert asyncio.run(lookup()) == (120.0, 70.0, 'nearby')
+
+
+def test_translation_timeout_fails_only_that_phrase(short_timeout, phrase_cache):
+    phrase_cache.put_many('en', 'hi', {'cached': '[hi] cached'})
+    service = TranslationService(cache=phrase_cache)
+    assert service.translate_many(['cached', 'slow'], 'en', 'hi') == ['[hi] cached', None]
+    with pytest.raises(TranslationError):
+        service.translate('slow', 'en', 'hi')
+    assert service.stats()['in_flight'] == 0
+
+
+def _in_child(check):
+    """Run check() in a forked child and return its exit status (0 if it returned True)"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            code = 0 if check() else 1
+        except BaseException:
+            code = 2
+        os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_soil_cache_reopens_sqlite_after_fork(soil_cache):
+    soil_cache.put_many([('parent', 1.0, 2.0)])
+    parent_connection = soil_cache._connection()
+
+    def check():
+        connection = soil_cache._connection()
+        soil_cache._memory.clear()
+        soil_cache.put_many([('child', 3.0, 4.0)])
+        return connection is not parent_connection and soil_cache.get_cell('parent') == (1.0, 2.0)
+
+    assert _in_child(check) == 0
+    assert soil_cache._connection() is parent_connection
+    assert soil_cache.get_cell('child') == (3.0, 4.0)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_phrase_cache_reopens_sqlite_after_fork(phrase_cache):
+    phrase_cache.put_many('en', 'hi', {'parent': '[hi] parent'})
+    parent_connection = phrase_cache._connection()
+
+    def check():
+        connection = phrase_cache._connection()
+        phrase_cache._memory.clear()
+        phrase_cache.put_many('en', 'hi', {'child': '[hi] child'})
+        return connection is not parent_connection and phrase_cache.get_many('en', 'hi', ['parent']) == {'parent': '[hi] parent'}
+
+    assert _in_child(check) == 0
+    assert phrase_cache._connection() is parent_connection
+    assert phrase_cache.get_many('en', 'hi', ['child']) == {'child': '[hi] child'}
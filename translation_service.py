@@ -0,0 +1,270 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from upstream_clients import timed_get, latencies
+from metrics import metrics
+
+MYMEMORY_URL = os.getenv('MYMEMORY_URL', 'https://api.mymemory.translated.net/get')
+# Phrase cache shared by every worker; translations of a phrase never change
+TRANSLATION_CACHE_PATH = os.getenv('TRANSLATION_CACHE_PATH', 'translation_cache.sqlite3')
+# Upstream requests in flight at once per process
+TRANSLATE_CONCURRENCY = int(os.getenv('TRANSLATE_CONCURRENCY', '8'))
+# Most strings accepted by one batch request
+MAX_BATCH_TEXTS = 500
+
+# Only English to Hindi and Hindi to English; "auto" is treated as English
+SUPPORTED_PAIRS = {('en', 'hi'), ('hi', 'en'), ('auto', 'hi')}
+
+
+class TranslationError(Exception):
+    pass
+
+
+def resolve_pair(source, target):
+    """Return the (source, target) language pair sent upstream, or None if unsupported"""
+    if (source, target) not in SUPPORTED_PAIRS:
+        return None
+    return ('en' if source == 'auto' else source), target
+
+
+def fetch_mymemory(text, source, target):
+    params = {'q': text, 'langpair': f'{source}|{target}'}
+    response = timed_get('mymemory', MYMEMORY_URL, params=params)
+    response.raise_for_status()
+    data = response.json()
+    if data.get('responseStatus') != 200:
+        raise TranslationError(f"MyMemory returned status {data.get('responseStatus')}")
+    return data.get('responseData', {}).get('translatedText', text)
+
+
+class PhraseCache:
+    """(source, target, text) -> translation, persisted in SQLite with an in-process copy"""
+
+    def __init__(self, path=TRANSLATION_CACHE_PATH, memory_entries=50000):
+        self.path = path
+        self.memory_entries = memory_entries
+        self._memory = {}
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS translations ('
+                'source TEXT NOT NULL, target TEXT NOT NULL, text TEXT NOT NULL, '
+                'translated TEXT NOT NULL, fetched_at REAL NOT NULL, PRIMARY KEY (source, target, text))'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _remember(self, key, value):
+        if len(self._memory) >= self.memory_entries:
+            self._memory.clear()
+        self._memory[key] = value
+
+    def get_many(self, source, target, texts):
+        """Return {text: translation} for the texts already cached"""
+        found = {}
+        missing = []
+        for text in texts:
+            value = self._memory.get((source, target, text))
+            if value is None:
+                missing.append(text)
+            else:
+                found[text] = value
+
+        connection = self._connection()
+        for i in range(0, len(missing), 500):
+            batch = missing[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows = connection.execute(
+                f'SELECT text, translated FROM translations '
+                f'WHERE source = ? AND target = ? AND text IN ({placeholders})',
+                [source, target, *batch],
+            )
+            for text, translated in rows:
+                found[text] = translated
+                self._remember((source, target, text), translated)
+        return found
+
+    def put_many(self, source, target, translations):
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)',
+                [(source, target, text, translated, now) for text, translated in translations.items()],
+            )
+        for text, translated in translations.items():
+            self._remember((source, target, text), translated)
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM translations').fetchone()[0]
+
+
+class TranslationService:
+    """Translates through the phrase cache, fetching only misses
+
+    Misses are fetched concurrently, and a phrase already being fetched (by this
+    batch or another request) is awaited rather than requested again.
+    """
+
+    def __init__(self, cache=None, fetch=fetch_mymemory, max_workers=TRANSLATE_CONCURRENCY):
+        self.cache = cache if cache is not None else PhraseCache()
+        self.fetch = fetch
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='translate')
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.upstream_calls = 0
+        self.deduplicated = 0
+
+    def _fetch_and_store(self, key, future):
+        source, target, text = key
+        try:
+            translated = self.fetch(text, source, target)
+            self.cache.put_many(source, target, {text: translated})
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(translated)
+        finally:
+            # Popped once the future is done, so a caller that missed the cache
+            # always finds the fetch in flight and never requests it again
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _start(self, key):
+        """Future for one phrase, shared with any identical request already in flight"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.deduplicated += 1
+                return future
+            future = Future()
+            self._inflight[key] = future
+            self.upstream_calls += 1
+
+        self._executor.submit(self._fetch_and_store, key, future)
+        return future
+
+    def translate_many(self, texts, source, target):
+        """Translate a list of strings; failed entries come back as None
+
+        Raises TranslationError if the language pair isn't supported.
+        """
+        pair = resolve_pair(source, target)
+        if pair is None:
+            raise TranslationError(f'Translation not supported: {source} to {target}. Only en↔hi supported.')
+        source, target = pair
+
+        unique = list(dict.fromkeys(text for text in texts if text))
+        translations = self.cache.get_many(source, target, unique)
+        futures = {text: self._start((source, target, text)) for text in unique if text not in translations}
+        for text, future in futures.items():
+            try:
+                translations[text] = future.result()
+            except Exception as e:
+                print(f"Translation failed for {text!r}: {e}")
+                metrics.error('mymemory')
+        return [translations.get(text) if text else text for text in texts]
+
+    def translate(self, text, source, target):
+        translated = self.translate_many([text], source, target)[0]
+        if translated is None:
+            raise TranslationError('Translation failed')
+        return translated
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'upstream_calls': self.upstream_calls,
+                'deduplicated': self.deduplicated,
+                'in_flight': len(self._inflight),
+            }
+        stats['cached_phrases'] = len(self.cache)
+        return stats
+
+
+class AsyncTranslationService:
+    """TranslationService for the ASGI app: same phrase cache, fetched on the event loop
+
+    client is an httpx.AsyncClient. Identical phrases in flight share one task,
+    and a semaphore keeps at most max_concurrency requests open to MyMemory.
+    """
+
+    def __init__(self, client, cache=None, max_concurrency=TRANSLATE_CONCURRENCY):
+        self.client = client
+        self.cache = cache if cache is not None else PhraseCache()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._inflight = {}
+        self.upstream_calls = 0
+        self.deduplicated = 0
+
+    async def _fetch(self, text, source, target):
+        async with self._slots:
+            start = time.perf_counter()
+            try:
+                response = await self.client.get(MYMEMORY_URL, params={'q': text, 'langpair': f'{source}|{target}'})
+            finally:
+                latencies.record('mymemory', time.perf_counter() - start)
+        response.raise_for_status()
+        data = response.json()
+        if data.get('responseStatus') != 200:
+            raise TranslationError(f"MyMemory returned status {data.get('responseStatus')}")
+        translated = data.get('responseData', {}).get('translatedText', text)
+        self.cache.put_many(source, target, {text: translated})
+        return translated
+
+    def _start(self, key):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.deduplicated += 1
+            return task
+        self.upstream_calls += 1
+        task = asyncio.ensure_future(self._fetch(key[2], key[0], key[1]))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def translate_many(self, texts, source, target):
+        """Same contract as TranslationService.translate_many"""
+        pair = resolve_pair(source, target)
+        if pair is None:
+            raise TranslationError(f'Translation not supported: {source} to {target}. Only en↔hi supported.')
+        source, target = pair
+
+        unique = list(dict.fromkeys(text for text in texts if text))
+        translations = self.cache.get_many(source, target, unique)
+        missing = [text for text in unique if text not in translations]
+        # shield: a cancelled request must not cancel a fetch other requests are awaiting
+        results = await asyncio.gather(
+            *(asyncio.shield(self._start((source, target, text))) for text in missing),
+            return_exceptions=True,
+        )
+        for text, result in zip(missing, results):
+            if isinstance(result, Exception):
+                print(f"Translation failed for {text!r}: {result}")
+                metrics.error('mymemory')
+            else:
+                translations[text] = result
+        return [translations.get(text) if text else text for text in texts]
+
+    async def translate(self, text, source, target):
+        translated = (await self.translate_many([text], source, target))[0]
+        if translated is None:
+            raise TranslationError('Translation failed')
+        return translated
+
+    def stats(self):
+        return {
+            'upstream_calls': self.upstream_calls,
+            'deduplicated': self.deduplicated,
+            'in_flight': len(self._inflight),
+            'cached_phrases': len(self.cache),
+        }
@@ -0,0 +1,255 @@
+import asyncio
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from soil_cache import SoilCache
+from metrics import metrics
+
+# Load environment variables
+load_dotenv()
+
+SOILGRIDS_BASE_URL = os.getenv("SOILGRIDS_BASE_URL", "https://rest.isric.org/soilgrids/v2.0/properties/query")
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5/weather")
+OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "f273e9ce95f51d30254d4775f42c5a72")
+MODEL_PREDICT_URL = os.getenv("MODEL_PREDICT_URL", "http://127.0.0.1:5001/predict")
+
+# (connect, read) timeouts in seconds for every upstream call
+UPSTREAM_TIMEOUT = (float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5")), float(os.getenv("UPSTREAM_READ_TIMEOUT", "20")))
+
+_session = None
+_session_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="upstream")
+
+# Soil properties don't change for a location, so each geohash cell is fetched once
+soil_cache = SoilCache()
+# Cells being fetched right now; concurrent misses for the same cell share one request
+_soil_inflight = {}
+_soil_inflight_lock = threading.Lock()
+_soil_inflight_pid = os.getpid()
+_soil_tasks = {}
+
+
+def get_session() -> requests.Session:
+    """Shared session, so repeat calls reuse pooled keep-alive connections instead of new TCP/TLS handshakes"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+class LatencyRecorder:
+    """Keeps the most recent call durations per upstream, and feeds the upstream histograms in metrics"""
+
+    def __init__(self, max_samples: int = 1000):
+        self._samples = defaultdict(lambda: deque(maxlen=max_samples))
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        metrics.observe("upstream", name, seconds)
+        with self._lock:
+            self._samples[name].append(seconds)
+
+    def summary(self) -> dict:
+        """count/last/mean/max in milliseconds per upstream"""
+        with self._lock:
+            return {
+                name: {
+                    "count": len(samples),
+                    "last_ms": round(samples[-1] * 1000, 1),
+                    "mean_ms": round(sum(samples) / len(samples) * 1000, 1),
+                    "max_ms": round(max(samples) * 1000, 1),
+                }
+                for name, samples in self._samples.items() if samples
+            }
+
+
+latencies = LatencyRecorder()
+
+
+def timed_get(name: str, url: str, **kwargs) -> requests.Response:
+    start = time.perf_counter()
+    try:
+        return get_session().get(url, timeout=UPSTREAM_TIMEOUT, **kwargs)
+    finally:
+        latencies.record(name, time.perf_counter() - start)
+
+
+def soilgrids_params(lat: float, lon: float) -> dict:
+    return {
+        "lon": lon,
+        "lat": lat,
+        "property": ",".join(["nitrogen", "phh2o"]),
+        "depth": "0-5cm",
+        "value": "mean",
+    }
+
+
+def fetch_soil_n_and_ph(lat: float, lon: float) -> tuple[float, float]:
+    r = timed_get("soilgrids", SOILGRIDS_BASE_URL, params=soilgrids_params(lat, lon))
+    r.raise_for_status()
+    return parse_soilgrids(r.json())
+
+
+def parse_soilgrids(data: dict) -> tuple[float, float]:
+    """Topsoil nitrogen and pH means from a SoilGrids properties response"""
+    layers = data.get("properties", {}).get("layers", []) or data.get("layers", [])
+
+    nitrogen = None
+    ph = None
+    for layer in layers:
+        name = str(layer.get("name") or layer.get("variable") or "").lower()
+        depths = layer.get("depths", [])
+        first_depth = depths[0] if depths else {}
+        values = first_depth.get("values", {})
+        mean = values.get("mean", None)
+        if isinstance(mean, (int, float)):
+            if "nitrogen" in name:
+                nitrogen = mean
+            if "phh2o" in name or name == "ph":
+                ph = mean
+
+    if nitrogen is None or ph is None:
+        raise ValueError("Could not parse SoilGrids response for N and pH")
+
+    return float(nitrogen), float(ph)
+
+
+def _fetch_soil_cell(cell: str, lat: float, lon: float) -> tuple[float, float]:
+    """Fetch and store one cell, sharing the request with concurrent callers for the same cell"""
+    global _soil_inflight_pid
+    with _soil_inflight_lock:
+        if _soil_inflight_pid != os.getpid():
+            # Fetches in flight at fork time belong to threads that don't exist here
+            _soil_inflight.clear()
+            _soil_inflight_pid = os.getpid()
+        future = _soil_inflight.get(cell)
+        leader = future is None
+        if leader:
+            future = _soil_inflight[cell] = Future()
+    if not leader:
+        return future.result()
+    try:
+        nitrogen, ph = fetch_soil_n_and_ph(lat, lon)
+        soil_cache.put_many([(cell, nitrogen, ph)])
+        future.set_result((nitrogen, ph))
+    except Exception as e:
+        future.set_exception(e)
+    finally:
+        with _soil_inflight_lock:
+            _soil_inflight.pop(cell, None)
+    return future.result()
+
+
+def lookup_soil(lat: float, lon: float) -> tuple[float, float, str]:
+    """Cached N and pH for a point, plus where they came from: "cache", "soilgrids" or "nearby"
+
+    On a miss SoilGrids is queried and the result stored; concurrent misses for
+    the same cell wait for one request. If that fails (outage, 429 rate limit)
+    the average of nearby cached cells is used instead, and the original error
+    is raised only when nothing nearby is cached either.
+    """
+    cell = soil_cache.key(lat, lon)
+    cached = soil_cache.get_cell(cell)
+    if cached is not None:
+        return cached[0], cached[1], "cache"
+    try:
+        nitrogen, ph = _fetch_soil_cell(cell, lat, lon)
+    except Exception:
+        metrics.error("soilgrids")
+        nearby = soil_cache.nearby(lat, lon)
+        if nearby is None:
+            raise
+        metrics.fallback("soil_nearby")
+        return nearby[0], nearby[1], "nearby"
+    return nitrogen, ph, "soilgrids"
+
+
+def get_soil_n_and_ph(lat: float, lon: float) -> tuple[float, float]:
+    nitrogen, ph, _ = lookup_soil(lat, lon)
+    return nitrogen, ph
+
+
+async def _fetch_soil_cell_async(client, cell: str, lat: float, lon: float) -> tuple[float, float]:
+    start = time.perf_counter()
+    try:
+        r = await client.get(SOILGRIDS_BASE_URL, params=soilgrids_params(lat, lon))
+        r.raise_for_status()
+        nitrogen, ph = parse_soilgrids(r.json())
+    finally:
+        latencies.record("soilgrids", time.perf_counter() - start)
+    soil_cache.put_many([(cell, nitrogen, ph)])
+    return nitrogen, ph
+
+
+async def lookup_soil_async(client, lat: float, lon: float) -> tuple[float, float, str]:
+    """lookup_soil for the ASGI app: same cache and fallback, fetched with an httpx.AsyncClient
+
+    Concurrent misses for the same cell await one shared task.
+    """
+    cell = soil_cache.key(lat, lon)
+    cached = soil_cache.get_cell(cell)
+    if cached is not None:
+        return cached[0], cached[1], "cache"
+    task = _soil_tasks.get(cell)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_soil_cell_async(client, cell, lat, lon))
+        _soil_tasks[cell] = task
+        task.add_done_callback(lambda _: _soil_tasks.pop(cell, None))
+    try:
+        # shield: a cancelled request must not cancel a fetch other requests are awaiting
+        nitrogen, ph = await asyncio.shield(task)
+    except Exception:
+        metrics.error("soilgrids")
+        nearby = soil_cache.nearby(lat, lon)
+        if nearby is None:
+            raise
+        metrics.fallback("soil_nearby")
+        return nearby[0], nearby[1], "nearby"
+    return nitrogen, ph, "soilgrids"
+
+
+def fetch_openweather(lat: float, lon: float) -> tuple[float, float, float]:
+    params = {"lat": lat, "lon": lon, "appid": OPENWEATHER_API_KEY, "units": "metric"}
+    r = timed_get("openweather", OPENWEATHER_BASE_URL, params=params)
+    r.raise_for_status()
+    data = r.json()
+    temperature = float(data.get("main", {}).get("temp", 0))
+    humidity = float(data.get("main", {}).get("humidity", 0))
+    rain_block = data.get("rain", {}) or {}
+    rainfall = float(rain_block.get("1h") or rain_block.get("3h") or 0)
+    return temperature, humidity, rainfall
+
+
+def fetch_conditions(lat: float, lon: float) -> tuple[tuple[float, float], tuple[float, float, float]]:
+    """Fetch soil and weather concurrently; wall time is the slower of the two, not their sum"""
+    soil = _executor.submit(get_soil_n_and_ph, lat, lon)
+    weather = _executor.submit(fetch_openweather, lat, lon)
+    return soil.result(), weather.result()
+
+
+def call_model_predict(N: float, temperature: float, humidity: float, ph: float, rainfall: float) -> str:
+    payload = {
+        "N": N,
+        "temperature": temperature,
+        "humidity": humidity,
+        "ph": ph,
+        "rainfall": rainfall,
+    }
+    start = time.perf_counter()
+    try:
+        r = get_session().post(MODEL_PREDICT_URL, json=payload, timeout=UPSTREAM_TIMEOUT)
+    finally:
+        latencies.record("model", time.perf_counter() - start)
+    r.raise_for_status()
+    data = r.json()
+    return str(data.get("predicted_crop", "Unknown"))